@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Book, Tag
+from .models import Book, CatalogChange, CatalogSnapshot, FacetCount, Tag
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -10,4 +10,23 @@ class BookAdmin(admin.ModelAdmin):
     list_display = ("id", "title", "author", "book_type", "created_at")
     list_filter = ("book_type", "genre", "tags")
     search_fields = ("title", "author", "genre")
-    filter_horizontal = ("tags",)
\ No newline at end of file
+    filter_horizontal = ("tags",)
+
+@admin.register(FacetCount)
+class FacetCountAdmin(admin.ModelAdmin):
+    list_display = ("kind", "value", "count")
+    list_filter = ("kind",)
+    search_fields = ("value",)
+    readonly_fields = ("kind", "value", "count")
+
+@admin.register(CatalogSnapshot)
+class CatalogSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("token", "books_count", "size_bytes", "created_at")
+    readonly_fields = ("token", "file_key", "books_count", "size_bytes", "created_at")
+
+@admin.register(CatalogChange)
+class CatalogChangeAdmin(admin.ModelAdmin):
+    list_display = ("id", "book_id", "deleted", "changed_at")
+    list_filter = ("deleted",)
+    search_fields = ("book_id",)
+    readonly_fields = ("book_id", "deleted", "changed_at")
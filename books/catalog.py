@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+
+try:
+    import brotli
+except ImportError:  # opcional: sem brotli serve gzip
+    brotli = None
+
+
+# =========================================================
+# Versão do catálogo: muda quando Book/Tag/Rating mudam (ver signals).
+# Token aleatório (não contador): se a key for despejada, nunca volta a uma versão antiga.
+# =========================================================
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def catalog_version() -> str:
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY) or version
+    return version
+
+
+def _set_new_version():
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def bump_catalog_version() -> None:
+    # já e de novo após o commit (um pedido no meio da transação pode ter guardado dados antigos)
+    _set_new_version()
+    transaction.on_commit(_set_new_version)
+
+
+# =========================================================
+# Resposta inteira em cache (corpo + gzip/br + ETag): JSON do catálogo, HTML da home
+# =========================================================
+def _encode_bodies(body: bytes) -> dict:
+    bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=6, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=9)
+    return bodies
+
+
+def _pick_encoding(request, bodies: dict) -> str:
+    accept = request.headers.get("Accept-Encoding", "")
+    accepted = {part.split(";")[0].strip().lower() for part in accept.split(",")}
+    for encoding in ("br", "gzip"):
+        if encoding in accepted and encoding in bodies:
+            return encoding
+    return "identity"
+
+
+def _json_body(payload) -> bytes:
+    return json.dumps(payload, cls=DjangoJSONEncoder).encode("utf-8")
+
+
+def _build_entry(version: str, build, encode, content_type: str):
+    status, payload = build()
+    if status != 200:
+        return None, status, payload
+    body = encode(payload)
+    entry = {
+        "version": version,
+        "etag": '"%s"' % hashlib.md5(body).hexdigest(),
+        "content_type": content_type,
+        "bodies": _encode_bodies(body),
+    }
+    return entry, status, payload
+
+
+def _wait_for(key: str, version: str):
+    # outro pedido está a reconstruir: espera um pouco pelo resultado
+    deadline = time.monotonic() + settings.CATALOG_CACHE_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry and entry.get("version") == version:
+            return entry
+    return None
+
+
+def cached_json(request, name: str, build, ttl: int):
+    """
+    Serve `build() -> (status, payload)` a partir da cache enquanto a versão do
+    catálogo não mudar. Caso normal: 1 leitura de cache (versão + entrada num get_many).
+    Misses simultâneos: só um pedido reconstrói (lock com cache.add), os outros esperam.
+    Só respostas 200 vão para a cache.
+    """
+    return _cached_response(request, f"catalogresp:v1:{name}", build, ttl, _json_body, "application/json")
+
+
+def cached_page(request, name: str, build, ttl: int):
+    """
+    Igual a cached_json para HTML: `build() -> (200, html)`.
+    """
+    return _cached_response(
+        request, f"catalogpage:v1:{name}", build, ttl,
+        lambda html: html.encode("utf-8"), "text/html; charset=utf-8",
+    )
+
+
+def _cached_response(request, key: str, build, ttl: int, encode, content_type: str):
+    found = cache.get_many([CATALOG_VERSION_KEY, key])
+    version = found.get(CATALOG_VERSION_KEY) or catalog_version()
+    entry = found.get(key)
+
+    if not entry or entry.get("version") != version:
+        lock_key = f"{key}:lock"
+        entry = None
+        if cache.add(lock_key, 1, settings.CATALOG_CACHE_WAIT_SECONDS + 5):
+            try:
+                entry, status, payload = _build_entry(version, build, encode, content_type)
+                if entry is None:
+                    return _plain_response(payload, status)
+                cache.set(key, entry, ttl)
+            finally:
+                cache.delete(lock_key)
+        else:
+            entry = _wait_for(key, version)
+            if entry is None:
+                entry, status, payload = _build_entry(version, build, encode, content_type)
+                if entry is None:
+                    return _plain_response(payload, status)
+
+    return _entry_response(request, entry)
+
+
+def _plain_response(payload, status: int):
+    return HttpResponse(
+        json.dumps(payload, cls=DjangoJSONEncoder), status=status, content_type="application/json"
+    )
+
+
+def _entry_response(request, entry: dict):
+    etag = entry["etag"]
+    if etag in [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]:
+        resp = HttpResponseNotModified()
+    else:
+        encoding = _pick_encoding(request, entry["bodies"])
+        resp = HttpResponse(entry["bodies"][encoding], content_type=entry.get("content_type", "application/json"))
+        if encoding != "identity":
+            resp["Content-Encoding"] = encoding
+
+    resp["ETag"] = etag
+    resp["Vary"] = "Accept-Encoding"
+    # igual para todos os users: o browser revalida com If-None-Match (304 sem corpo)
+    resp["Cache-Control"] = "public, no-cache"
+    return resp
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+
+import numpy as np
+from django.db import connections
+
+from .catalog import catalog_version
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Índice do catálogo em memória (por worker), em colunas NumPy:
+# filtros por tipo/tag/género + ordenação + paginação sem ir ao DB.
+# - arrays contíguos: com `gunicorn --preload` carregado antes do fork e
+#   partilhado copy-on-write (poucos objetos Python = refcounts não sujam páginas)
+# - reconstruído quando a versão do catálogo muda (ver catalog.py)
+# O DB só é usado para ler as linhas da página pedida (por PK).
+# =========================================================
+BOOK_TYPES = ("free", "premium")
+# ordem -> chaves (coluna, descendente), da principal para o desempate; "id" = ordem do catálogo (-id)
+SORTS = {
+    "id": (("ids", True),),
+    "recentes": (("created", True),),
+    "antigos": (("created", False),),
+    "titulo": (("title_rank", False),),
+    "avaliacao": (("avg_rating", True), ("rating_count", True)),
+    "leitores": (("readers", True),),
+    # "Tendência" da home: leitores + média e nº de avaliações (sem os leitores ativos,
+    # que vivem na cache e mudam a cada minuto)
+    "tendencia": (("trend", True),),
+}
+TREND_RATING_WEIGHT = 18.0
+TREND_COUNT_WEIGHT = 0.4
+
+
+class CatalogIndex:
+    __slots__ = (
+        "version", "size", "ids", "created", "title_rank", "type_code",
+        "genre_code", "genres", "avg_rating", "rating_count", "readers", "trend", "tag_ptr", "tag_rows", "tags", "orders",
+    )
+
+    def __init__(self, version: str):
+        self.version = version
+
+        rows = list(
+            Book.objects.order_by("-id").values_list(
+                "id", "created_at", "title", "book_type", "genre",
+                "stats__rating_sum", "stats__rating_count", "stats__readers_count",
+            )
+        )
+        n = self.size = len(rows)
+        self.ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        self.created = np.fromiter((r[1].timestamp() if r[1] else 0.0 for r in rows), dtype=np.float64, count=n)
+
+        titles = [(r[2] or "").casefold() for r in rows]
+        title_rank = np.empty(n, dtype=np.int32)
+        title_rank[sorted(range(n), key=titles.__getitem__)] = np.arange(n, dtype=np.int32)
+        self.title_rank = title_rank
+
+        self.type_code = np.fromiter(
+            (BOOK_TYPES.index(r[3]) if r[3] in BOOK_TYPES else 0 for r in rows), dtype=np.int8, count=n
+        )
+        genres = {}
+        self.genre_code = np.fromiter(
+            (genres.setdefault((r[4] or "").strip().casefold(), len(genres)) for r in rows), dtype=np.int32, count=n
+        )
+        self.genres = genres
+
+        rating_sum = np.fromiter((r[5] or 0 for r in rows), dtype=np.float64, count=n)
+        self.rating_count = np.fromiter((r[6] or 0 for r in rows), dtype=np.float64, count=n)
+        self.avg_rating = np.divide(rating_sum, self.rating_count, out=np.zeros(n), where=self.rating_count > 0)
+        self.readers = np.fromiter((r[7] or 0 for r in rows), dtype=np.int64, count=n)
+        self.trend = self.readers + TREND_RATING_WEIGHT * self.avg_rating + TREND_COUNT_WEIGHT * self.rating_count
+        del rows, titles
+
+        # tags em CSR: linhas (posições) do livro da tag i = tag_rows[tag_ptr[i]:tag_ptr[i+1]]
+        pos = {book_id: i for i, book_id in enumerate(self.ids.tolist())}
+        by_tag = {}
+        for name, book_id in Book.tags.through.objects.values_list("tag__name", "book_id"):
+            if book_id in pos:
+                by_tag.setdefault(name.casefold(), []).append(pos[book_id])
+        self.tags = {name: i for i, name in enumerate(by_tag)}
+        self.tag_ptr = np.zeros(len(by_tag) + 1, dtype=np.int64)
+        self.tag_ptr[1:] = np.cumsum([len(v) for v in by_tag.values()], dtype=np.int64)
+        self.tag_rows = np.fromiter(
+            (p for rows_ in by_tag.values() for p in sorted(rows_)), dtype=np.int64, count=int(self.tag_ptr[-1])
+        )
+
+        # ordens pré-calculadas (estáveis; empate -> id maior primeiro, como o catálogo)
+        self.orders = {}
+        for sort, keys in SORTS.items():
+            # lexsort: última chave = principal
+            columns = [-getattr(self, c) if desc else getattr(self, c) for c, desc in reversed(keys)]
+            self.orders[sort] = np.lexsort([np.arange(n)] + columns)
+
+    def _mask(self, book_type: str = "", tag: str = "", genre: str = ""):
+        mask = None
+        if book_type:
+            code = BOOK_TYPES.index(book_type) if book_type in BOOK_TYPES else -1
+            mask = self.type_code == code
+        if genre:
+            code = self.genres.get(genre.strip().casefold(), -1)
+            m = self.genre_code == code
+            mask = m if mask is None else mask & m
+        if tag:
+            i = self.tags.get(tag.strip().casefold())
+            m = np.zeros(self.size, dtype=bool)
+            if i is not None:
+                m[self.tag_rows[self.tag_ptr[i]:self.tag_ptr[i + 1]]] = True
+            mask = m if mask is None else mask & m
+        return mask
+
+    def _positions(self, book_ids):
+        # ids -> posições no índice (ids guardados por ordem -id: pesquisa binária);
+        # ids que o índice não conhece saem
+        wanted = np.asarray(book_ids, dtype=np.int64)
+        pos = np.searchsorted(-self.ids, -wanted)
+        pos = np.minimum(pos, max(self.size - 1, 0))
+        found = self.ids[pos] == wanted if self.size else np.zeros(len(wanted), dtype=bool)
+        return pos[found]
+
+    def query(self, book_type: str = "", tag: str = "", genre: str = "", sort: str = "id",
+              offset: int = 0, limit: int = 60, before_id=None, only_ids=None):
+        """
+        -> (ids da página, total que cumpre os filtros, offset seguinte | None no fim)
+        `before_id`: cursor por id (só com sort="id"); senão `offset`.
+        `only_ids`: resultado de uma pesquisa, por ordem de relevância; sort="relevancia"
+        mantém essa ordem, as outras ordens só ficam restritas a esses livros.
+        """
+        mask = self._mask(book_type, tag, genre)
+        if only_ids is not None and sort == "relevancia":
+            order = self._positions(only_ids)
+        else:
+            order = self.orders[sort]
+            if only_ids is not None:
+                keep = np.zeros(self.size, dtype=bool)
+                keep[self._positions(only_ids)] = True
+                mask = keep if mask is None else mask & keep
+        if mask is not None:
+            order = order[mask[order]]
+        total = len(order)
+        if before_id is not None and sort == "id":
+            # ordem -id: a posição do cursor sai por pesquisa binária
+            offset = int(np.searchsorted(-self.ids[order], -int(before_id), side="right"))
+        page = order[offset:offset + limit]
+        next_offset = offset + len(page)
+        return self.ids[page].tolist(), total, (next_offset if next_offset < total else None)
+
+
+# =========================================================
+# Instância do processo
+# =========================================================
+_index = None
+_lock = threading.Lock()
+
+
+def load_index():
+    global _index
+    # versão lida ANTES dos dados: o índice nunca é mais antigo que a versão que leva
+    _index = CatalogIndex(catalog_version())
+    return _index
+
+
+def get_index():
+    """
+    Índice da versão atual do catálogo (reconstruído se a versão mudou).
+    Quem chama guarda o resultado em cache sob a versão que leu antes (cached_json/
+    cached_page): um índice antigo deixaria a página velha em cache com a versão nova.
+    Só corre nos misses da cache, que já acontecem 1x por versão.
+    """
+    global _index
+    version = catalog_version()
+    idx = _index
+    if idx is not None and idx.version == version:
+        return idx
+
+    with _lock:
+        # outro thread pode ter reconstruído enquanto esperávamos
+        if _index is None or _index.version != version:
+            _index = CatalogIndex(version)
+        return _index
+
+
+def preload() -> None:
+    """
+    Chamado no wsgi.py (antes do fork com --preload). Falha = carrega no 1º pedido.
+    """
+    try:
+        started = time.monotonic()
+        idx = load_index()
+        logger.info("Índice do catálogo: %s livros em %.2fs", idx.size, time.monotonic() - started)
+    except Exception:
+        logger.exception("Falha a pré-carregar o índice do catálogo.")
+    finally:
+        # ligações abertas antes do fork não podem ser partilhadas pelos workers
+        connections.close_all()
@@ -0,0 +1,145 @@
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .media import public_storage
+from .models import CatalogChange, CatalogSnapshot
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Feed de alterações do catálogo: /api/books/changes/?since=<token>
+# - cada save/delete de um livro (ou das suas tags) acrescenta um CatalogChange;
+#   o token é o id da última alteração que o cliente já aplicou
+# - arranque a frio: snapshot JSON no storage público (job publish_catalog_snapshot)
+#   e depois ?since=<token do snapshot>
+# - só o registo depois do snapshot mais antigo guardado é mantido: tokens mais
+#   antigos recebem 410 e voltam ao snapshot
+# =========================================================
+
+
+def _insert_changes(book_ids, deleted: bool) -> None:
+    CatalogChange.objects.bulk_create(
+        [CatalogChange(book_id=book_id, deleted=deleted) for book_id in book_ids], batch_size=500
+    )
+    # a versão muda de novo só agora: uma resposta do feed montada entre o commit e
+    # este insert ficaria em cache sem a alteração
+    bump_catalog_version()
+
+
+def record_changes(book_ids, deleted: bool = False) -> None:
+    """
+    Regista alterações depois do commit: transações desfeitas não deixam rasto e
+    os ids (tokens) são atribuídos já pela ordem em que as alterações ficam visíveis.
+    """
+    book_ids = sorted({int(i) for i in book_ids if i})
+    if book_ids:
+        transaction.on_commit(lambda: _insert_changes(book_ids, deleted))
+
+
+def latest_token() -> int:
+    last = CatalogChange.objects.aggregate(m=Max("id"))["m"] or 0
+    snapshot = CatalogSnapshot.objects.aggregate(m=Max("token"))["m"] or 0
+    return max(last, snapshot)
+
+
+def oldest_valid_token() -> int:
+    # o registo anterior ao snapshot mais antigo já foi apagado (ver prune_changes)
+    oldest = CatalogSnapshot.objects.order_by("token").values_list("token", flat=True).first()
+    return oldest or 0
+
+
+def changes_since(since: int, limit: int):
+    """
+    -> (ids alterados, ids apagados, token seguinte, has_more)
+    Várias alterações do mesmo livro colapsam no estado final.
+    """
+    rows = list(
+        CatalogChange.objects.filter(id__gt=since).order_by("id")
+        .values_list("id", "book_id", "deleted")[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    state = {}
+    for _, book_id, deleted in rows:
+        state.pop(book_id, None)  # reinserido no fim: mantém a ordem da última alteração
+        state[book_id] = deleted
+    updated = [book_id for book_id, deleted in state.items() if not deleted]
+    removed = [book_id for book_id, deleted in state.items() if deleted]
+    token = rows[-1][0] if rows else since
+    return updated, removed, token, has_more
+
+
+def snapshot_info(snapshot):
+    if snapshot is None:
+        return None
+    return {
+        "token": str(snapshot.token),
+        "url": public_storage().url(snapshot.file_key),
+        "books_count": snapshot.books_count,
+        "size_bytes": snapshot.size_bytes,
+        "created_at": snapshot.created_at.isoformat(),
+    }
+
+
+def latest_snapshot():
+    return CatalogSnapshot.objects.first()
+
+
+# =========================================================
+# Snapshot (job em background)
+# =========================================================
+def publish_snapshot(build_rows):
+    """
+    Publica o catálogo inteiro: {"token": "...", "results": [...]}.
+    O token é lido ANTES dos livros: o que mudar durante a leitura volta a vir no feed
+    (reaplicar um livro é idempotente no cliente).
+    """
+    token = latest_token()
+    rows = build_rows()
+    body = json.dumps(
+        {"token": str(token), "generated_at": timezone.now(), "results": rows},
+        cls=DjangoJSONEncoder, separators=(",", ":"),
+    ).encode("utf-8")
+
+    # nome novo a cada publicação: cache imutável no CDN
+    key = public_storage().save(f"catalog/snapshots/{token}-{uuid.uuid4().hex[:8]}.json", ContentFile(body))
+    snapshot = CatalogSnapshot.objects.create(
+        token=token, file_key=key, books_count=len(rows), size_bytes=len(body)
+    )
+    prune_changes()
+    # respostas do feed em cache apontam para o snapshot anterior
+    bump_catalog_version()
+    return snapshot
+
+
+def prune_changes() -> int:
+    """
+    Guarda os CATALOG_SNAPSHOT_KEEP snapshots mais recentes e apaga o registo de
+    alterações anterior ao mais antigo deles. Devolve o nº de alterações apagadas.
+    """
+    keep = max(int(settings.CATALOG_SNAPSHOT_KEEP), 1)
+    old = list(CatalogSnapshot.objects.all()[keep:])
+    storage = public_storage()
+    for snapshot in old:
+        try:
+            storage.delete(snapshot.file_key)
+        except Exception:
+            logger.warning("Falha a apagar snapshot %s", snapshot.file_key, exc_info=True)
+    CatalogSnapshot.objects.filter(id__in=[s.id for s in old]).delete()
+
+    floor = oldest_valid_token()
+    if not floor:
+        return 0
+    # a linha do próprio token fica: no SQLite o próximo id é max(id)+1 e não pode recuar
+    deleted, _ = CatalogChange.objects.filter(id__lt=floor).delete()
+    return deleted
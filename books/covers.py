@@ -0,0 +1,149 @@
+import base64
+import hashlib
+import io
+import logging
+
+import pypdfium2 as pdfium
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from .media import public_storage
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Capas: versões WebP em várias larguras (srcset) + placeholder minúsculo (data URI).
+# Sem capa enviada: usa a 1ª página do PDF.
+# Guardado em Book.cover_variants:
+#   {"source": "<cover.name | pdf:pdf.name>", "widths": {"160": "covers/r/..."},
+#    "placeholder": "data:image/webp;base64,..."}
+# Nome muda com a origem (hash): cache imutável no CDN.
+# =========================================================
+COVER_WIDTHS = (160, 320, 640)
+COVER_QUALITY = 75
+PLACEHOLDER_WIDTH = 16
+# escala do render da 1ª página: largura ~= maior rendição
+_PDF_RENDER_WIDTH = COVER_WIDTHS[-1]
+
+
+def cover_source(book) -> str:
+    if book.cover and book.cover.name:
+        return book.cover.name
+    if book.pdf_file and book.pdf_file.name:
+        return f"pdf:{book.pdf_file.name}"
+    return ""
+
+
+def _load_source_image(book):
+    if book.cover and book.cover.name:
+        with book.cover.open("rb") as f:
+            img = Image.open(io.BytesIO(f.read()))
+            img.load()
+        return img
+
+    with book.pdf_file.open("rb") as f:
+        doc = pdfium.PdfDocument(f.read())
+    try:
+        page = doc[0]
+        scale = _PDF_RENDER_WIDTH / max(page.get_width(), 1)
+        return page.render(scale=scale).to_pil()
+    finally:
+        doc.close()
+
+
+def _webp(img, width: int, quality: int = COVER_QUALITY) -> bytes:
+    height = max(1, round(img.height * width / img.width))
+    out = img.resize((width, height), Image.LANCZOS)
+    buf = io.BytesIO()
+    out.save(buf, format="WEBP", quality=quality, method=6)
+    return buf.getvalue()
+
+
+def build_cover_variants(book) -> dict:
+    """
+    Gera e grava as rendições da capa; devolve o dict para Book.cover_variants
+    ({} sem capa nem PDF).
+    """
+    source = cover_source(book)
+    if not source:
+        return {}
+
+    img = _load_source_image(book)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+    storage = public_storage()
+    digest = hashlib.sha1(source.encode()).hexdigest()[:12]
+    # nunca amplia: larguras acima do original ficam de fora (fica pelo menos a menor)
+    widths = [w for w in COVER_WIDTHS if w <= img.width] or [min(img.width, COVER_WIDTHS[0])]
+
+    names = {}
+    for width in widths:
+        name = storage.save(f"covers/r/{book.pk}/{digest}-{width}.webp", ContentFile(_webp(img, width)))
+        names[str(width)] = name
+
+    placeholder = _webp(img, PLACEHOLDER_WIDTH, quality=30)
+    return {
+        "source": source,
+        "widths": names,
+        "placeholder": "data:image/webp;base64," + base64.b64encode(placeholder).decode("ascii"),
+    }
+
+
+def _delete_files(names) -> None:
+    storage = public_storage()
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.warning("Falha a apagar rendição de capa %s", name, exc_info=True)
+
+
+def refresh_cover_variants(book_id: int, force: bool = False) -> bool:
+    """
+    Reconstrói as rendições se a origem (capa/PDF) mudou. Devolve True se mudou algo.
+    """
+    book = Book.objects.filter(pk=book_id).only("id", "cover", "pdf_file", "cover_variants").first()
+    if book is None:
+        return False
+
+    old = book.cover_variants or {}
+    if not force and old.get("source", "") == cover_source(book):
+        return False
+
+    try:
+        variants = build_cover_variants(book)
+    except Exception:
+        # capa/PDF ilegível: fica sem rendições (o catálogo usa a capa original);
+        # guarda a origem para não voltar a tentar em cada save
+        logger.exception("Falha a gerar rendições da capa do livro %s", book_id)
+        variants = {"source": cover_source(book)}
+
+    if variants == old:
+        return False
+    # update(): não volta a disparar os signals do Book
+    Book.objects.filter(pk=book_id).update(cover_variants=variants)
+    new_names = set(variants.get("widths", {}).values())
+    _delete_files([n for n in old.get("widths", {}).values() if n not in new_names])
+    return True
+
+
+# =========================================================
+# Leitura (catálogo / templates)
+# __dict__: com .only() sem cover_variants não dispara query
+# =========================================================
+def _widths(book) -> dict:
+    return (book.__dict__.get("cover_variants") or {}).get("widths") or {}
+
+
+def cover_srcset(book) -> str:
+    storage = public_storage()
+    return ", ".join(
+        f"{storage.url(name)} {w}w" for w, name in sorted(_widths(book).items(), key=lambda kv: int(kv[0]))
+    )
+
+
+def cover_placeholder(book) -> str:
+    return (book.__dict__.get("cover_variants") or {}).get("placeholder", "")
+
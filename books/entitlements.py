@@ -0,0 +1,115 @@
+import math
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import UserSubscription, BookShareUnlock
+
+
+# Snapshot por utilizador: validade do plano + livros desbloqueados por partilha.
+# Invalidado pelos signals de UserSubscription/BookShareUnlock (ver signals.py).
+ENTITLEMENTS_CACHE_TTL = 60 * 30
+
+# fração lida sem plano/partilha (prévia)
+PREVIEW_RATIO = {"premium": 0.10, "free": 0.05}
+
+
+def preview_until_page(book_type: str, total_pages: int) -> int:
+    """
+    Última página que qualquer visitante pode ler (mínimo 1).
+    Total desconhecido -> 0 (nada é tratado como prévia).
+    """
+    total = int(total_pages or 0)
+    if total <= 0:
+        return 0
+    ratio = PREVIEW_RATIO.get(book_type, PREVIEW_RATIO["free"])
+    return max(1, math.ceil(total * ratio))
+
+
+def _cache_key(user_id) -> str:
+    return f"entitlements:v1:user:{user_id}"
+
+
+class Entitlements:
+    """
+    Direitos de leitura de um utilizador, num formato barato de guardar em cache.
+    """
+    __slots__ = ("subscription_expires_at", "share_unlocked")
+
+    def __init__(self, subscription_expires_at=None, share_unlocked=()):
+        self.subscription_expires_at = subscription_expires_at
+        self.share_unlocked = frozenset(share_unlocked)
+
+    def has_active_subscription(self) -> bool:
+        # compara com "agora" na hora: um plano expira sem precisar invalidar cache
+        return bool(self.subscription_expires_at and self.subscription_expires_at > timezone.now())
+
+    def has_share_unlock(self, book_id) -> bool:
+        return int(book_id) in self.share_unlocked
+
+    def to_cache(self) -> dict:
+        return {
+            "subscription_expires_at": self.subscription_expires_at,
+            "share_unlocked": sorted(self.share_unlocked),
+        }
+
+    @classmethod
+    def from_cache(cls, data: dict) -> "Entitlements":
+        return cls(
+            subscription_expires_at=data.get("subscription_expires_at"),
+            share_unlocked=data.get("share_unlocked") or (),
+        )
+
+
+ANONYMOUS = Entitlements()
+
+
+def _load_entitlements(user_id) -> Entitlements:
+    expires_at = (
+        UserSubscription.objects.filter(user_id=user_id)
+        .aggregate(m=Max("expires_at"))["m"]
+    )
+    unlocked = BookShareUnlock.objects.filter(user_id=user_id).values_list("book_id", flat=True)
+    return Entitlements(subscription_expires_at=expires_at, share_unlocked=unlocked)
+
+
+def get_entitlements(user) -> Entitlements:
+    """
+    Devolve o snapshot de direitos do user (1 leitura de cache no caso normal).
+    Anónimo -> sem direitos.
+    """
+    if not user or not user.is_authenticated:
+        return ANONYMOUS
+
+    key = _cache_key(user.pk)
+    data = cache.get(key)
+    if data is not None:
+        return Entitlements.from_cache(data)
+
+    ent = _load_entitlements(user.pk)
+    cache.set(key, ent.to_cache(), ENTITLEMENTS_CACHE_TTL)
+    return ent
+
+
+async def aget_entitlements(user) -> Entitlements:
+    """
+    get_entitlements para views async: cache pelo aget; o miss (2 queries, raro
+    com o TTL de 30 min) corre numa thread.
+    """
+    if not user or not user.is_authenticated:
+        return ANONYMOUS
+
+    key = _cache_key(user.pk)
+    data = await cache.aget(key)
+    if data is not None:
+        return Entitlements.from_cache(data)
+
+    ent = await sync_to_async(_load_entitlements)(user.pk)
+    await cache.aset(key, ent.to_cache(), ENTITLEMENTS_CACHE_TTL)
+    return ent
+
+
+def invalidate_entitlements(user_id) -> None:
+    cache.delete(_cache_key(user_id))
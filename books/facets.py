@@ -0,0 +1,64 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Book, FacetCount
+
+TAG, GENRE, BOOK_TYPE = FacetCount.Kind.TAG, FacetCount.Kind.GENRE, FacetCount.Kind.BOOK_TYPE
+
+
+def genre_value(genre) -> str:
+    return (genre or "").strip()
+
+
+def compute_facets() -> Counter:
+    """
+    Contagens reais (GROUP BY) — backfill e reconcile. {(kind, value): count}
+    """
+    out = Counter()
+    for r in Book.objects.values("genre").annotate(c=Count("id")):
+        out[(GENRE, genre_value(r["genre"]))] += r["c"]
+    for r in Book.objects.values("book_type").annotate(c=Count("id")):
+        out[(BOOK_TYPE, r["book_type"] or "")] += r["c"]
+    for r in Book.tags.through.objects.values("tag__name").annotate(c=Count("id")):
+        out[(TAG, r["tag__name"])] += r["c"]
+    return out
+
+
+def _apply(kind: str, value: str, delta: int) -> int:
+    return FacetCount.objects.filter(kind=kind, value=value).update(count=Greatest(F("count") + delta, 0))
+
+
+def bump_facets(deltas) -> None:
+    """
+    Soma deltas {(kind, value): n} às contagens (UPDATE com F(), sem ler antes).
+    Linha em falta e delta positivo: cria (com o valor real, que já inclui a alteração).
+    """
+    for (kind, value), delta in deltas.items():
+        if not delta or _apply(kind, value, delta) or delta < 0:
+            continue
+        # 1ª vez que o valor aparece (raro): GROUP BY completo
+        real = compute_facets().get((kind, value), 0)
+        try:
+            with transaction.atomic():
+                FacetCount.objects.create(kind=kind, value=value, count=real)
+        except IntegrityError:
+            # outro pedido criou a linha entretanto
+            _apply(kind, value, delta)
+
+
+def rename_tag(old: str, new: str) -> None:
+    FacetCount.objects.filter(kind=TAG, value=old).update(value=new)
+
+
+def facet_counts() -> dict:
+    """
+    {"genre": [{"value", "count"}], "tag": [...], "book_type": [...]} — maior contagem primeiro.
+    """
+    out = {kind: [] for kind in FacetCount.Kind.values}
+    rows = FacetCount.objects.filter(count__gt=0).order_by("kind", "-count", "value")
+    for kind, value, count in rows.values_list("kind", "value", "count"):
+        out[kind].append({"value": value, "count": count})
+    return out
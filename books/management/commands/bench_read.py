@@ -0,0 +1,89 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from books.models import BookPage
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o débito do leitor contra um servidor a correr: "
+        "N pedidos concorrentes às páginas de um livro, com sessão de um user. "
+        "Arrancar o servidor com THROTTLE_ENABLED=0 para não medir o rate limit. "
+        "Correr contra SERVER_MODE=wsgi e SERVER_MODE=asgi para comparar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--user", required=True, help="Username (sessão criada na DB local).")
+        parser.add_argument("--book", type=int, required=True)
+        parser.add_argument("--endpoint", choices=["read", "bundle", "comments", "annotations", "progress", "me"], default="read")
+        parser.add_argument("--concurrency", default="1,4,16,64", help="Níveis, ex: 1,4,16,64")
+        parser.add_argument("--requests", type=int, default=400, help="Pedidos por nível.")
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options["user"]).first()
+        if user is None:
+            raise CommandError("User não existe.")
+
+        pages = list(
+            BookPage.objects.filter(book_id=options["book"]).order_by("page_number")
+            .values_list("page_number", flat=True)
+        ) or [1]
+
+        # mesma sessão que um login real (sem passar pelo axes)
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        base = options["base_url"].rstrip("/")
+        book_id = options["book"]
+        paths = {
+            "read": lambda p: f"/api/read/{book_id}/{p}/",
+            "bundle": lambda p: f"/api/read/{book_id}/{p}/bundle/",
+            "comments": lambda p: f"/api/books/{book_id}/comments/?page={p}",
+            "annotations": lambda p: f"/api/books/{book_id}/annotations/?page={p}",
+            "progress": lambda p: "/api/progress/me/",
+            "me": lambda p: "/api/auth/me/",
+        }[options["endpoint"]]
+        urls = [base + paths(pages[i % len(pages)]) for i in range(options["requests"])]
+
+        self.stdout.write(f"{options['endpoint']}: {len(urls)} pedidos por nível, {base}")
+        for level in [int(x) for x in options["concurrency"].split(",") if x.strip()]:
+            self._run_level(level, urls, cookie)
+
+    def _run_level(self, level: int, urls, cookie: str):
+        def fetch(url):
+            req = urllib.request.Request(url, headers={"Cookie": cookie})
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=60) as resp:
+                    resp.read()
+                    status = resp.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except Exception:
+                status = "erro"
+            return status, time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            results = list(pool.map(fetch, urls))
+        elapsed = time.perf_counter() - t0
+
+        lat = sorted(d for _, d in results)
+        p95 = lat[int(len(lat) * 0.95) - 1] if len(lat) > 1 else lat[0]
+        statuses = Counter(s for s, _ in results)
+        self.stdout.write(
+            f"  c={level:<4} {len(urls) / elapsed:8.1f} req/s   "
+            f"p50 {statistics.median(lat) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms   "
+            f"{dict(statuses)}"
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from books.catalog import bump_catalog_version
+from books.covers import refresh_cover_variants
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as rendições WebP das capas (srcset + placeholder); livros sem capa usam a 1ª página do PDF. "
+        "Por omissão só os que ainda não têm rendições da origem atual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--book", type=int, help="Só este livro (id).")
+        parser.add_argument("--force", action="store_true", help="Regenera mesmo que a origem não tenha mudado.")
+
+    def handle(self, *args, **options):
+        book_ids = Book.objects.order_by("id").values_list("id", flat=True)
+        if options.get("book"):
+            book_ids = book_ids.filter(id=options["book"])
+
+        changed = 0
+        for book_id in book_ids.iterator():
+            if refresh_cover_variants(book_id, force=options["force"]):
+                changed += 1
+                self.stdout.write(f"livro {book_id}: rendições atualizadas")
+
+        if changed:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"{changed} livros atualizados."))
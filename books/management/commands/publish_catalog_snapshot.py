@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books.changes import latest_snapshot, latest_token, publish_snapshot
+from books.views import CATALOG_CHANGES_FIELDS, catalog_queryset, catalog_rows
+
+
+def _snapshot_rows():
+    fields = list(CATALOG_CHANGES_FIELDS)
+    return catalog_rows(fields, catalog_queryset(fields).iterator(chunk_size=2000))
+
+
+class Command(BaseCommand):
+    help = (
+        "Publica o catálogo inteiro (JSON no storage público) para o arranque a frio do feed "
+        "/api/books/changes/ e apaga o registo de alterações já coberto pelos snapshots guardados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Repete a cada CATALOG_SNAPSHOT_SECONDS (processo em background).",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Publica mesmo sem alterações desde o último snapshot.",
+        )
+
+    def handle(self, *args, **options):
+        every = settings.CATALOG_SNAPSHOT_SECONDS if options["loop"] else 0
+        while True:
+            started = time.monotonic()
+            try:
+                last = latest_snapshot()
+                if not options["force"] and last is not None and last.token == latest_token():
+                    self.stdout.write(f"Sem alterações desde o snapshot {last.token}.")
+                else:
+                    snapshot = publish_snapshot(_snapshot_rows)
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Snapshot {snapshot.token}: {snapshot.books_count} livros, "
+                        f"{snapshot.size_bytes // 1024} KB ({time.monotonic() - started:.2f}s)."
+                    ))
+            except Exception as exc:
+                if not every:
+                    raise
+                # em loop: uma falha (ex: DB em restart) não mata o job
+                self.stderr.write(f"Falha a publicar o snapshot do catálogo: {exc}")
+            if not every:
+                return
+            time.sleep(max(every - (time.monotonic() - started), 1))
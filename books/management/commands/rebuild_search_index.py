@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books import search
+
+
+class Command(BaseCommand):
+    help = (
+        "(Re)constrói o índice de pesquisa do catálogo (Postgres: search_vector; "
+        "SQLite: tabela FTS5). Normalmente só é preciso após a migração ou alterações fora do ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--missing", action="store_true", help="Só livros ainda sem índice.")
+
+    def handle(self, *args, **options):
+        kind = search.backend()
+        if kind == "like":
+            self.stdout.write("Backend sem índice de pesquisa (usa icontains). Nada a fazer.")
+            return
+
+        book_ids = search.unindexed_book_ids() if options["missing"] else None
+        if book_ids == []:
+            self.stdout.write(self.style.SUCCESS("Índice de pesquisa já está completo."))
+            return
+
+        with transaction.atomic():
+            n = search.index_books(book_ids)
+        self.stdout.write(self.style.SUCCESS(f"{n} livros indexados ({kind})."))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books.catalog import bump_catalog_version
+from books.facets import compute_facets
+from books.models import FacetCount
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula as contagens por tag/género/tipo (FacetCount) e corrige desvios "
+        "(ex: bulk_create/update() de livros, que não disparam signals)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Só mostra o que mudaria.")
+
+    def handle(self, *args, **options):
+        real = compute_facets()
+        current = {(f.kind, f.value): f for f in FacetCount.objects.all()}
+
+        to_create, to_update, to_delete = [], [], []
+        for key, count in real.items():
+            row = current.get(key)
+            if row is None:
+                to_create.append(FacetCount(kind=key[0], value=key[1], count=count))
+                self.stdout.write(f"{key[0]}:{key[1]}: sem linha -> {count}")
+            elif row.count != count:
+                self.stdout.write(f"{key[0]}:{key[1]}: {row.count}->{count}")
+                row.count = count
+                to_update.append(row)
+        for key, row in current.items():
+            if key not in real:
+                self.stdout.write(f"{key[0]}:{key[1]}: já não existe")
+                to_delete.append(row.pk)
+
+        if not options["dry_run"]:
+            with transaction.atomic():
+                FacetCount.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+                FacetCount.objects.bulk_update(to_update, ["count"], batch_size=500)
+                FacetCount.objects.filter(pk__in=to_delete).delete()
+            if to_create or to_update or to_delete:
+                bump_catalog_version()
+
+        prefix = "[dry-run] " if options["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{len(to_create)} criadas, {len(to_update)} corrigidas, {len(to_delete)} removidas."
+        ))
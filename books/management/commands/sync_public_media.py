@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.models import Book
+from books.public_media import sync_public_media
+
+
+class Command(BaseCommand):
+    help = (
+        "Move páginas de prévia e capas para o prefixo público (CDN) e páginas bloqueadas "
+        "de volta para o privado. Corre sozinho ao mudar book_type/total_pages (signal) e no "
+        "arranque (start.sh, ex: ao ativar AWS_S3_CUSTOM_DOMAIN). Sem CDN configurado, torna tudo privado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--book", type=int, help="Só este livro (id).")
+        parser.add_argument("--dry-run", action="store_true", help="Só mostra o que mudaria.")
+
+    def handle(self, *args, **options):
+        books = Book.objects.all().order_by("id")
+        if options.get("book"):
+            books = books.filter(id=options["book"])
+
+        try:
+            moved, covers = sync_public_media(books, dry_run=options["dry_run"], log=self.stdout.write)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Páginas movidas: {moved} • capas publicadas: {covers}"))
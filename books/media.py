@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.files.storage import default_storage, storages
+
+
+def public_storage():
+    """
+    Storage do prefixo público (capas + páginas de prévia, sem assinatura).
+    Sem CDN configurado (ex: local) cai no default_storage.
+    """
+    if "public" in settings.STORAGES:
+        return storages["public"]
+    return default_storage
+
+
+def use_public_media() -> bool:
+    return bool(getattr(settings, "USE_PUBLIC_MEDIA", False))
+
+
+def cover_url(book) -> str:
+    try:
+        if getattr(book, "cover", None) and book.cover.name:
+            return book.cover.url
+    except Exception:
+        pass
+    # sem capa enviada: rendição da 1ª página do PDF (ver covers.py)
+    widths = (book.__dict__.get("cover_variants") or {}).get("widths") or {}
+    if widths:
+        return public_storage().url(widths[max(widths, key=int)])
+    return ""
+
+
+def page_storage(is_public: bool = False):
+    return public_storage() if is_public else default_storage
+
+
+def page_image_url(image_key: str, is_public: bool = False) -> str:
+    """
+    Página de prévia -> URL pública (CDN, cacheável);
+    página bloqueada -> URL assinada do storage privado.
+    """
+    return page_storage(is_public).url(image_key)
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-19 10:54
+
+import books.media
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_alter_bookannotation_page_number_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookpage',
+            name='is_public',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='cover',
+            field=models.ImageField(blank=True, null=True, storage=books.media.public_storage, upload_to='covers/'),
+        ),
+    ]
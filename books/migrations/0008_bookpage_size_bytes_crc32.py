@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_bookpage_is_public_alter_book_cover'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookpage',
+            name='crc32',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bookpage',
+            name='size_bytes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:10
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_facets(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    FacetCount = apps.get_model("books", "FacetCount")
+
+    counts = Counter()
+    for r in Book.objects.values("genre").annotate(c=Count("id")):
+        counts[("genre", (r["genre"] or "").strip())] += r["c"]
+    for r in Book.objects.values("book_type").annotate(c=Count("id")):
+        counts[("book_type", r["book_type"] or "")] += r["c"]
+    for r in Book.tags.through.objects.values("tag__name").annotate(c=Count("id")):
+        counts[("tag", r["tag__name"])] += r["c"]
+
+    FacetCount.objects.bulk_create(
+        [FacetCount(kind=k, value=v, count=c) for (k, v), c in counts.items()], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('tag', 'Tag'), ('genre', 'Género'), ('book_type', 'Tipo')], max_length=10)),
+                ('value', models.CharField(max_length=80)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('kind', 'value')},
+            },
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 
+from .media import public_storage
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=40, unique=True)
@@ -30,16 +33,69 @@ class Book(models.Model):
     total_pages = models.PositiveIntegerField(null=True, blank=True)
 
     # upload_to NÃO leva "media/"
-    cover = models.ImageField(upload_to="covers/", blank=True, null=True)
+    # capa vai para o prefixo público (CDN, sem URL assinada)
+    cover = models.ImageField(upload_to="covers/", storage=public_storage, blank=True, null=True)
     pdf_file = models.FileField(upload_to="pdfs/", blank=True, null=True)
+    # rendições WebP da capa (srcset) + placeholder, geradas no save (ver covers.py)
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     tags = models.ManyToManyField(Tag, blank=True, related_name="books")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # pesquisa (Postgres): tsvector com pesos, mantido por books.search (índice GIN na migração)
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
     def __str__(self):
         return self.title
 
 
+# Nº de livros por tag / género / tipo, mantido incrementalmente (ver facets.py):
+# a página de categorias lê isto em vez de GROUP BY sobre Book e a tabela M2M.
+class FacetCount(models.Model):
+    class Kind(models.TextChoices):
+        TAG = "tag", "Tag"
+        GENRE = "genre", "Género"
+        BOOK_TYPE = "book_type", "Tipo"
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    value = models.CharField(max_length=80)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("kind", "value")
+
+    def __str__(self):
+        return f"{self.kind}:{self.value} ({self.count})"
+
+
+# Registo de alterações do catálogo (ver changes.py): o id é o token monotónico do
+# feed /api/books/changes/?since=<id>. Sem FK: a linha de um livro apagado fica (tombstone).
+class CatalogChange(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    book_id = models.PositiveIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.id} book {self.book_id}{' (apagado)' if self.deleted else ''}"
+
+
+# Catálogo inteiro publicado no storage público (arranque a frio dos clientes);
+# `token` = último CatalogChange incluído (o cliente continua com ?since=token).
+class CatalogSnapshot(models.Model):
+    token = models.BigIntegerField(db_index=True)
+    file_key = models.CharField(max_length=300)
+    books_count = models.PositiveIntegerField(default=0)
+    size_bytes = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("-token", "-id")
+
+    def __str__(self):
+        return f"snapshot {self.token} ({self.books_count} livros)"
+
+
 # =========================================================
 # PÁGINAS CONVERTIDAS (PDF → IMAGENS)
 # =========================================================
@@ -52,6 +108,11 @@ class BookPage(models.Model):
 
     page_number = models.PositiveIntegerField()
     image_key = models.CharField(max_length=500)  # guarda a KEY do B2 (não URL assinada)
+    # True -> página de prévia no prefixo público (image_key relativa ao storage "public")
+    is_public = models.BooleanField(default=False)
+    # tamanho/CRC do ficheiro -> ZIP offline com layout conhecido (HTTP Range)
+    size_bytes = models.PositiveIntegerField(null=True, blank=True)
+    crc32 = models.PositiveBigIntegerField(null=True, blank=True)
     width = models.PositiveIntegerField(default=0)
     height = models.PositiveIntegerField(default=0)
 
@@ -0,0 +1,222 @@
+# =========================================================
+# ZIP "stored" (sem compressão: as páginas já são WEBP) gerado em streaming.
+# Com tamanho e CRC de cada ficheiro conhecidos à partida, o layout é
+# determinístico: dá para calcular o Content-Length e servir qualquer
+# intervalo (HTTP Range) sem montar o arquivo em memória.
+# Ficheiros sem tamanho/CRC conhecido (páginas antigas): zip_stream, com
+# data descriptor, mede-os enquanto passam (sem Content-Length nem Range).
+# =========================================================
+import struct
+import zlib
+
+from storages.utils import clean_name
+
+CHUNK_SIZE = 64 * 1024
+
+# 1980-01-01 00:00 (data DOS fixa -> bytes iguais entre pedidos)
+_DOS_TIME = 0
+_DOS_DATE = (1 << 5) | 1
+_FLAG_UTF8 = 1 << 11
+_FLAG_DESCRIPTOR = 1 << 3   # tamanho/CRC depois dos dados
+_ZIP_MAX = 0xFFFFFFFF
+
+
+class ZipMember:
+    """
+    Um ficheiro do ZIP. `data` (bytes) para conteúdo gerado na hora;
+    `opener(offset)` -> iterável de bytes a partir de `offset` para conteúdo em storage.
+    size/crc None = desconhecidos (só zip_stream; medidos ao passar).
+    """
+    __slots__ = ("name", "size", "crc", "data", "opener")
+
+    def __init__(self, name: str, size: int, crc: int, data: bytes = None, opener=None):
+        self.name = name
+        self.size = None if size is None else int(size)
+        self.crc = None if crc is None else int(crc) & 0xFFFFFFFF
+        self.data = data
+        self.opener = opener
+
+    @property
+    def measured(self) -> bool:
+        return self.size is not None and self.crc is not None
+
+    @classmethod
+    def from_bytes(cls, name: str, data: bytes) -> "ZipMember":
+        return cls(name, len(data), zlib.crc32(data), data=data)
+
+
+def _local_header(m: ZipMember, deferred: bool = False) -> bytes:
+    name = m.name.encode("utf-8")
+    flags = _FLAG_UTF8 | (_FLAG_DESCRIPTOR if deferred else 0)
+    crc, size = (0, 0) if deferred else (m.crc, m.size)
+    return struct.pack(
+        "<IHHHHHIIIHH",
+        0x04034B50, 20, flags, 0, _DOS_TIME, _DOS_DATE,
+        crc, size, size, len(name), 0,
+    ) + name
+
+
+def _central_header(m: ZipMember, offset: int, deferred: bool = False) -> bytes:
+    name = m.name.encode("utf-8")
+    flags = _FLAG_UTF8 | (_FLAG_DESCRIPTOR if deferred else 0)
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014B50, 20, 20, flags, 0, _DOS_TIME, _DOS_DATE,
+        m.crc, m.size, m.size, len(name), 0, 0, 0, 0, 0, offset,
+    ) + name
+
+
+def _end_of_central(count: int, cd_size: int, cd_offset: int) -> bytes:
+    if cd_offset + cd_size > _ZIP_MAX:
+        raise ValueError("Arquivo maior que 4 GB (ZIP64 não suportado).")
+    return struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0)
+
+
+def zip_layout(members):
+    """
+    Devolve (segments, total). Cada segmento: (start, length, bytes | ZipMember).
+    """
+    segments = []
+    central = []
+    pos = 0
+
+    for m in members:
+        header = _local_header(m)
+        central.append(_central_header(m, pos))
+        segments.append((pos, len(header), header))
+        pos += len(header)
+        segments.append((pos, m.size, m))
+        pos += m.size
+
+    cd = b"".join(central)
+    eocd = _end_of_central(len(members), len(cd), pos)
+    segments.append((pos, len(cd) + len(eocd), cd + eocd))
+    return segments, pos + len(cd) + len(eocd)
+
+
+def zip_stream(members, on_measured=None):
+    """
+    ZIP inteiro quando há ficheiros com size/crc desconhecidos: esses levam data
+    descriptor e são medidos enquanto passam. Sem layout prévio (nem Content-Length/Range).
+    `on_measured(members)`: chamado antes do diretório central, já com tudo medido.
+    """
+    central = []
+    pos = 0
+    for m in members:
+        deferred = not m.measured
+        header = _local_header(m, deferred)
+        central.append((m, pos, deferred))
+        yield header
+        pos += len(header)
+
+        if m.data is not None:
+            chunks = (m.data,)
+        else:
+            chunks = m.opener(0)
+        size = crc = 0
+        for chunk in chunks:
+            if chunk:
+                size += len(chunk)
+                crc = zlib.crc32(chunk, crc)
+                yield chunk
+        pos += size
+
+        if deferred:
+            m.size, m.crc = size, crc
+            descriptor = struct.pack("<IIII", 0x08074B50, crc, size, size)
+            yield descriptor
+            pos += len(descriptor)
+        elif size != m.size:
+            raise IOError(f"{m.name}: tamanho diferente do esperado.")
+
+    if on_measured is not None:
+        on_measured(members)
+
+    cd = b"".join(_central_header(m, offset, deferred) for m, offset, deferred in central)
+    yield cd + _end_of_central(len(members), len(cd), pos)
+
+
+def iter_range(segments, start: int, end: int):
+    """
+    Bytes [start, end] (inclusive) do ZIP, abrindo só os ficheiros necessários.
+    """
+    for seg_start, length, payload in segments:
+        seg_end = seg_start + length - 1
+        if length == 0 or seg_end < start or seg_start > end:
+            continue
+
+        lo = max(start, seg_start) - seg_start
+        hi = min(end, seg_end) - seg_start + 1
+
+        if isinstance(payload, bytes):
+            yield payload[lo:hi]
+            continue
+
+        if payload.data is not None:
+            yield payload.data[lo:hi]
+            continue
+
+        remaining = hi - lo
+        for chunk in payload.opener(lo):
+            if not chunk:
+                continue
+            if len(chunk) >= remaining:
+                yield chunk[:remaining]
+                remaining = 0
+                break
+            yield chunk
+            remaining -= len(chunk)
+        if remaining:
+            raise IOError(f"{payload.name}: ficheiro mais curto que o esperado.")
+
+
+def parse_range(header: str, total: int):
+    """
+    "bytes=a-b" | "bytes=a-" | "bytes=-n" -> (start, end).
+    None = sem Range (ou múltiplos intervalos: serve tudo); "invalid" = 416.
+    """
+    header = (header or "").strip()
+    if not header.startswith("bytes=") or "," in header:
+        return None
+
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first == "":
+            n = int(last)
+            if n <= 0:
+                return "invalid"
+            return max(0, total - n), total - 1
+        start = int(first)
+        end = int(last) if last else total - 1
+    except ValueError:
+        return None
+
+    if start >= total or end < start:
+        return "invalid"
+    return start, min(end, total - 1)
+
+
+def storage_stream(storage, name: str, offset: int = 0):
+    """
+    Lê um objeto do storage em blocos a partir de `offset`.
+    S3/B2: GET com Range (não descarrega o objeto todo para disco).
+    """
+    bucket = getattr(storage, "bucket", None)
+    if bucket is not None:
+        key = storage._normalize_name(clean_name(name))
+        kwargs = {"Range": f"bytes={offset}-"} if offset else {}
+        body = bucket.Object(key).get(**kwargs)["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+        return
+
+    with storage.open(name, "rb") as f:
+        f.seek(offset)
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
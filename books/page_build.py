@@ -1,9 +1,12 @@
 import io
+import zlib
 from django.conf import settings
 from django.db import transaction
 import boto3
 import pypdfium2 as pdfium
 
+from .entitlements import preview_until_page
+from .media import use_public_media
 from .models import Book, BookPage
 
 
@@ -27,12 +30,20 @@ def _key_prefix() -> str:
     return f"{location}/" if location else ""
 
 
-def _render_pdf_pages(pdf_bytes: bytes, scale: float = 2.0, quality: int = 80):
+def _public_key_prefix() -> str:
+    # prefixo exposto pelo CDN (AWS_PUBLIC_LOCATION="public" => "public/")
+    location = (getattr(settings, "AWS_PUBLIC_LOCATION", "") or "").strip("/")
+    return f"{location}/" if location else ""
+
+
+def _page_name(book_id: int, page_number: int) -> str:
+    return f"pages/{book_id}/{page_number:04d}.webp"
+
+
+def _render_pdf_pages(doc, scale: float = 2.0, quality: int = 80):
     """
     Yields: (page_number, webp_bytes, width, height)
     """
-    doc = pdfium.PdfDocument(pdf_bytes)
-
     for i in range(len(doc)):
         page = doc[i]
         bitmap = page.render(scale=scale)
@@ -68,27 +79,51 @@ def build_pages_if_missing(book: Book) -> int:
     if not bucket:
         raise ValueError("AWS_STORAGE_BUCKET_NAME não definido.")
 
+    doc = pdfium.PdfDocument(pdf_bytes)
+
+    # páginas de prévia (lidas por qualquer visitante) vão para o prefixo público
+    preview_until = 0
+    if use_public_media():
+        preview_until = preview_until_page(str(book.book_type or "free"), len(doc))
+
     prefix = _key_prefix()
+    public_prefix = _public_key_prefix()
     created = 0
 
     with transaction.atomic():
-        for page_number, webp_bytes, w, h in _render_pdf_pages(pdf_bytes, scale=2.0, quality=80):
-            key = f"{prefix}pages/{book.id}/{page_number:04d}.webp"
-
-            s3.put_object(
-                Bucket=bucket,
-                Key=key,
-                Body=webp_bytes,
-                ContentType="image/webp",
-                ACL="private",
-            )
+        for page_number, webp_bytes, w, h in _render_pdf_pages(doc, scale=2.0, quality=80):
+            name = _page_name(book.id, page_number)
+            is_public = page_number <= preview_until
+
+            if is_public:
+                # image_key relativa ao storage "public" (URL sem assinatura)
+                key = name
+                s3.put_object(
+                    Bucket=bucket,
+                    Key=f"{public_prefix}{name}",
+                    Body=webp_bytes,
+                    ContentType="image/webp",
+                    CacheControl=settings.PUBLIC_MEDIA_CACHE_CONTROL,
+                )
+            else:
+                key = f"{prefix}{name}"
+                s3.put_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Body=webp_bytes,
+                    ContentType="image/webp",
+                    ACL="private",
+                )
 
             BookPage.objects.create(
                 book=book,
                 page_number=page_number,
                 image_key=key,
+                is_public=is_public,
                 width=w,
                 height=h,
+                size_bytes=len(webp_bytes),
+                crc32=zlib.crc32(webp_bytes),
             )
             created += 1
 
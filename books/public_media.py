@@ -0,0 +1,120 @@
+import logging
+import mimetypes
+
+from django.conf import settings
+
+from .entitlements import preview_until_page
+from .media import public_storage, use_public_media
+from .models import Book, BookPage
+from .page_build import _bucket, _key_prefix, _public_key_prefix, _s3_client
+
+logger = logging.getLogger(__name__)
+
+
+# =========================================================
+# Páginas de prévia e capas no prefixo público (CDN); páginas bloqueadas no privado.
+# Corre sozinho quando book_type/total_pages mudam (signals.py) e no arranque
+# (start.sh: ex. AWS_S3_CUSTOM_DOMAIN ativado); à mão com `manage.py sync_public_media`.
+# =========================================================
+def sync_public_media(books, dry_run: bool = False, log=None):
+    """
+    Sincroniza `books` (iterável de Book). `log(msg)`: uma linha por objeto movido.
+    -> (páginas movidas, capas publicadas)
+    """
+    bucket = _bucket()
+    if not bucket:
+        raise ValueError("AWS_STORAGE_BUCKET_NAME não definido.")
+    ctx = {
+        "s3": _s3_client(),
+        "bucket": bucket,
+        "dry_run": dry_run,
+        "log": log or (lambda msg: None),
+        "private_prefix": _key_prefix(),
+        "public_prefix": _public_key_prefix(),
+    }
+    moved = covers = 0
+    for book in books:
+        moved += _sync_pages(ctx, book)
+        covers += _sync_cover(ctx, book)
+    return moved, covers
+
+
+def sync_book_media(book_id: int) -> None:
+    # chamado pelo signal depois do commit: falha fica no log (o arranque seguinte volta a tentar)
+    if not _bucket():
+        return
+    try:
+        moved, _ = sync_public_media(Book.objects.filter(id=book_id))
+    except Exception:
+        logger.exception("Falha ao sincronizar media pública do livro %s.", book_id)
+        return
+    if moved:
+        logger.info("Livro %s: %s páginas mudaram de prefixo.", book_id, moved)
+
+
+def _move(ctx, src: str, dst: str, public: bool):
+    if ctx["dry_run"]:
+        return
+    extra = {"CacheControl": settings.PUBLIC_MEDIA_CACHE_CONTROL} if public else {}
+    ctx["s3"].copy_object(
+        Bucket=ctx["bucket"],
+        Key=dst,
+        CopySource={"Bucket": ctx["bucket"], "Key": src},
+        MetadataDirective="REPLACE",
+        ContentType="image/webp",
+        **extra,
+    )
+    # apagar a origem: uma página bloqueada não pode continuar no prefixo público
+    ctx["s3"].delete_object(Bucket=ctx["bucket"], Key=src)
+
+
+def _sync_pages(ctx, book: Book) -> int:
+    preview_until = 0
+    if use_public_media():
+        preview_until = preview_until_page(str(book.book_type or "free"), book.total_pages)
+
+    private_prefix, public_prefix = ctx["private_prefix"], ctx["public_prefix"]
+    moved = 0
+    for page in BookPage.objects.filter(book=book).order_by("page_number"):
+        want_public = page.page_number <= preview_until
+        if want_public == page.is_public:
+            continue
+
+        if want_public:
+            # key privada (com prefixo AWS_LOCATION) -> nome relativo ao storage público
+            name = page.image_key
+            if private_prefix and name.startswith(private_prefix):
+                name = name[len(private_prefix):]
+            _move(ctx, page.image_key, f"{public_prefix}{name}", public=True)
+            new_key = name
+        else:
+            new_key = f"{private_prefix}{page.image_key}"
+            _move(ctx, f"{public_prefix}{page.image_key}", new_key, public=False)
+
+        ctx["log"](f"  livro {book.id} p{page.page_number}: {'público' if want_public else 'privado'}")
+        if not ctx["dry_run"]:
+            BookPage.objects.filter(pk=page.pk).update(image_key=new_key, is_public=want_public)
+        moved += 1
+    return moved
+
+
+def _sync_cover(ctx, book: Book) -> int:
+    # capas antigas foram gravadas no storage privado; o campo agora aponta para o público
+    if not use_public_media() or not book.cover or not book.cover.name:
+        return 0
+
+    name = book.cover.name
+    if public_storage().exists(name):
+        return 0
+
+    ctx["log"](f"  livro {book.id} capa: {name}")
+    if not ctx["dry_run"]:
+        ctx["s3"].copy_object(
+            Bucket=ctx["bucket"],
+            Key=f"{ctx['public_prefix']}{name}",
+            CopySource={"Bucket": ctx["bucket"], "Key": f"{ctx['private_prefix']}{name}"},
+            MetadataDirective="REPLACE",
+            ContentType=mimetypes.guess_type(name)[0] or "application/octet-stream",
+            CacheControl=settings.PUBLIC_MEDIA_CACHE_CONTROL,
+        )
+    return 1
@@ -0,0 +1,251 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Q, Value
+
+from .models import Book, Tag
+
+# =========================================================
+# Pesquisa de livros com ranking.
+# - Postgres: coluna Book.search_vector (tsvector com pesos) + índice GIN
+# - SQLite (local): tabela virtual FTS5 books_book_fts
+# - outro backend: icontains (sem ranking)
+# Índice atualizado pelos signals do Book/tags (ver signals.py).
+# =========================================================
+FTS_TABLE = "books_book_fts"
+
+# A = título, B = autor, C = género + tags, D = descrição
+_WEIGHTS = (("title", "A"), ("author", "B"), ("genre", "C"), ("tags", "C"), ("description", "D"))
+# bm25 do FTS5, pela ordem das colunas
+_FTS_BM25 = "bm25(books_book_fts, 10.0, 5.0, 2.0, 2.0, 1.0)"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _config() -> str:
+    return getattr(settings, "SEARCH_CONFIG", "portuguese")
+
+
+# DB (NAME) -> backend: a introspeção de tabelas custa uma query, não vai em cada pesquisa
+_backends = {}
+
+
+def backend() -> str:
+    name = str(connection.settings_dict.get("NAME"))
+    kind = _backends.get(name)
+    if kind is not None:
+        return kind
+
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        kind = "postgres"
+    elif vendor == "sqlite":
+        if FTS_TABLE not in connection.introspection.table_names():
+            # migração 0009 ainda não correu: volta a verificar no próximo pedido
+            return "like"
+        kind = "fts5"
+    else:
+        kind = "like"
+    _backends[name] = kind
+    return kind
+
+
+def _documents(book_ids=None):
+    """
+    [(id, {title, author, genre, tags, description})] com as tags juntas num texto.
+    """
+    qs = Book.objects.order_by("id").prefetch_related("tags").only(
+        "id", "title", "author", "genre", "description"
+    )
+    if book_ids is not None:
+        qs = qs.filter(id__in=book_ids)
+    for b in qs.iterator(chunk_size=500):
+        yield b.id, {
+            "title": b.title or "",
+            "author": b.author or "",
+            "genre": b.genre or "",
+            "tags": " ".join(t.name for t in b.tags.all()),
+            "description": b.description or "",
+        }
+
+
+def index_books(book_ids=None) -> int:
+    """
+    (Re)indexa os livros indicados (None = todos). Devolve o nº indexado.
+    """
+    kind = backend()
+    n = 0
+    for book_id, doc in _documents(book_ids):
+        if kind == "postgres":
+            vector = None
+            for field, weight in _WEIGHTS:
+                part = SearchVector(Value(doc[field]), weight=weight, config=_config())
+                vector = part if vector is None else vector + part
+            Book.objects.filter(pk=book_id).update(search_vector=vector)
+        elif kind == "fts5":
+            with connection.cursor() as cur:
+                cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+                cur.execute(
+                    f"INSERT INTO {FTS_TABLE} (rowid, title, author, genre, tags, description) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    [book_id] + [doc[f] for f, _ in _WEIGHTS],
+                )
+        n += 1
+    return n
+
+
+def unindexed_book_ids():
+    kind = backend()
+    if kind == "postgres":
+        return list(Book.objects.filter(search_vector__isnull=True).values_list("id", flat=True))
+    if kind == "fts5":
+        with connection.cursor() as cur:
+            cur.execute(f"SELECT rowid FROM {FTS_TABLE}")
+            indexed = {row[0] for row in cur.fetchall()}
+        return [i for i in Book.objects.values_list("id", flat=True) if i not in indexed]
+    return []
+
+
+def remove_from_index(book_id: int) -> None:
+    # Postgres: a coluna vai com a linha
+    if backend() == "fts5":
+        with connection.cursor() as cur:
+            cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def _fts_match(q: str) -> str:
+    # cada palavra entre aspas (sem sintaxe FTS do utilizador) + prefixo
+    words = _WORD_RE.findall(q)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def search_books(qs, q: str):
+    """
+    Filtra `qs` pelo texto `q`, ordenado por relevância (order_by posterior substitui).
+    """
+    q = (q or "").strip()
+    if not q:
+        return qs
+
+    kind = backend()
+    if kind == "postgres":
+        query = SearchQuery(q, config=_config(), search_type="websearch")
+        return (
+            qs.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "-id")
+        )
+
+    if kind == "fts5":
+        match = _fts_match(q)
+        if not match:
+            return qs.none()
+        # JOIN com a tabela FTS numa só query (count/first/slices continuam no SQL)
+        return qs.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {Book._meta.db_table}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+            select={"rank": _FTS_BM25},
+            order_by=["rank"],
+        )
+
+    return qs.filter(
+        Q(title__icontains=q) |
+        Q(author__icontains=q) |
+        Q(genre__icontains=q) |
+        Q(description__icontains=q)
+    )
+
+
+SEARCH_MAX_CHARS = 100
+
+
+def normalize_query(q) -> str:
+    # mesma pesquisa escrita de outra forma -> mesma entrada de cache
+    return " ".join((q or "").lower().split())[:SEARCH_MAX_CHARS]
+
+
+def search_ids(q: str, limit: int) -> list:
+    """
+    Ids dos `limit` livros mais relevantes para `q` (por ordem de relevância).
+    Filtros/ordem/paginação do catálogo aplicam-se depois no índice em memória.
+    """
+    qs = search_books(Book.objects.all(), q)
+    if backend() == "like":
+        qs = qs.order_by("-id")
+    return list(qs.values_list("id", flat=True)[:limit])
+
+
+# =========================================================
+# Sugestões (typeahead): prefixo por palavra em título/autor + nome de tag.
+# Usa o mesmo índice (GIN/FTS5); sem ORDER BY no SQL (rank por bm25/ts_rank
+# em prefixos curtos percorre milhares de linhas): vão SUGGEST_CANDIDATES
+# candidatos e ordena-se aqui (começa pelo texto > mais curto).
+# =========================================================
+SUGGEST_MIN_CHARS = 2
+SUGGEST_MAX_CHARS = 64
+SUGGEST_CANDIDATES = 50
+SUGGEST_LIMITS = {"book": 6, "author": 3, "tag": 3}
+
+# coluna -> peso no search_vector (Postgres)
+_SUGGEST_WEIGHT = {"title": "A", "author": "B"}
+
+
+def normalize_prefix(q: str) -> str:
+    return " ".join((q or "").lower().split())[:SUGGEST_MAX_CHARS]
+
+
+def _prefix_ids(column: str, words, kind: str):
+    if kind == "postgres":
+        weight = _SUGGEST_WEIGHT[column]
+        raw = " & ".join(f"{w}:*{weight}" for w in words)
+        query = SearchQuery(raw, config=_config(), search_type="raw")
+        return list(Book.objects.filter(search_vector=query).values_list("id", flat=True)[:SUGGEST_CANDIDATES])
+
+    terms = " ".join(f'"{w}"*' for w in words)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s",
+            [f"{column} : ({terms})", SUGGEST_CANDIDATES],
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def _prefix_rank(prefix: str):
+    def key(text: str):
+        low = text.lower()
+        return (not low.startswith(prefix), len(low), low)
+    return key
+
+
+def suggest(q: str) -> list:
+    """
+    [{"type": "book", "id", "title", "author"} | {"type": "author"|"tag", "value"}]
+    para um prefixo já normalizado (normalize_prefix).
+    """
+    words = _WORD_RE.findall(q)
+    if len(q) < SUGGEST_MIN_CHARS or not words:
+        return []
+
+    rank = _prefix_rank(q)
+    kind = backend()
+    if kind == "like":
+        title_qs = Book.objects.filter(title__istartswith=q)[:SUGGEST_CANDIDATES]
+        author_qs = Book.objects.filter(author__istartswith=q)[:SUGGEST_CANDIDATES]
+    else:
+        title_qs = Book.objects.filter(id__in=_prefix_ids("title", words, kind))
+        author_qs = Book.objects.filter(id__in=_prefix_ids("author", words, kind))
+
+    books = sorted(title_qs.values("id", "title", "author"), key=lambda b: rank(b["title"] or ""))
+    authors = sorted({a for a in author_qs.values_list("author", flat=True) if a}, key=rank)
+    tags = sorted(
+        Tag.objects.filter(name__istartswith=q).values_list("name", flat=True)[:SUGGEST_CANDIDATES],
+        key=rank,
+    )
+
+    out = [{"type": "book", **b} for b in books[:SUGGEST_LIMITS["book"]]]
+    out += [{"type": "author", "value": a} for a in authors[:SUGGEST_LIMITS["author"]]]
+    out += [{"type": "tag", "value": t} for t in tags[:SUGGEST_LIMITS["tag"]]]
+    return out
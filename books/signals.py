@@ -0,0 +1,241 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .changes import record_changes
+from .covers import cover_source, refresh_cover_variants
+from .entitlements import invalidate_entitlements
+from .facets import BOOK_TYPE, GENRE, TAG, bump_facets, genre_value, rename_tag
+from .models import Book, FacetCount, Tag, UserSubscription, BookShareUnlock
+from .search import index_books, remove_from_index
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+@receiver(post_save, sender=BookShareUnlock)
+@receiver(post_delete, sender=BookShareUnlock)
+def _entitlements_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    # apaga já e de novo após o commit (evita re-cache de dados antigos no meio da transação)
+    invalidate_entitlements(user_id)
+    transaction.on_commit(lambda: invalidate_entitlements(user_id))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Book.tags.through)
+def _catalog_changed(sender, **kwargs):
+    # respostas do catálogo em cache deixam de valer
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Book)
+def _search_index_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def _search_unindex_book(sender, instance, **kwargs):
+    remove_from_index(instance.pk)
+
+
+@receiver(m2m_changed, sender=Book.tags.through)
+def _search_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            index_books([instance.pk])
+        return
+    # lado da Tag (tag.books.add/remove/clear): pk_set são livros; no clear vem vazio
+    if action == "pre_clear":
+        instance._search_book_ids = list(instance.books.values_list("id", flat=True))
+    elif action == "post_clear":
+        index_books(getattr(instance, "_search_book_ids", []))
+    elif action in ("post_add", "post_remove") and pk_set:
+        index_books(pk_set)
+
+
+@receiver(pre_delete, sender=Tag)
+def _search_tag_deleting(sender, instance, **kwargs):
+    instance._search_book_ids = list(instance.books.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def _search_tag_changed(sender, instance, created=False, raw=False, **kwargs):
+    # nome mudou ou tag apagada: os livros que a tinham têm outro texto de tags
+    if created or raw:
+        return
+    book_ids = getattr(instance, "_search_book_ids", None)
+    if book_ids is None:
+        book_ids = list(instance.books.values_list("id", flat=True))
+    if book_ids:
+        index_books(book_ids)
+
+
+# =========================================================
+# Contagens por tag / género / tipo (facets.py)
+# =========================================================
+@receiver(post_init, sender=Book)
+def _facets_book_loaded(sender, instance, **kwargs):
+    # __dict__: com .only()/defer() não dispara query
+    d = instance.__dict__
+    instance._facet_values = (d.get("genre"), d.get("book_type")) if instance.pk else None
+
+
+def _book_facets(genre, book_type):
+    return {(GENRE, genre_value(genre)), (BOOK_TYPE, book_type or "")}
+
+
+@receiver(post_save, sender=Book)
+def _facets_book_saved(sender, instance, created, **kwargs):
+    new = _book_facets(instance.genre, instance.book_type)
+    if created:
+        bump_facets(dict.fromkeys(new, 1))
+    else:
+        old_values = getattr(instance, "_facet_values", None)
+        if old_values and None not in old_values:
+            old = _book_facets(*old_values)
+            # sem valor anterior conhecido (instância montada à mão): o reconcile corrige
+            deltas = Counter(dict.fromkeys(new - old, 1))
+            deltas.update(dict.fromkeys(old - new, -1))
+            bump_facets(deltas)
+    instance._facet_values = (instance.genre, instance.book_type)
+
+
+@receiver(pre_delete, sender=Book)
+def _facets_book_deleting(sender, instance, **kwargs):
+    # as linhas M2M vão em cascata sem m2m_changed
+    instance._facet_tags = list(instance.tags.values_list("name", flat=True))
+
+
+@receiver(post_delete, sender=Book)
+def _facets_book_deleted(sender, instance, **kwargs):
+    deltas = dict.fromkeys(_book_facets(instance.genre, instance.book_type), -1)
+    deltas.update({(TAG, name): -1 for name in getattr(instance, "_facet_tags", [])})
+    bump_facets(deltas)
+
+
+@receiver(m2m_changed, sender=Book.tags.through)
+def _facets_tags_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action == "pre_clear":
+        if reverse:
+            instance._facet_clear = {(TAG, instance.name): -instance.books.count()}
+        else:
+            instance._facet_clear = {(TAG, name): -1 for name in instance.tags.values_list("name", flat=True)}
+    elif action == "post_clear":
+        bump_facets(getattr(instance, "_facet_clear", {}))
+    elif action in ("post_add", "post_remove") and pk_set:
+        # pk_set: só o que mudou de facto (add de uma tag já ligada não vem)
+        sign = 1 if action == "post_add" else -1
+        if reverse:
+            bump_facets({(TAG, instance.name): sign * len(pk_set)})
+        else:
+            names = model.objects.filter(pk__in=pk_set).values_list("name", flat=True)
+            bump_facets({(TAG, name): sign for name in names})
+
+
+@receiver(post_init, sender=Tag)
+def _facets_tag_loaded(sender, instance, **kwargs):
+    instance._facet_name = instance.__dict__.get("name") if instance.pk else None
+
+
+@receiver(post_save, sender=Tag)
+def _facets_tag_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, "_facet_name", None)
+    if not created and old and old != instance.name:
+        rename_tag(old, instance.name)
+    instance._facet_name = instance.name
+
+
+@receiver(post_delete, sender=Tag)
+def _facets_tag_deleted(sender, instance, **kwargs):
+    FacetCount.objects.filter(kind=TAG, value=instance.name).delete()
+
+
+# =========================================================
+# Rendições da capa (covers.py): depois do commit (ficheiro já no storage)
+# =========================================================
+@receiver(post_save, sender=Book)
+def _covers_book_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and not {"cover", "pdf_file"} & set(update_fields)):
+        return
+    if (instance.cover_variants or {}).get("source", "") == cover_source(instance):
+        return
+    book_id = instance.pk
+
+    def refresh():
+        if refresh_cover_variants(book_id):
+            bump_catalog_version()
+            record_changes([book_id])
+
+    transaction.on_commit(refresh)
+
+
+# =========================================================
+# Feed de alterações (changes.py): livros a reenviar aos clientes
+# =========================================================
+@receiver(post_save, sender=Book)
+def _changes_book_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_changes([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def _changes_book_deleted(sender, instance, **kwargs):
+    record_changes([instance.pk], deleted=True)
+
+
+@receiver(m2m_changed, sender=Book.tags.through)
+def _changes_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            record_changes([instance.pk])
+    elif action == "post_clear":
+        # ids guardados no pre_clear por _search_tags_changed
+        record_changes(getattr(instance, "_search_book_ids", []))
+    elif action in ("post_add", "post_remove") and pk_set:
+        record_changes(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def _changes_tag_changed(sender, instance, created=False, raw=False, **kwargs):
+    if created or raw:
+        return
+    # renomeada/apagada: os livros com a tag mudam (no delete, ids guardados por _search_tag_deleting)
+    book_ids = getattr(instance, "_search_book_ids", None)
+    if book_ids is None:
+        book_ids = instance.books.values_list("id", flat=True)
+    record_changes(book_ids)
+
+
+# =========================================================
+# Media pública (public_media.py): a prévia depende de book_type/total_pages
+# =========================================================
+@receiver(post_init, sender=Book)
+def _preview_book_loaded(sender, instance, **kwargs):
+    d = instance.__dict__
+    instance._preview_values = (d.get("book_type"), d.get("total_pages")) if instance.pk else None
+
+
+@receiver(post_save, sender=Book)
+def _preview_book_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    old = getattr(instance, "_preview_values", None)
+    new = (instance.book_type, instance.total_pages)
+    instance._preview_values = new
+    # livro novo ainda não tem páginas (page_build já as põe no prefixo certo)
+    if raw or created or old is None or None in old or old == new:
+        return
+    if update_fields and not {"book_type", "total_pages"} & set(update_fields):
+        return
+    # import tardio: public_media puxa o page_build (pypdfium2) só quando é preciso
+    from .public_media import sync_book_media
+
+    book_id = instance.pk
+    transaction.on_commit(lambda: sync_book_media(book_id))
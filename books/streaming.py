@@ -0,0 +1,109 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 500
+
+
+def _iter_json_array(items, serialize, chunk_size: int):
+    encoder = DjangoJSONEncoder()
+    if isinstance(items, QuerySet):
+        # lê do DB em blocos (cursor no servidor em Postgres): memória constante
+        items = items.iterator(chunk_size=chunk_size)
+
+    yield b"["
+    batch = []
+    first = True
+    try:
+        for item in items:
+            batch.append(encoder.encode(serialize(item) if serialize else item))
+            if len(batch) >= chunk_size:
+                yield (("" if first else ",") + ",".join(batch)).encode("utf-8")
+                first = False
+                batch = []
+        if batch:
+            yield (("" if first else ",") + ",".join(batch)).encode("utf-8")
+    except Exception:
+        # cabeçalhos já foram enviados: só resta cortar a resposta (JSON inválido = cliente vê erro)
+        logger.exception("Falha a meio de uma resposta JSON em streaming.")
+        raise
+    yield b"]"
+
+
+async def _aiter_json_array(items, serialize, chunk_size: int):
+    # = _iter_json_array para iteráveis async (views async em ASGI: sem thread a consumir)
+    encoder = DjangoJSONEncoder()
+    yield b"["
+    batch = []
+    first = True
+    try:
+        async for item in items:
+            batch.append(encoder.encode(serialize(item) if serialize else item))
+            if len(batch) >= chunk_size:
+                yield (("" if first else ",") + ",".join(batch)).encode("utf-8")
+                first = False
+                batch = []
+        if batch:
+            yield (("" if first else ",") + ",".join(batch)).encode("utf-8")
+    except Exception:
+        logger.exception("Falha a meio de uma resposta JSON em streaming.")
+        raise
+    yield b"]"
+
+
+async def _aiter_sync(iterator):
+    """
+    Iterador síncrono servido em ASGI bloco a bloco. Entregue tal como está, o Django
+    consumia-o com sync_to_async(list): a resposta toda em memória antes do 1º byte.
+    Cada next() corre na thread do pedido (thread_sensitive): o cursor/ligação do DB
+    e os ficheiros abertos pelo iterador ficam na mesma thread.
+    """
+    iterator = iter(iterator)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while True:
+            chunk = await next_chunk(iterator, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        # cliente desligou a meio: fecha o gerador (cursor do DB, body do S3)
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
+
+
+def streaming_content(iterator):
+    """
+    Conteúdo para um StreamingHttpResponse de uma view síncrona: em ASGI
+    (SERVER_MODE=asgi) passa a iterador async para continuar em streaming.
+    """
+    if settings.ASGI:
+        return _aiter_sync(iterator)
+    return iterator
+
+
+def stream_json_array(items, serialize=None, chunk_size: int = STREAM_CHUNK_SIZE, status: int = 200):
+    """
+    Resposta JSON (array) emitida elemento a elemento, em vez de montar a lista toda:
+    memória e tempo até ao 1º byte não crescem com o nº de linhas.
+    `items`: queryset (lido com .iterator(chunk_size)), qualquer iterável, ou um
+    iterável async (views async: ex. qs.aiterator(chunk_size));
+    `serialize(item) -> dict` opcional.
+    """
+    if not isinstance(items, QuerySet) and hasattr(items, "__aiter__"):
+        content = _aiter_json_array(items, serialize, chunk_size)
+    else:
+        content = streaming_content(_iter_json_array(items, serialize, chunk_size))
+    return StreamingHttpResponse(
+        content,
+        status=status,
+        content_type="application/json",
+    )
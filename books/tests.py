@@ -1,3 +1,794 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+import zlib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Value, When
+from django.db.models.functions import Cast, Coalesce, Lower
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+
+from reading.models import BookPopularity, BookStats, Rating
+
+from .entitlements import get_entitlements
+from .catalog import catalog_version
+from .changes import publish_snapshot
+from .facets import compute_facets
+from .catalog_index import SORTS as CATALOG_SORTS, TREND_COUNT_WEIGHT, TREND_RATING_WEIGHT, get_index as get_catalog_index
+from . import search
+from .models import Book, BookComment, BookPage, BookShareUnlock, FacetCount, Tag, UserSubscription
+from .streaming import _aiter_sync, stream_json_array
+
+# sem HTTPS nem collectstatic nos testes
+TEST_SETTINGS = override_settings(
+    SECURE_SSL_REDIRECT=False,
+    STORAGES={**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    THROTTLE_ENABLED=False,
+    READING_PROGRESS_FLUSH_SECONDS=0,
+    PAGE_WARM_MAX_PAGES=0,   # sem threads de aquecimento a mexer no DB de teste
+)
+
+
+class MediaTestCase(TestCase):
+    """Media num diretório temporário (páginas lidas do storage nos testes do ZIP)."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp()
+        cls._media = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._media.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._media.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def make_book(self, pages=4, book_type="free", measured=True, **fields):
+        # measured=False: páginas antigas, sem size_bytes/crc32 (as do page_build já os trazem)
+        book = Book.objects.create(title=fields.pop("title", "Livro"), book_type=book_type, total_pages=pages, **fields)
+        for n in range(1, pages + 1):
+            data = f"page-{n}".encode() * 50
+            key = default_storage.save(f"pages/{book.id}/{n:04d}.webp", ContentFile(data))
+            meta = {"size_bytes": len(data), "crc32": zlib.crc32(data)} if measured else {}
+            BookPage.objects.create(book=book, page_number=n, image_key=key, **meta)
+        return book
+
+
+@TEST_SETTINGS
+class StreamingTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user("leitor", password="x")
+        self.client.force_login(self.user)
+
+    def test_aiter_sync_pulls_one_chunk_at_a_time(self):
+        pulled = []
+
+        def chunks():
+            for i in range(3):
+                pulled.append(i)
+                yield b"x"
+
+        async def first():
+            it = _aiter_sync(chunks())
+            chunk = await it.__anext__()
+            await it.aclose()
+            return chunk
+
+        self.assertEqual(async_to_sync(first)(), b"x")
+        self.assertEqual(pulled, [0])
+
+    @override_settings(ASGI=True)
+    def test_asgi_stream_json_array_is_async(self):
+        resp = stream_json_array(iter([{"a": 1}, {"a": 2}]), chunk_size=1)
+        self.assertTrue(resp.is_async)
+
+        async def body():
+            return b"".join([c async for c in resp.streaming_content])
+
+        self.assertEqual(async_to_sync(body)(), b'[{"a": 1},{"a": 2}]')
+
+    @override_settings(ASGI=True)
+    def test_asgi_offline_zip_streams(self):
+        book = self.make_book(pages=3)
+        BookShareUnlock.objects.create(user=self.user, book=book)
+
+        async def fetch():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            resp = await client.get(f"/api/books/{book.id}/offline/")
+            content = b"".join([c async for c in resp.streaming_content])
+            return resp, content
+
+        resp, content = async_to_sync(fetch)()
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_async)
+        self.assertEqual(len(content), int(resp["Content-Length"]))
+        names = zipfile.ZipFile(io.BytesIO(content)).namelist()
+        self.assertEqual(names, ["manifest.json", "pages/0001.webp", "pages/0002.webp", "pages/0003.webp"])
+
+    @override_settings(ASGI=True)
+    def test_asgi_unmeasured_zip_saves_meta(self):
+        # gravar size/crc no fim do stream corre na thread do sync_to_async
+        book = self.make_book(pages=2, measured=False)
+        BookShareUnlock.objects.create(user=self.user, book=book)
+
+        async def fetch():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            resp = await client.get(f"/api/books/{book.id}/offline/")
+            return b"".join([c async for c in resp.streaming_content])
+
+        content = async_to_sync(fetch)()
+        self.assertIsNone(zipfile.ZipFile(io.BytesIO(content)).testzip())
+        self.assertFalse(BookPage.objects.filter(book=book, crc32__isnull=True).exists())
+
+
+@TEST_SETTINGS
+class CatalogIndexParityTests(TestCase):
+    """O índice em memória tem de filtrar/ordenar exatamente como o ORM."""
+
+    @classmethod
+    def setUpTestData(cls):
+        genres = ["Drama", "drama ", "Romance", "", "Terror"]
+        titles = ["beta", "Alfa", "gama", "alfa", "Delta", "epsilon"]
+        tag_a = Tag.objects.create(name="Classicos")
+        tag_b = Tag.objects.create(name="Curtos")
+        base = timezone.now()
+        for i in range(30):
+            book = Book.objects.create(
+                title=f"{titles[i % len(titles)]} {i % 4}",
+                book_type="premium" if i % 3 == 0 else "free",
+                genre=genres[i % len(genres)],
+                total_pages=10,
+            )
+            # datas repetidas de propósito: o desempate (id maior primeiro) tem de bater certo
+            Book.objects.filter(id=book.id).update(created_at=base - timedelta(days=i % 7))
+            if i % 2 == 0:
+                book.tags.add(tag_a)
+            if i % 5 == 0:
+                book.tags.add(tag_b)
+            if i % 4:
+                BookStats.objects.create(
+                    book=book, rating_sum=(i * 7) % 23, rating_count=(i % 5), readers_count=(i * 3) % 11,
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def _orm_ids(self, book_type="", tag="", genre="", sort="id"):
+        readers = Coalesce(F("stats__readers_count"), 0)
+        count = Coalesce(F("stats__rating_count"), 0)
+        avg = Case(
+            When(stats__rating_count__gt=0, then=Cast(F("stats__rating_sum"), FloatField()) / F("stats__rating_count")),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        qs = Book.objects.annotate(
+            _readers=readers, _count=count, _avg=avg,
+            _trend=ExpressionWrapper(
+                readers + TREND_RATING_WEIGHT * avg + TREND_COUNT_WEIGHT * count, output_field=FloatField()
+            ),
+        )
+        if book_type:
+            qs = qs.filter(book_type=book_type)
+        if tag:
+            qs = qs.filter(tags__name__iexact=tag)
+        ids = list(qs.order_by(*{
+            "id": ["-id"],
+            "recentes": ["-created_at", "-id"],
+            "antigos": ["created_at", "-id"],
+            "titulo": [Lower("title"), "-id"],
+            "avaliacao": ["-_avg", "-_count", "-id"],
+            "leitores": ["-_readers", "-id"],
+            "tendencia": ["-_trend", "-id"],
+        }[sort]).values_list("id", "genre"))
+        # género: comparação sem maiúsculas nem espaços nas pontas, como no índice
+        return [i for i, g in ids if not genre or (g or "").strip().casefold() == genre.strip().casefold()]
+
+    def test_filters_and_sorts_match_orm(self):
+        index = get_catalog_index()
+        for sort in CATALOG_SORTS:
+            for book_type in ("", "free", "premium"):
+                for tag in ("", "classicos", "CURTOS", "nenhuma"):
+                    for genre in ("", "drama", "Terror", "nenhum"):
+                        with self.subTest(sort=sort, type=book_type, tag=tag, genre=genre):
+                            expected = self._orm_ids(book_type, tag, genre, sort)
+                            ids, total, next_offset = index.query(
+                                book_type=book_type, tag=tag, genre=genre, sort=sort, limit=1000,
+                            )
+                            self.assertEqual(ids, expected)
+                            self.assertEqual(total, len(expected))
+                            self.assertIsNone(next_offset)
+
+    def test_api_pages_by_cursor_in_server_order(self):
+        for sort, params in (("id", ""), ("titulo", "&type=free"), ("tendencia", "&tag=classicos&genre=drama")):
+            with self.subTest(sort=sort):
+                expected = self._orm_ids(
+                    book_type="free" if "type=free" in params else "",
+                    tag="classicos" if "tag=" in params else "",
+                    genre="drama" if "genre=" in params else "",
+                    sort=sort,
+                )
+                seen, cursor = [], ""
+                for _ in range(20):
+                    data = self.client.get(f"/api/books/?limit=4&fields=id&sort={sort}{params}{cursor}").json()
+                    self.assertEqual(data["total"], len(expected))
+                    seen += [row["id"] for row in data["results"]]
+                    if not data["next_cursor"]:
+                        break
+                    cursor = f"&cursor={data['next_cursor']}"
+                self.assertEqual(seen, expected)
+
+    def test_rejects_unknown_sort_and_type(self):
+        self.assertEqual(self.client.get("/api/books/?sort=nope").status_code, 400)
+        self.assertEqual(self.client.get("/api/books/?type=nope").status_code, 400)
+
+
+@TEST_SETTINGS
+class CatalogSearchTests(TestCase):
+    """Pesquisa com ranking servida por /api/books/?q= (a caixa de pesquisa da home usa esta API)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.in_title = Book.objects.create(title="Noites de Lisboa", book_type="premium", total_pages=5)
+        cls.in_description = Book.objects.create(
+            title="Outro livro", description="uma viagem a Lisboa", book_type="free", total_pages=5,
+        )
+        cls.other = Book.objects.create(title="Porto", book_type="free", total_pages=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def _ids(self, params):
+        resp = self.client.get(f"/api/books/?fields=id{params}")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        return [row["id"] for row in data["results"]], data["total"]
+
+    def test_q_returns_matches_by_relevance(self):
+        ids, total = self._ids("&q=LISBOA")
+        if search.backend() == "like":
+            self.assertEqual(sorted(ids), sorted([self.in_title.id, self.in_description.id]))
+        else:
+            # título pesa mais do que a descrição
+            self.assertEqual(ids, [self.in_title.id, self.in_description.id])
+        self.assertEqual(total, 2)
+
+    def test_q_combines_with_filters_and_sort(self):
+        self.assertEqual(self._ids("&q=lisboa&type=free"), ([self.in_description.id], 1))
+        ids, _ = self._ids("&q=lisboa&sort=titulo")
+        self.assertEqual(ids, [self.in_title.id, self.in_description.id])
+        self.assertEqual(self._ids("&q=inexistente"), ([], 0))
+
+    def test_q_pages_by_cursor(self):
+        first = self.client.get("/api/books/?fields=id&q=lisboa&limit=1").json()
+        self.assertEqual(first["total"], 2)
+        rest = self.client.get(f"/api/books/?fields=id&q=lisboa&limit=1&cursor={first['next_cursor']}").json()
+        self.assertIsNone(rest["next_cursor"])
+        self.assertEqual(
+            sorted(r["id"] for r in first["results"] + rest["results"]),
+            sorted([self.in_title.id, self.in_description.id]),
+        )
+
+    def test_relevance_sort_needs_q(self):
+        self.assertEqual(self.client.get("/api/books/?sort=relevancia").status_code, 400)
+
+    def test_backend_resolved_once(self):
+        search.backend()
+        with self.assertNumQueries(0):
+            search.backend()
+
+
+@TEST_SETTINGS
+class PopularShelfTests(TestCase):
+    """Prateleira "Mais lidos" da home (/api/books/popular/)."""
+
+    def setUp(self):
+        cache.clear()
+        self.books = [Book.objects.create(title=f"L{i}", total_pages=3) for i in range(5)]
+        now = timezone.now()
+        # ranking: 3º livro, depois o 1º; o resto completa com os mais recentes
+        for rank, book in enumerate([self.books[2], self.books[0]], start=1):
+            BookPopularity.objects.create(book=book, score=10 - rank, rank=rank, computed_at=now)
+
+    def test_ranked_then_newest(self):
+        data = self.client.get("/api/books/popular/?limit=4&fields=id,title").json()
+        self.assertEqual(
+            [r["id"] for r in data["results"]],
+            [self.books[2].id, self.books[0].id, self.books[4].id, self.books[3].id],
+        )
+        self.assertEqual(set(data["results"][0]), {"id", "title"})
+
+    def test_cached_until_ttl(self):
+        self.client.get("/api/books/popular/?limit=2&fields=id")
+        BookPopularity.objects.filter(book=self.books[2]).update(rank=3)
+        # o job de popularidade não muda a versão do catálogo: mesma resposta até ao TTL
+        data = self.client.get("/api/books/popular/?limit=2&fields=id").json()
+        self.assertEqual(data["results"][0]["id"], self.books[2].id)
+
+    def test_rejects_unknown_field(self):
+        self.assertEqual(self.client.get("/api/books/popular/?fields=nope").status_code, 400)
+
+
+@TEST_SETTINGS
+class BundleCommentsTests(MediaTestCase):
+    def test_bundle_caps_comments_and_flags_more(self):
+        from .views import BUNDLE_COMMENTS_LIMIT
+
+        user = get_user_model().objects.create_user("leitor", password="x")
+        self.client.force_login(user)
+        book = self.make_book(pages=2)
+        BookComment.objects.bulk_create(
+            BookComment(book=book, page_number=1, user=user, text=f"c{i}") for i in range(BUNDLE_COMMENTS_LIMIT + 1)
+        )
+
+        bundle = self.client.get(f"/api/read/{book.id}/1/bundle/").json()
+        self.assertEqual(len(bundle["comments"]), BUNDLE_COMMENTS_LIMIT)
+        self.assertTrue(bundle["comments_has_more"])
+        # o leitor vai buscar o resto à API de comentários
+        self.assertEqual(len(self.client.get(f"/api/books/{book.id}/comments/?page=1").json()), BUNDLE_COMMENTS_LIMIT + 1)
+
+        BookComment.objects.filter(book=book).first().delete()
+        self.assertFalse(self.client.get(f"/api/read/{book.id}/1/bundle/").json()["comments_has_more"])
+
+
+@TEST_SETTINGS
+@override_settings(
+    USE_PUBLIC_MEDIA=True, AWS_STORAGE_BUCKET_NAME="owl", AWS_LOCATION="media", AWS_PUBLIC_LOCATION="public",
+)
+class PublicMediaSyncTests(TestCase):
+    """Mudar a prévia (book_type/total_pages) move as páginas entre o prefixo público e o privado."""
+
+    def setUp(self):
+        self.s3 = mock.MagicMock()
+        patcher = mock.patch("books.public_media._s3_client", return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # 20 páginas: free -> prévia até à 1, premium -> até à 2
+        self.book = Book.objects.create(title="Livro", book_type="free", total_pages=20)
+        for n in range(1, 21):
+            name = f"pages/{self.book.id}/{n:04d}.webp"
+            BookPage.objects.create(
+                book=self.book, page_number=n, is_public=n == 1, image_key=name if n == 1 else f"media/{name}",
+            )
+
+    def _public_pages(self):
+        return list(BookPage.objects.filter(book=self.book, is_public=True).order_by("page_number")
+                    .values_list("page_number", "image_key"))
+
+    def test_preview_change_updates_public_set(self):
+        book = Book.objects.get(id=self.book.id)
+        book.book_type = "premium"
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+
+        name = f"pages/{book.id}/0002.webp"
+        self.assertEqual(self._public_pages(), [(1, f"pages/{book.id}/0001.webp"), (2, name)])
+        self.s3.copy_object.assert_called_once()
+        self.assertEqual(self.s3.copy_object.call_args.kwargs["Key"], f"public/{name}")
+        self.assertEqual(self.s3.copy_object.call_args.kwargs["CopySource"], {"Bucket": "owl", "Key": f"media/{name}"})
+        self.s3.delete_object.assert_called_once_with(Bucket="owl", Key=f"media/{name}")
+
+        # e de volta: a página 2 deixa de ser prévia -> privada outra vez
+        self.s3.reset_mock()
+        book.book_type = "free"
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertEqual([n for n, _ in self._public_pages()], [1])
+        self.assertEqual(BookPage.objects.get(book=book, page_number=2).image_key, f"media/{name}")
+        self.s3.delete_object.assert_called_once_with(Bucket="owl", Key=f"public/{name}")
+
+    def test_unrelated_save_does_not_sync(self):
+        book = Book.objects.get(id=self.book.id)
+        book.title = "Outro título"
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.s3.copy_object.assert_not_called()
+        self.assertEqual([n for n, _ in self._public_pages()], [1])
+
+
+@TEST_SETTINGS
+class OfflineZipTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user("leitor", password="x")
+        self.client.force_login(self.user)
+
+    def _book(self, **kwargs):
+        book = self.make_book(pages=3, **kwargs)
+        BookShareUnlock.objects.create(user=self.user, book=book)
+        return book
+
+    def _get(self, book, **headers):
+        resp = self.client.get(f"/api/books/{book.id}/offline/", headers=headers)
+        return resp, b"".join(resp.streaming_content) if resp.streaming else resp.content
+
+    def _check_zip(self, content):
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertIsNone(archive.testzip())   # CRC de cada ficheiro
+        return archive.namelist()
+
+    def test_range_and_if_range(self):
+        book = self._book()
+        full_resp, full = self._get(book)
+        self.assertEqual(full_resp.status_code, 200)
+        self.assertEqual(int(full_resp["Content-Length"]), len(full))
+        self.assertEqual(full_resp["Accept-Ranges"], "bytes")
+        etag = full_resp["ETag"]
+        self._check_zip(full)
+
+        resp, part = self._get(book, Range="bytes=10-99")
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp["Content-Range"], f"bytes 10-99/{len(full)}")
+        self.assertEqual(part, full[10:100])
+
+        # retoma a meio de uma página (storage lido a partir do offset)
+        resp, tail = self._get(book, Range="bytes=-700", **{"If-Range": etag})
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(tail, full[-700:])
+
+        # arquivo mudou (ETag antigo): volta a mandar tudo
+        resp, again = self._get(book, Range="bytes=10-99", **{"If-Range": '"outro"'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(again, full)
+
+        resp, _ = self._get(book, Range=f"bytes={len(full)}-")
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp["Content-Range"], f"bytes */{len(full)}")
+
+    def test_head_never_reads_storage(self):
+        for measured in (True, False):
+            with self.subTest(measured=measured):
+                book = self._book(measured=measured)
+                with mock.patch("books.offline.storage_stream", side_effect=AssertionError("leu o storage")), \
+                        mock.patch("books.views.storage_stream", side_effect=AssertionError("leu o storage")):
+                    resp = self.client.head(f"/api/books/{book.id}/offline/")
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.has_header("Content-Length"), measured)
+                self.assertEqual(
+                    BookPage.objects.filter(book=book, size_bytes__isnull=True).count(), 0 if measured else 3,
+                )
+
+    def test_unmeasured_pages_are_measured_while_streaming(self):
+        book = self._book(measured=False)
+        resp, content = self._get(book, Range="bytes=0-9")
+        # sem layout prévio: Range ignorado, arquivo inteiro
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.has_header("Content-Length"))
+        self.assertFalse(resp.has_header("ETag"))
+        self.assertEqual(
+            self._check_zip(content), ["manifest.json", "pages/0001.webp", "pages/0002.webp", "pages/0003.webp"],
+        )
+
+        # medidas gravadas: o pedido seguinte já tem Content-Length/Range
+        for page in BookPage.objects.filter(book=book):
+            data = default_storage.open(page.image_key).read()
+            self.assertEqual((page.size_bytes, page.crc32), (len(data), zlib.crc32(data)))
+        resp, content = self._get(book)
+        self.assertEqual(int(resp["Content-Length"]), len(content))
+        self._check_zip(content)
+
+
+@TEST_SETTINGS
+class EntitlementCacheTests(MediaTestCase):
+    """Snapshot de direitos em cache por user, apagado pelos signals de plano/partilha."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user("leitor", password="x")
+        self.client.force_login(self.user)
+
+    def test_cached_after_first_load(self):
+        get_entitlements(self.user)
+        with self.assertNumQueries(0):
+            ent = get_entitlements(self.user)
+        self.assertFalse(ent.has_active_subscription())
+
+    def test_subscription_busts_cache_and_opens_premium(self):
+        book = self.make_book(pages=20, book_type="premium")
+        # prévia premium: 10% -> até à página 2
+        self.assertEqual(self.client.get(f"/api/read/{book.id}/3/").status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sub = UserSubscription.objects.create(user=self.user, expires_at=timezone.now() + timedelta(days=30))
+        self.assertTrue(get_entitlements(self.user).has_active_subscription())
+        self.assertEqual(self.client.get(f"/api/read/{book.id}/3/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sub.delete()
+        self.assertEqual(self.client.get(f"/api/read/{book.id}/3/").status_code, 403)
+
+    def test_share_unlock_busts_cache(self):
+        book = self.make_book(pages=20)
+        self.assertEqual(self.client.get(f"/api/read/{book.id}/5/").status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            BookShareUnlock.objects.create(user=self.user, book=book)
+        self.assertTrue(get_entitlements(self.user).has_share_unlock(book.id))
+        self.assertEqual(self.client.get(f"/api/read/{book.id}/5/").status_code, 200)
+
+    def test_expired_plan_needs_no_invalidation(self):
+        UserSubscription.objects.create(user=self.user, expires_at=timezone.now() + timedelta(seconds=30))
+        self.assertTrue(get_entitlements(self.user).has_active_subscription())
+        # snapshot em cache guarda a data: expira sozinho
+        with mock.patch("books.entitlements.timezone.now", return_value=timezone.now() + timedelta(minutes=1)):
+            self.assertFalse(get_entitlements(self.user).has_active_subscription())
+
+
+@TEST_SETTINGS
+class BooksAccessTests(TestCase):
+    """Acesso de vários livros num só pedido (/api/books/access/)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("leitor", password="x")
+        cls.free = Book.objects.create(title="Free", book_type="free", total_pages=40)
+        cls.premium = Book.objects.create(title="Premium", book_type="premium", total_pages=40)
+        BookShareUnlock.objects.create(user=cls.user, book=cls.free)
+
+    def setUp(self):
+        cache.clear()
+
+    def _access(self, ids):
+        resp = self.client.get(f"/api/books/access/?ids={ids}")
+        self.assertEqual(resp.status_code, 200)
+        return {r["book_id"]: r for r in resp.json()["results"]}, [r["book_id"] for r in resp.json()["results"]]
+
+    def test_anonymous_gets_preview_rules(self):
+        access, order = self._access(f"{self.premium.id},{self.free.id}")
+        self.assertEqual(order, [self.premium.id, self.free.id])
+        self.assertEqual(access[self.premium.id]["allowed_until_page"], 4)
+        self.assertEqual(access[self.free.id]["allowed_until_page"], 2)
+        self.assertEqual({r["status"] for r in access.values()}, {"preview"})
+
+    def test_user_entitlements_in_one_pass(self):
+        self.client.force_login(self.user)
+        self.client.get(f"/api/books/access/?ids={self.free.id}")   # snapshot de direitos em cache
+        # repetidos e inexistentes: uma entrada por livro que existe, pela ordem pedida
+        with self.assertNumQueries(3):   # sessão + user + livros
+            access, order = self._access(f"{self.free.id},999999,{self.premium.id},{self.free.id}")
+        self.assertEqual(order, [self.free.id, self.premium.id])
+        self.assertEqual(access[self.free.id]["status"], "unlocked")
+        self.assertEqual(access[self.free.id]["allowed_until_page"], 40)
+        self.assertEqual(access[self.premium.id]["status"], "preview")
+
+    def test_rejects_bad_ids(self):
+        self.assertEqual(self.client.get("/api/books/access/").status_code, 400)
+        self.assertEqual(self.client.get("/api/books/access/?ids=1,x").status_code, 400)
+        from .views import BOOKS_ACCESS_MAX_IDS
+        too_many = ",".join(str(i) for i in range(1, BOOKS_ACCESS_MAX_IDS + 2))
+        self.assertEqual(self.client.get(f"/api/books/access/?ids={too_many}").status_code, 400)
+
+
+# por cima do TEST_SETTINGS (o decorator de fora ganha)
+@override_settings(
+    THROTTLE_ENABLED=True,
+    THROTTLE_RATES={**settings.THROTTLE_RATES, "catalog": (2, 1), "read": (2, 1)},
+    THROTTLE_IP_FACTOR=1,
+    TRUSTED_PROXY_HOPS=1,
+)
+@TEST_SETTINGS
+class ThrottleTests(MediaTestCase):
+    """Token bucket (429) e load shedding por prioridade (503)."""
+
+    def test_bucket_empties_then_429_with_retry_after(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get("/api/books/facets/").status_code, 200)
+        resp = self.client.get("/api/books/facets/")
+        self.assertEqual(resp.status_code, 429)
+        self.assertGreaterEqual(int(resp["Retry-After"]), 1)
+        self.assertEqual(resp.json()["retry_after"], int(resp["Retry-After"]))
+
+    def test_spoofed_forwarded_for_shares_the_bucket(self):
+        # só a última entrada (escrita pelo nosso proxy) conta
+        codes = [
+            self.client.get("/api/books/facets/", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}, 203.0.113.7").status_code
+            for i in range(3)
+        ]
+        self.assertEqual(codes, [200, 200, 429])
+        other = self.client.get("/api/books/facets/", HTTP_X_FORWARDED_FOR="203.0.113.8")
+        self.assertEqual(other.status_code, 200)
+
+    def test_async_read_view_is_throttled_per_user(self):
+        user = get_user_model().objects.create_user("leitor", password="x")
+        self.client.force_login(user)
+        book = self.make_book(pages=2)
+        codes = [self.client.get(f"/api/read/{book.id}/1/").status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+    @override_settings(LOAD_SHED_CAPACITY=4)
+    def test_sheds_catalog_but_never_reads(self):
+        user = get_user_model().objects.create_user("leitor", password="x")
+        self.client.force_login(user)
+        book = self.make_book(pages=2)
+        with mock.patch("books.throttling.in_flight", return_value=4):
+            resp = self.client.get("/api/books/facets/")
+            self.assertEqual(resp.status_code, 503)
+            self.assertEqual(resp["Retry-After"], str(settings.LOAD_SHED_RETRY_AFTER))
+            self.assertEqual(self.client.get(f"/api/read/{book.id}/1/").status_code, 200)
+            # prefetch do service worker conta como analytics: é o primeiro a sair
+            prefetch = self.client.get(f"/api/read/{book.id}/2/", HTTP_SEC_PURPOSE="prefetch")
+            self.assertEqual(prefetch.status_code, 503)
+        with mock.patch("books.throttling.in_flight", return_value=2):
+            self.assertEqual(self.client.get("/api/books/facets/").status_code, 200)
+
+
+@TEST_SETTINGS
+class CatalogCacheTests(TestCase):
+    """Respostas do catálogo em cache pela versão do catálogo (Book/Tag/Rating mudam a versão)."""
+
+    URL = "/api/books/?fields=id,title,avg_rating&limit=10"
+
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(title="Antes", total_pages=3)
+
+    def _titles(self):
+        return [r["title"] for r in self.client.get(self.URL).json()["results"]]
+
+    def test_hit_needs_no_queries_and_revalidates_with_etag(self):
+        first = self.client.get(self.URL)
+        with self.assertNumQueries(0):
+            again = self.client.get(self.URL)
+        self.assertEqual(again.content, first.content)
+
+        resp = self.client.get(self.URL, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
+        resp = self.client.get(self.URL, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(resp.content)), first.json())
+
+    def test_book_tag_and_rating_changes_bump_version(self):
+        self.assertEqual(self._titles(), ["Antes"])
+
+        for change in (
+            lambda: Book.objects.filter(pk=self.book.pk).first().save(),
+            lambda: self.book.tags.add(Tag.objects.create(name="nova")),
+            lambda: Rating.objects.create(
+                user=get_user_model().objects.create_user("leitor", password="x"), book=self.book, stars=4,
+            ),
+        ):
+            before = catalog_version()
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertNotEqual(catalog_version(), before)
+
+        # a versão nova invalida a resposta já guardada
+        self.book.title = "Depois"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(self._titles(), ["Depois"])
+        self.assertEqual(self.client.get(self.URL).json()["results"][0]["avg_rating"], 4.0)
+
+
+@TEST_SETTINGS
+class CatalogChangesFeedTests(MediaTestCase):
+    """Feed incremental /api/books/changes/ (tokens, colapso por livro, paginação, 410)."""
+
+    URL = "/api/books/changes/?fields=id,title"
+
+    def _feed(self, since):
+        return self.client.get(f"{self.URL}&since={since}")
+
+    def test_changes_since_token_collapse_per_book(self):
+        start = self.client.get(self.URL).json()
+        self.assertIsNone(start["snapshot"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kept = Book.objects.create(title="Fica", total_pages=1)
+            gone = Book.objects.create(title="Sai", total_pages=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.title = "Fica (2ª ed.)"
+            kept.save()
+            gone_id = gone.id
+            gone.delete()
+
+        data = self._feed(start["token"]).json()
+        self.assertEqual(data["updated"], [{"id": kept.id, "title": "Fica (2ª ed.)"}])
+        self.assertEqual(data["deleted"], [gone_id])
+        self.assertFalse(data["has_more"])
+
+        # já em dia: nada de novo, mesmo token
+        again = self._feed(data["token"]).json()
+        self.assertEqual((again["updated"], again["deleted"], again["token"]), ([], [], data["token"]))
+
+    @override_settings(CATALOG_CHANGES_MAX=1)
+    def test_pages_with_has_more(self):
+        token = self.client.get(self.URL).json()["token"]
+        with self.captureOnCommitCallbacks(execute=True):
+            books = [Book.objects.create(title=f"L{i}", total_pages=1) for i in range(3)]
+
+        seen = []
+        for _ in range(5):
+            data = self._feed(token).json()
+            seen += [r["id"] for r in data["updated"]]
+            token = data["token"]
+            if not data["has_more"]:
+                break
+        self.assertEqual(seen, [b.id for b in books])
+
+    @override_settings(CATALOG_SNAPSHOT_KEEP=1)
+    def test_expired_token_points_to_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="A", total_pages=1)
+        old_token = self.client.get(self.URL).json()["token"]
+        publish_snapshot(lambda: [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="B", total_pages=1)
+        snapshot = publish_snapshot(lambda: [])
+
+        self.assertEqual(self.client.get(self.URL).json()["snapshot"]["token"], str(snapshot.token))
+        resp = self._feed(int(old_token) - 1)
+        self.assertEqual(resp.status_code, 410)
+        self.assertEqual(resp.json()["snapshot"]["token"], str(snapshot.token))
+        self.assertEqual(self._feed(snapshot.token + 100).status_code, 410)
+        self.assertEqual(self._feed(snapshot.token).status_code, 200)
+
+    def test_rejects_bad_since_and_untracked_fields(self):
+        self.assertEqual(self._feed("abc").status_code, 400)
+        self.assertEqual(self.client.get("/api/books/changes/?fields=avg_rating").status_code, 400)
+
+
+@TEST_SETTINGS
+class FacetCountTests(TestCase):
+    """Contagens por género/tag/tipo mantidas pelos signals = GROUP BY real."""
+
+    def setUp(self):
+        cache.clear()
+
+    def _stored(self):
+        return {(f.kind, f.value): f.count for f in FacetCount.objects.filter(count__gt=0)}
+
+    def _assert_in_sync(self):
+        self.assertEqual(self._stored(), {k: v for k, v in compute_facets().items() if v})
+
+    def test_signals_keep_counts_exact(self):
+        drama, curtos = Tag.objects.create(name="drama"), Tag.objects.create(name="curtos")
+        a = Book.objects.create(title="A", genre="Romance", book_type="free", total_pages=1)
+        b = Book.objects.create(title="B", genre=" Romance ", book_type="premium", total_pages=1)
+        a.tags.add(drama, curtos)
+        curtos.books.add(b)
+        self._assert_in_sync()
+
+        b.genre = "Terror"
+        b.book_type = "free"
+        b.save()
+        a.tags.remove(curtos)
+        curtos.name = "Contos"
+        curtos.save()
+        self._assert_in_sync()
+
+        drama.books.clear()
+        a.delete()
+        curtos.delete()
+        self._assert_in_sync()
+
+    def test_api_and_reconcile(self):
+        Book.objects.create(title="A", genre="Drama", total_pages=1)
+        data = self.client.get("/api/books/facets/").json()
+        self.assertEqual(data["genre"], [{"value": "Drama", "count": 1}])
+
+        # update() não dispara signals: o reconcile corrige o desvio
+        Book.objects.update(genre="Terror")
+        call_command("reconcile_facets", stdout=io.StringIO())
+        self._assert_in_sync()
+        self.assertEqual(self.client.get("/api/books/facets/").json()["genre"], [{"value": "Terror", "count": 1}])
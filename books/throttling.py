@@ -0,0 +1,190 @@
+import math
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+
+# =========================================================
+# Pedidos em curso neste processo (threads do gunicorn ou tarefas do worker ASGI)
+# =========================================================
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def in_flight() -> int:
+    return _in_flight
+
+
+def _enter() -> None:
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+
+
+def _leave() -> None:
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+class InFlightMiddleware:
+    """
+    Conta pedidos em curso no worker; o load shedding decide com base nisto.
+    Síncrono e assíncrono: em ASGI não obriga a cadeia a saltar para uma thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _enter()
+        try:
+            return self.get_response(request)
+        finally:
+            _leave()
+
+    async def __acall__(self, request):
+        _enter()
+        try:
+            return await self.get_response(request)
+        finally:
+            _leave()
+
+
+# =========================================================
+# Token bucket (cache) por user e por IP
+# =========================================================
+def _client_ip(request) -> str:
+    """
+    X-Forwarded-For = "<o que o cliente mandar>, ..., <ip visto pelo nosso proxy>".
+    Só as últimas TRUSTED_PROXY_HOPS entradas são escritas pelos nossos proxies: a 1ª
+    é do cliente (um valor novo por pedido = bucket novo). Sem proxy (0): REMOTE_ADDR.
+    """
+    hops = settings.TRUSTED_PROXY_HOPS
+    if hops > 0:
+        forwarded = [p.strip() for p in (request.META.get("HTTP_X_FORWARDED_FOR") or "").split(",") if p.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.META.get("REMOTE_ADDR", "") or "unknown"
+
+
+def _buckets(request, tier: str, user):
+    """
+    [(cache_key, burst, refill_por_segundo)] a verificar para este pedido.
+    """
+    burst, per_minute = settings.THROTTLE_RATES[tier]
+    rate = per_minute / 60.0
+    ip_factor = settings.THROTTLE_IP_FACTOR
+
+    out = [(f"tb:v1:{tier}:ip:{_client_ip(request)}", burst * ip_factor, rate * ip_factor)]
+    if user.is_authenticated:
+        out.append((f"tb:v1:{tier}:user:{user.pk}", burst, rate))
+    return out
+
+
+def _take_tokens(buckets) -> float:
+    """
+    Tira 1 token de cada bucket. Devolve 0 se passou, ou os segundos até haver token.
+    (get/set não atómico: aproximação aceitável para proteger o servidor)
+    """
+    states = cache.get_many([key for key, _, _ in buckets])
+    updates, wait, ttl = _refill(buckets, states)
+    cache.set_many(updates, ttl)
+    return wait
+
+
+async def _atake_tokens(buckets) -> float:
+    states = await cache.aget_many([key for key, _, _ in buckets])
+    updates, wait, ttl = _refill(buckets, states)
+    await cache.aset_many(updates, ttl)
+    return wait
+
+
+def _refill(buckets, states):
+    now = time.time()
+    updates = {}
+    wait = 0.0
+    for key, burst, rate in buckets:
+        tokens, ts = states.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - ts) * rate)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / rate)
+        updates[key] = [tokens, now]
+
+    if not wait:
+        for key in updates:
+            updates[key][0] -= 1
+
+    ttl = int(max(burst / rate for _, burst, rate in buckets)) + 60
+    return {k: tuple(v) for k, v in updates.items()}, wait, ttl
+
+
+def is_prefetch(request) -> bool:
+    # prefetch do service worker/browser: não conta como página lida
+    purpose = request.headers.get("Sec-Purpose") or request.headers.get("Purpose") or ""
+    return purpose.lower().startswith("prefetch")
+
+
+def _too_many(wait: float, detail: str, status: int):
+    retry_after = max(1, math.ceil(wait))
+    resp = JsonResponse({"detail": detail, "retry_after": retry_after}, status=status)
+    resp["Retry-After"] = str(retry_after)
+    return resp
+
+
+def throttle(tier: str):
+    """
+    Decorator para views JSON.
+    - load shedding: com o worker cheio, corta primeiro analytics (e prefetch), depois
+      catálogo/suggest (SHED_THRESHOLDS, fração de LOAD_SHED_CAPACITY) -> 503;
+      tiers fora de SHED_THRESHOLDS (leitura) nunca são cortados
+    - token bucket por user/IP (THROTTLE_RATES) -> 429
+    Views async: user por request.auser() e cache pelos métodos a* (sem bloquear o loop).
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _awrapped(request, *args, **kwargs):
+                if settings.THROTTLE_ENABLED:
+                    refused = _shed(request, tier)
+                    if refused is None:
+                        user = await request.auser()
+                        wait = await _atake_tokens(_buckets(request, tier, user))
+                        refused = _too_many(wait, "Demasiados pedidos.", 429) if wait else None
+                    if refused is not None:
+                        return refused
+                return await view_func(request, *args, **kwargs)
+            return _awrapped
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            if settings.THROTTLE_ENABLED:
+                refused = _shed(request, tier)
+                if refused is None:
+                    wait = _take_tokens(_buckets(request, tier, request.user))
+                    refused = _too_many(wait, "Demasiados pedidos.", 429) if wait else None
+                if refused is not None:
+                    return refused
+            return view_func(request, *args, **kwargs)
+        return _wrapped
+    return decorator
+
+
+def _shed(request, tier: str):
+    # prefetch (service worker / browser) não é leitura real: corta-se cedo
+    shed_tier = "analytics" if is_prefetch(request) else tier
+    threshold = settings.SHED_THRESHOLDS.get(shed_tier)
+    if threshold is not None and in_flight() > settings.LOAD_SHED_CAPACITY * threshold:
+        return _too_many(settings.LOAD_SHED_RETRY_AFTER, "Servidor ocupado, tenta de novo.", 503)
+    return None
@@ -5,9 +5,18 @@ urlpatterns = [
     # Livros
     path("books/", views.books_list_api, name="books_list_api"),
     path("books/list/", views.books_list, name="books_list"),
+    path("books/access/", views.books_access_api, name="books_access_api"),
+    path("books/suggest/", views.books_suggest_api, name="books_suggest_api"),
+    path("books/facets/", views.books_facets_api, name="books_facets_api"),
+    path("books/popular/", views.books_popular_api, name="books_popular_api"),
+    path("books/changes/", views.books_changes_api, name="books_changes_api"),
 
     # Leitura por página
     path("read/<int:book_id>/<int:page_number>/", views.read_page_api, name="read_page_api"),
+    path("read/<int:book_id>/<int:page_number>/bundle/", views.read_page_bundle_api, name="read_page_bundle_api"),
+
+    # Recomendações ("quem leu também leu")
+    path("books/<int:book_id>/similar/", views.book_similar_api, name="book_similar_api"),
 
     # Comentários
     path("books/<int:book_id>/comments/", views.book_comments_api, name="book_comments_api"),
@@ -16,6 +25,9 @@ urlpatterns = [
     path("books/<int:book_id>/annotations/", views.book_annotations_api, name="book_annotations_api"),
     path("books/annotations/<int:annotation_id>/", views.book_annotation_delete_api, name="book_annotation_delete_api"),
 
+    # Download offline (ZIP em streaming, com Range)
+    path("books/<int:book_id>/offline/", views.book_offline_bundle_api, name="book_offline_bundle_api"),
+
     # Unlock por partilha (free)
     path("books/<int:book_id>/unlock-share/", views.book_unlock_share_api, name="book_unlock_share_api"),
 ]
\ No newline at end of file
@@ -1,16 +1,32 @@
-from datetime import timedelta
-import math
-
+from functools import partial
+import hashlib
+import json
 import boto3
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.files.storage import default_storage
-from django.db.models import Avg, Count
-from django.http import JsonResponse
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Left
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.views.decorators.http import require_GET, require_POST, require_http_methods
 
-from .models import Book, BookPage, BookComment, BookAnnotation, UserSubscription, BookShareUnlock
-from reading.models import Rating, ReadingProgress
+from .catalog import cached_json
+from .changes import changes_since, latest_snapshot, latest_token, oldest_valid_token, snapshot_info
+from .catalog_index import BOOK_TYPES, SORTS as CATALOG_SORTS, get_index as get_catalog_index
+from .facets import facet_counts
+from .entitlements import aget_entitlements, get_entitlements, preview_until_page
+from .covers import cover_placeholder, cover_srcset
+from .media import cover_url, page_storage
+from .throttling import is_prefetch as _is_prefetch, throttle
+from .search import SUGGEST_MIN_CHARS, normalize_prefix, normalize_query, search_ids, suggest
+from .offline import ZipMember, iter_range, parse_range, storage_stream, zip_layout, zip_stream
+from .streaming import streaming_content
+from .warming import asigned_page_url, signed_page_url, warm_next_pages
+from .models import Book, BookPage, BookComment, BookAnnotation, BookShareUnlock
+from reading.active import active_readers as _active_readers
+from reading.models import BookSimilarity
+from reading.popularity import most_read
+from reading.progress import record_progress
 
 
 # =========================================================
@@ -38,20 +54,44 @@ def _user_label(user):
     return getattr(user, "email", "") or getattr(user, "username", "") or str(user)
 
 
-def _has_active_subscription(user) -> bool:
+def _comment_dict(c: BookComment) -> dict:
+    return {
+        "id": c.id,
+        "text": c.text,
+        "user_label": _user_label(c.user),
+        "created_at": c.created_at.isoformat(),
+        "created_at_display": _created_at_display(c.created_at),
+    }
+
+
+def _annotation_dict(a: BookAnnotation, user) -> dict:
+    return {
+        "id": a.id,
+        "text": a.text,
+        "x": float(a.x),
+        "y": float(a.y),
+        "user_label": _user_label(a.user),
+        "created_at": a.created_at.isoformat(),
+        "created_at_display": _created_at_display(a.created_at),
+        "mine": bool(a.user_id == user.id),
+    }
+
+
+def _has_active_subscription(user, entitlements=None) -> bool:
     if not user or not user.is_authenticated:
         return False
-    now = timezone.now()
-    return UserSubscription.objects.filter(user=user, expires_at__gt=now).exists()
+    ent = entitlements or get_entitlements(user)
+    return ent.has_active_subscription()
 
 
-def _has_share_unlock(user, book: Book) -> bool:
+def _has_share_unlock(user, book: Book, entitlements=None) -> bool:
     if not user or not user.is_authenticated:
         return False
-    return BookShareUnlock.objects.filter(user=user, book=book).exists()
+    ent = entitlements or get_entitlements(user)
+    return ent.has_share_unlock(book.id)
 
 
-def _allowed_until_page(book: Book, user) -> int:
+def _allowed_until_page(book: Book, user, entitlements=None) -> int:
     """
     Regras (B):
     - premium:
@@ -60,6 +100,8 @@ def _allowed_until_page(book: Book, user) -> int:
     - free:
         - com share unlock: total_pages
         - sem unlock: 5% do total (mínimo 1)
+
+    `entitlements` (opcional) evita voltar à cache quando o caller já tem o snapshot.
     """
     total = int(getattr(book, "total_pages", 0) or 0)
     if total <= 0:
@@ -69,14 +111,54 @@ def _allowed_until_page(book: Book, user) -> int:
     btype = _get_book_type(book)
 
     if btype == "premium":
-        if _has_active_subscription(user):
+        if _has_active_subscription(user, entitlements):
             return total
-        return max(1, math.ceil(total * 0.10))
+        return preview_until_page(btype, total)
 
     # free
-    if _has_share_unlock(user, book):
+    if _has_share_unlock(user, book, entitlements):
         return total
-    return max(1, math.ceil(total * 0.05))
+    return preview_until_page(btype, total)
+
+
+def _gate_for(book: Book, allowed: int) -> str:
+    """
+    Tipo de bloqueio que o user encontra ao passar de `allowed`:
+    NONE (lê tudo), PAY (premium) ou SHARE (free).
+    """
+    total = int(getattr(book, "total_pages", 0) or 0)
+    if total <= 0 or allowed >= total:
+        return "NONE"
+    return "PAY" if _get_book_type(book) == "premium" else "SHARE"
+
+
+# limite de ids por pedido no endpoint de acesso em lote
+BOOKS_ACCESS_MAX_IDS = 200
+
+
+def _books_access(book_ids, user) -> dict:
+    """
+    Avalia _allowed_until_page para vários livros de uma vez:
+    1 query para os livros + 1 leitura do snapshot de direitos.
+    Devolve {book_id: {...}}; ids inexistentes são ignorados.
+    """
+    ent = get_entitlements(user)
+    books = Book.objects.filter(id__in=list(book_ids)).only("id", "book_type", "total_pages")
+    return {b.id: book_access(b, user, ent) for b in books}
+
+
+def book_access(b: Book, user, entitlements) -> dict:
+    # precisa só de id/book_type/total_pages carregados
+    allowed = _allowed_until_page(b, user, entitlements)
+    gate = _gate_for(b, allowed)
+    return {
+        "book_id": b.id,
+        "book_type": _get_book_type(b),
+        "total_pages": int(b.total_pages or 0),
+        "allowed_until_page": int(allowed),
+        "gate": gate,
+        "status": "unlocked" if gate == "NONE" else "preview",
+    }
 
 
 def _payment_offers():
@@ -93,72 +175,316 @@ def _payment_offers():
 # =========================================================
 # APIs
 # =========================================================
+# campos do catálogo: nome -> (colunas a carregar com .only(), valor)
+CATALOG_FIELDS = {
+    "id": (("id",), lambda b, ctx: b.id),
+    "title": (("title",), lambda b, ctx: str(b.title or "")),
+    "author": (("author",), lambda b, ctx: str(b.author or "")),
+    "description": (("description",), lambda b, ctx: str(b.description or "")),
+    # início da descrição (cortado no SQL) para cartões/hover
+    "excerpt": ((), lambda b, ctx: str(b.excerpt or "")),
+    "genre": (("genre",), lambda b, ctx: str(b.genre or "")),
+    "book_type": (("book_type",), lambda b, ctx: _get_book_type(b)),
+    # capa enviada (ou rendição da 1ª página); tiles usam cover_srcset (WebP 160/320/640w)
+    "cover": (("cover", "cover_variants"), lambda b, ctx: cover_url(b)),
+    "cover_srcset": (("cover_variants",), lambda b, ctx: cover_srcset(b)),
+    "cover_placeholder": (("cover_variants",), lambda b, ctx: cover_placeholder(b)),
+    "created_at": (("created_at",), lambda b, ctx: b.created_at.isoformat() if b.created_at else None),
+    "avg_rating": (
+        ("stats__rating_sum", "stats__rating_count"),
+        lambda b, ctx: float(b.stats.avg_rating) if _stats(b) else 0.0,
+    ),
+    "ratings_count": (("stats__rating_count",), lambda b, ctx: int(b.stats.rating_count) if _stats(b) else 0),
+    "readers_count": (("stats__readers_count",), lambda b, ctx: int(b.stats.readers_count) if _stats(b) else 0),
+    "active_readers": ((), lambda b, ctx: int(ctx["active"].get(b.id, 0) or 0)),
+}
+# mudam a cada página lida (sem bump de versão): TTL curto
+CATALOG_VOLATILE_FIELDS = {"readers_count", "active_readers"}
+CATALOG_VOLATILE_SORTS = {"avaliacao", "leitores", "tendencia"}
+CATALOG_EXCERPT_CHARS = 240
+CATALOG_PAGE_SIZE = 60
+CATALOG_PAGE_MAX = 200
+
+
+# campos do feed de alterações/snapshot: só colunas do Book (rating/leitores mudam sem
+# registo de alteração; os clientes pedem-nos à parte)
+CATALOG_CHANGES_FIELDS = (
+    "id", "title", "author", "excerpt", "genre", "book_type",
+    "cover", "cover_srcset", "cover_placeholder", "created_at",
+)
+CATALOG_CHANGES_EXTRA_FIELDS = ("description",)
+
+
+def _parse_fields(request, allowed):
+    """
+    ?fields=a,b -> (campos com "id" à frente, desconhecidos). Sem `fields`: todos os permitidos.
+    """
+    raw_fields = [f.strip() for f in (request.GET.get("fields") or "").split(",") if f.strip()]
+    unknown = [f for f in raw_fields if f not in allowed]
+    if not raw_fields:
+        return list(allowed), unknown
+    return ["id"] + [f for f in dict.fromkeys(raw_fields) if f != "id"], unknown
+
+
+def _stats(b):
+    # BookStats só existe depois do 1º rating/leitura
+    try:
+        return b.stats
+    except Exception:
+        return None
+
+
 @require_GET
+@throttle("catalog")
 def books_list_api(request):
-    now = timezone.now()
-    active_window = now - timedelta(hours=24)
+    """
+    GET /api/books/?limit=60&cursor=<id>&fields=id,title,...&ids=1,2
+                   &type=free|premium&tag=x&genre=x
+                   &sort=id|recentes|antigos|titulo|avaliacao|leitores|tendencia|relevancia&q=texto
+    Paginação por cursor: `next_cursor` da resposta vai no pedido seguinte
+    (id com sort=id, o default; posição com as outras ordens).
+    `fields` limita o que é carregado (ex: sem description); `ids` filtra livros concretos.
+    `q`: pesquisa com ranking (search.py); sem `sort` ordena por relevância.
+    Filtros/ordem/total saem do índice em memória (catalog_index.py); o DB só lê a página
+    (e, com `q`, os ids encontrados pelo índice de pesquisa).
+    -> {"results": [...], "next_cursor": "123" | null, "total": 1234}
+    """
+    fields, unknown = _parse_fields(request, CATALOG_FIELDS)
+    if unknown:
+        return JsonResponse({"detail": f"unknown fields: {', '.join(unknown)}"}, status=400)
 
-    rating_aggs = (
-        Rating.objects.values("book_id")
-        .annotate(avg=Avg("stars"), cnt=Count("id"))
-    )
-    rating_map = {r["book_id"]: r for r in rating_aggs}
+    try:
+        limit = int(request.GET.get("limit") or CATALOG_PAGE_SIZE)
+        cursor = int(request.GET.get("cursor")) if request.GET.get("cursor") else None
+        ids = [int(x) for x in (request.GET.get("ids") or "").split(",") if x.strip()]
+    except ValueError:
+        return JsonResponse({"detail": "limit, cursor and ids must be integers"}, status=400)
+    if len(ids) > CATALOG_PAGE_MAX:
+        return JsonResponse({"detail": f"max {CATALOG_PAGE_MAX} ids per request"}, status=400)
+    limit = max(1, min(limit, CATALOG_PAGE_MAX))
+
+    q = normalize_query(request.GET.get("q"))
+    filters = {
+        "book_type": (request.GET.get("type") or "").strip(),
+        "tag": (request.GET.get("tag") or "").strip().lower(),
+        "genre": (request.GET.get("genre") or "").strip().lower(),
+        "sort": (request.GET.get("sort") or ("relevancia" if q else "id")).strip(),
+        "q": q,
+    }
+    if filters["sort"] not in CATALOG_SORTS and not (q and filters["sort"] == "relevancia"):
+        sorts = ", ".join(list(CATALOG_SORTS) + ["relevancia (with q)"])
+        return JsonResponse({"detail": f"sort must be one of: {sorts}"}, status=400)
+    if filters["book_type"] and filters["book_type"] not in BOOK_TYPES:
+        return JsonResponse({"detail": f"type must be one of: {', '.join(BOOK_TYPES)}"}, status=400)
+
+    # resposta igual para todos: cache por versão do catálogo (gzip/br + ETag)
+    key = "|".join([str(limit), str(cursor), ",".join(fields), str(ids)] + list(filters.values()))
+    name = hashlib.sha1(key.encode()).hexdigest()
+    volatile = bool(CATALOG_VOLATILE_FIELDS.intersection(fields)) or filters["sort"] in CATALOG_VOLATILE_SORTS
+    ttl = settings.CATALOG_CACHE_VOLATILE_TTL if volatile else settings.CATALOG_CACHE_TTL
+    return cached_json(request, f"books:{name}", partial(_catalog_page, fields, limit, cursor, ids, filters), ttl)
+
+
+def catalog_columns(fields, prefix: str = "") -> list:
+    # colunas para .only(); prefix="book__" quando o livro vem por select_related
+    return [prefix + c for f in fields for c in CATALOG_FIELDS[f][0]]
+
+
+def catalog_queryset(fields):
+    columns = catalog_columns(fields)
+    qs = Book.objects.order_by("-id")
+    if any(c.startswith("stats__") for c in columns):
+        # rating/leitores vêm da linha BookStats (mantida incrementalmente), no mesmo SELECT
+        qs = qs.select_related("stats")
+    qs = qs.only(*columns)
+    if "excerpt" in fields:
+        qs = qs.annotate(excerpt=Left("description", CATALOG_EXCERPT_CHARS))
+    return qs
+
+
+def catalog_rows(fields, books) -> list:
+    # leitores ativos (24h): baldes horários em cache, sem query
+    ctx = {"active": _active_readers() if "active_readers" in fields else {}}
+    getters = [(f, CATALOG_FIELDS[f][1]) for f in fields]
+    return [{f: get(b, ctx) for f, get in getters} for b in books]
+
+
+def _catalog_page(fields, limit: int, cursor, ids, filters):
+    qs = catalog_queryset(fields)
+    if ids:
+        # livros concretos (favoritos, modal): direto ao DB por PK
+        qs = qs.filter(id__in=ids)
+        if cursor is not None:
+            qs = qs.filter(id__lt=cursor)
+        books = list(qs[:limit + 1])
+        has_more = len(books) > limit
+        books = books[:limit]
+        next_cursor = str(books[-1].id) if has_more and books else None
+        total = None
+    else:
+        index_filters = {k: v for k, v in filters.items() if k != "q"}
+        # pesquisa: o índice de texto dá os ids por relevância, o resto é igual
+        only_ids = search_ids(filters["q"], settings.CATALOG_SEARCH_MAX_RESULTS) if filters["q"] else None
+        by_id_cursor = filters["sort"] == "id"
+        page_ids, total, next_offset = get_catalog_index().query(
+            **index_filters,
+            limit=limit,
+            before_id=cursor if by_id_cursor else None,
+            offset=0 if by_id_cursor or cursor is None else max(cursor, 0),
+            only_ids=only_ids,
+        )
+        found = {b.id: b for b in qs.filter(id__in=page_ids)}
+        books = [found[i] for i in page_ids if i in found]
+        if next_offset is None:
+            next_cursor = None
+        else:
+            next_cursor = str(page_ids[-1]) if by_id_cursor else str(next_offset)
 
-    readers_aggs = (
-        ReadingProgress.objects.values("book_id")
-        .annotate(readers=Count("user_id", distinct=True))
+    out = {"results": catalog_rows(fields, books), "next_cursor": next_cursor}
+    if total is not None:
+        out["total"] = total
+    return 200, out
+
+
+@require_GET
+@throttle("catalog")
+def books_changes_api(request):
+    """
+    GET /api/books/changes/?since=<token>&fields=id,title,...
+    Sincronização incremental do catálogo (ver changes.py):
+    - sem `since`: {"token", "snapshot": {"url", "token", ...} | null} -> o cliente
+      descarrega o snapshot e continua com ?since=<snapshot.token>
+      (sem snapshot ainda: lista por /api/books/ e usa o `token` devolvido)
+    - com `since`: {"token", "updated": [...], "deleted": [ids], "has_more"};
+      has_more = true -> pedir de novo com o token devolvido
+    - token expirado (anterior ao snapshot mais antigo): 410 + snapshot
+    """
+    fields, unknown = _parse_fields(request, CATALOG_CHANGES_FIELDS)
+    unknown = [f for f in unknown if f not in CATALOG_CHANGES_EXTRA_FIELDS]
+    if unknown:
+        return JsonResponse({"detail": f"unknown or untracked fields: {', '.join(unknown)}"}, status=400)
+
+    raw_since = (request.GET.get("since") or "").strip()
+    try:
+        since = int(raw_since) if raw_since else None
+    except ValueError:
+        return JsonResponse({"detail": "since must be a token returned by this endpoint"}, status=400)
+    if since is not None and since < 0:
+        return JsonResponse({"detail": "since must be a token returned by this endpoint"}, status=400)
+
+    # mesma resposta para todos os clientes no mesmo token: cache por versão do catálogo
+    name = hashlib.sha1(f"{since}|{','.join(fields)}".encode()).hexdigest()
+    return cached_json(
+        request, f"changes:{name}", partial(_catalog_changes, fields, since), settings.CATALOG_CACHE_TTL
     )
-    readers_map = {r["book_id"]: r["readers"] for r in readers_aggs}
 
-    active_aggs = (
-        ReadingProgress.objects.filter(updated_at__gte=active_window)
-        .values("book_id")
-        .annotate(active=Count("user_id", distinct=True))
+
+def _catalog_changes(fields, since):
+    if since is None:
+        return 200, {"token": str(latest_token()), "snapshot": snapshot_info(latest_snapshot())}
+
+    if since < oldest_valid_token() or since > latest_token():
+        return 410, {
+            "detail": "token expired, reload from the snapshot",
+            "snapshot": snapshot_info(latest_snapshot()),
+        }
+
+    updated_ids, deleted_ids, token, has_more = changes_since(since, settings.CATALOG_CHANGES_MAX)
+    found = catalog_queryset(fields).in_bulk(updated_ids) if updated_ids else {}
+    # apagado entretanto (a remoção vem num token seguinte): fica de fora
+    books = [found[i] for i in updated_ids if i in found]
+    return 200, {
+        "token": str(token),
+        "updated": catalog_rows(fields, books),
+        "deleted": deleted_ids,
+        "has_more": has_more,
+    }
+
+
+@require_GET
+@throttle("suggest")
+def books_suggest_api(request):
+    """
+    GET /api/books/suggest/?q=alqu
+    Sugestões para a caixa de pesquisa: livros (título), autores e tags por prefixo.
+    -> {"q": "alqu", "results": [{"type": "book", "id", "title", "author"}, {"type": "author"|"tag", "value"}]}
+    Cache por prefixo (inválida com a versão do catálogo).
+    """
+    q = normalize_prefix(request.GET.get("q"))
+    if len(q) < SUGGEST_MIN_CHARS:
+        return JsonResponse({"q": q, "results": []})
+
+    name = hashlib.sha1(q.encode()).hexdigest()
+    return cached_json(request, f"suggest:{name}", lambda: (200, {"q": q, "results": suggest(q)}), settings.CATALOG_CACHE_TTL)
+
+
+@require_GET
+@throttle("catalog")
+def books_facets_api(request):
+    """
+    GET /api/books/facets/
+    Nº de livros por género, tag e tipo (contagens mantidas por signals, sem GROUP BY).
+    -> {"genre": [{"value", "count"}], "tag": [...], "book_type": [...]}
+    """
+    return cached_json(request, "facets", lambda: (200, facet_counts()), settings.CATALOG_CACHE_TTL)
+
+
+POPULAR_LIMIT_MAX = 30
+
+
+@require_GET
+@throttle("catalog")
+def books_popular_api(request):
+    """
+    GET /api/books/popular/?limit=14&fields=id,title,...
+    Prateleira "Mais lidos": ranking pré-calculado (reading/popularity.py), mesmo formato
+    das linhas do catálogo. Muda com o job de popularidade (sem bump de versão): TTL curto.
+    -> {"results": [...]}
+    """
+    fields, unknown = _parse_fields(request, CATALOG_FIELDS)
+    if unknown:
+        return JsonResponse({"detail": f"unknown fields: {', '.join(unknown)}"}, status=400)
+    try:
+        limit = int(request.GET.get("limit") or 14)
+    except ValueError:
+        return JsonResponse({"detail": "limit must be an integer"}, status=400)
+    limit = max(1, min(limit, POPULAR_LIMIT_MAX))
+
+    def build():
+        return 200, {"results": catalog_rows(fields, most_read(limit, catalog_queryset(fields)))}
+
+    ttl = settings.POPULAR_CACHE_TTL
+    if CATALOG_VOLATILE_FIELDS.intersection(fields):
+        ttl = min(ttl, settings.CATALOG_CACHE_VOLATILE_TTL)
+    return cached_json(request, f"popular:{limit}:{','.join(fields)}", build, ttl)
+
+
+# vizinho: mesmos campos/formato do catálogo + score
+SIMILAR_FIELDS = ("id", "title", "author", "genre", "book_type", "cover", "cover_srcset", "cover_placeholder")
+
+
+@require_GET
+@throttle("catalog")
+def book_similar_api(request, book_id: int):
+    """
+    GET /api/books/<id>/similar/
+    "Quem leu também leu": vizinhos pré-calculados (job compute_similar_books).
+    1 query: índice (book, position) + JOIN ao livro vizinho.
+    -> {"book_id": 1, "results": [{"id", "title", ..., "score"}]}
+    """
+    columns = [f"similar__{c}" for f in SIMILAR_FIELDS for c in CATALOG_FIELDS[f][0]]
+    rows = (
+        BookSimilarity.objects.filter(book_id=book_id)
+        .order_by("position")
+        .select_related("similar")
+        .only("score", "position", "similar", *columns)
     )
-    active_map = {r["book_id"]: r["active"] for r in active_aggs}
-
-    qs = Book.objects.all().order_by("-id")
-
-    data = []
-    for b in qs:
-        cover_url = ""
-        try:
-            if getattr(b, "cover", None) and b.cover.name:
-                cover_url = default_storage.url(b.cover.name)
-        except Exception:
-            cover_url = ""
-
-        created_at = None
-        try:
-            created_at = b.created_at.isoformat() if getattr(b, "created_at", None) else None
-        except Exception:
-            created_at = None
-
-        book_type = _get_book_type(b)
-
-        r = rating_map.get(b.id, {})
-        avg_rating = float(r.get("avg") or 0)
-        ratings_count = int(r.get("cnt") or 0)
-
-        readers_count = int(readers_map.get(b.id, 0) or 0)
-        active_readers = int(active_map.get(b.id, 0) or 0)
-
-        data.append({
-            "id": b.id,
-            "title": str(getattr(b, "title", "") or ""),
-            "author": str(getattr(b, "author", "") or ""),
-            "description": str(getattr(b, "description", "") or ""),
-            "genre": str(getattr(b, "genre", "") or ""),
-            "book_type": book_type,
-            "cover": cover_url,
-            "created_at": created_at,
-            "avg_rating": avg_rating,
-            "ratings_count": ratings_count,
-            "readers_count": readers_count,
-            "active_readers": active_readers,
-        })
+    getters = [(f, CATALOG_FIELDS[f][1]) for f in SIMILAR_FIELDS]
+    results = [{**{f: get(r.similar, {}) for f, get in getters}, "score": r.score} for r in rows]
 
-    return JsonResponse(data, safe=False)
+    resp = JsonResponse({"book_id": book_id, "results": results})
+    resp["Cache-Control"] = "public, max-age=300"
+    return resp
 
 
 @require_GET
@@ -168,20 +494,50 @@ def books_list(request):
 
 
 @require_GET
-def read_page_api(request, book_id: int, page_number: int):
-    # ✅ read SEMPRE exige login
-    if not request.user.is_authenticated:
-        return JsonResponse({"detail": "Auth required"}, status=401)
-
+@throttle("catalog")
+def books_access_api(request):
+    """
+    GET /api/books/access/?ids=1,2,3
+    Estado de acesso (unlocked/preview + gate) para vários livros num só pedido.
+    Anónimo recebe as regras de preview.
+    """
+    raw = (request.GET.get("ids") or "").strip()
     try:
-        book = Book.objects.get(id=book_id)
-    except Book.DoesNotExist:
-        return JsonResponse({"detail": "Book not found"}, status=404)
+        ids = [int(x) for x in raw.split(",") if x.strip()]
+    except ValueError:
+        return JsonResponse({"detail": "ids must be a comma-separated list of integers"}, status=400)
+
+    if not ids:
+        return JsonResponse({"detail": "ids is required"}, status=400)
+    if len(ids) > BOOKS_ACCESS_MAX_IDS:
+        return JsonResponse({"detail": f"max {BOOKS_ACCESS_MAX_IDS} ids per request"}, status=400)
+
+    access = _books_access(ids, request.user)
+    return JsonResponse({
+        "results": [access[i] for i in dict.fromkeys(ids) if i in access],
+    })
+
+
+def _page_book_qs(book_id: int, page_number: int):
+    # 1 query: livro + key da página pedida (em vez de Book.get + BookPage.get)
+    page_qs = BookPage.objects.filter(book_id=OuterRef("pk"), page_number=page_number)
+    return Book.objects.annotate(
+        page_image_key=Subquery(page_qs.values("image_key")[:1]),
+        page_is_public=Subquery(page_qs.values("is_public")[:1]),
+    ).filter(id=book_id)
+
+
+def _page_payload(book, user, ent, page_number: int):
+    """
+    Regras da página já com livro + direitos carregados (sem I/O).
+    200 sai com "page_image" a None: o URL assinado é pedido por quem chama.
+    """
+    if book is None:
+        return 404, {"detail": "Book not found"}
 
     book_type = _get_book_type(book)
     total_pages = int(getattr(book, "total_pages", 0) or 0)
-
-    allowed = _allowed_until_page(book, request.user)
+    allowed = _allowed_until_page(book, user, ent)
 
     # ✅ bloqueio (premium -> pagar; free -> partilhar)
     if page_number > allowed:
@@ -203,70 +559,164 @@ def read_page_api(request, book_id: int, page_number: int):
             blocked_payload["gate"] = "SHARE"
             blocked_payload["share_required"] = True
 
-        return JsonResponse(blocked_payload, status=403)
+        return 403, blocked_payload
 
-    # buscar página
-    try:
-        page = BookPage.objects.get(book=book, page_number=page_number)
-    except BookPage.DoesNotExist:
-        return JsonResponse({
+    # página (já veio na mesma query)
+    if not book.page_image_key:
+        return 404, {
             "detail": "Page not found",
             "page_number": page_number,
             "total_pages": total_pages,
-        }, status=404)
-
-    page_url = default_storage.url(page.image_key)
-
-    cover_url = ""
-    try:
-        if getattr(book, "cover", None) and book.cover.name:
-            cover_url = default_storage.url(book.cover.name)
-    except Exception:
-        cover_url = ""
+        }
 
-    return JsonResponse({
+    return 200, {
         "blocked": False,
         "book_id": book.id,
         "title": str(getattr(book, "title", "") or ""),
         "book_type": book_type,
-        "page_number": int(page.page_number),
+        "page_number": int(page_number),
         "total_pages": int(total_pages or 0),
         "allowed_until_page": int(allowed),
 
-        "page_image": page_url,
-        "cover_url": cover_url,
+        "page_image": None,
+        "cover_url": cover_url(book),
 
         # extras úteis
-        "share_unlocked": bool(_has_share_unlock(request.user, book)),
-        "has_subscription": bool(_has_active_subscription(request.user)),
-    })
+        "share_unlocked": bool(_has_share_unlock(user, book, ent)),
+        "has_subscription": bool(_has_active_subscription(user, ent)),
+    }
+
+
+def _read_page_payload(user, book_id: int, page_number: int):
+    """
+    Núcleo do read_page_api: devolve (status, payload) sem montar a resposta,
+    para ser reutilizado pelo bundle.
+    """
+    book = _page_book_qs(book_id, page_number).first()
+    # snapshot de direitos (cache) — usado por todas as regras
+    ent = get_entitlements(user) if book is not None else None
+    status, payload = _page_payload(book, user, ent, page_number)
+    if status == 200:
+        # URL assinado reaproveitado (cache) — estável entre pedidos
+        payload["page_image"] = signed_page_url(book.page_image_key, bool(book.page_is_public))
+    return status, payload
+
+
+async def _aread_page_payload(user, book_id: int, page_number: int):
+    # = _read_page_payload com ORM/cache async
+    book = await _page_book_qs(book_id, page_number).afirst()
+    ent = await aget_entitlements(user) if book is not None else None
+    status, payload = _page_payload(book, user, ent, page_number)
+    if status == 200:
+        payload["page_image"] = await asigned_page_url(book.page_image_key, bool(book.page_is_public))
+    return status, payload
+
+
+def _page_read(user_id: int, book_id: int, page_number: int, payload: dict) -> None:
+    # página servida: progresso (buffer) + aquecimento das seguintes
+    record_progress(user_id, book_id, page_number, payload["total_pages"])
+    warm_next_pages(user_id, book_id, page_number, payload["allowed_until_page"])
+
+
+@require_GET
+@throttle("read")
+async def read_page_api(request, book_id: int, page_number: int):
+    """
+    Async (servido pelo worker ASGI): ORM/cache sem ocupar uma thread à espera do DB.
+    """
+    # ✅ read SEMPRE exige login
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"detail": "Auth required"}, status=401)
+
+    status, payload = await _aread_page_payload(user, book_id, page_number)
+    if status == 200 and not _is_prefetch(request):
+        # buffer + cache (e flush imediato com FLUSH_SECONDS=0): fora do loop
+        await sync_to_async(_page_read)(user.id, book_id, page_number, payload)
+    return JsonResponse(payload, status=status)
+
+
+# comentários devolvidos no bundle (o resto via book_comments_api)
+BUNDLE_COMMENTS_LIMIT = 50
+
+
+@require_GET
+@throttle("read")
+def read_page_bundle_api(request, book_id: int, page_number: int):
+    """
+    GET /api/read/<book_id>/<page_number>/bundle/
+    Tudo o que o read.html precisa para abrir uma página num só pedido:
+    identidade do user + página + comentários (1ª página) + anotações.
+    Queries: livro/página (1) + comentários (1) + anotações (1).
+    O status HTTP é o da página (200/403/404).
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"detail": "Auth required"}, status=401)
+
+    u = request.user
+    status, page_payload = _read_page_payload(u, book_id, page_number)
+
+    comments = []
+    comments_has_more = False
+    annotations = []
+
+    # só mostra conversa de páginas que o user pode mesmo ver
+    if status == 200:
+        if not _is_prefetch(request):
+            _page_read(u.id, book_id, page_number, page_payload)
+
+        qs = (
+            BookComment.objects
+            .filter(book_id=book_id, page_number=page_number)
+            .select_related("user")
+            .order_by("-created_at")[:BUNDLE_COMMENTS_LIMIT + 1]
+        )
+        comments = [_comment_dict(c) for c in qs]
+        comments_has_more = len(comments) > BUNDLE_COMMENTS_LIMIT
+        comments = comments[:BUNDLE_COMMENTS_LIMIT]
+
+        qs = (
+            BookAnnotation.objects
+            .filter(book_id=book_id, page_number=page_number)
+            .select_related("user")
+            .order_by("-created_at")[:500]
+        )
+        annotations = [_annotation_dict(a, u) for a in qs]
+
+    return JsonResponse({
+        "me": {
+            "is_authenticated": True,
+            "id": u.id,
+            "username": u.get_username(),
+            "email": u.email or "",
+            "is_staff": bool(u.is_staff),
+            "is_superuser": bool(u.is_superuser),
+        },
+        "page": page_payload,
+        "comments": comments,
+        "comments_has_more": comments_has_more,
+        "annotations": annotations,
+    }, status=status)
 
 
 # =========================================================
 # Comentários
 # =========================================================
 @require_http_methods(["GET", "POST"])
-def book_comments_api(request, book_id: int):
-    if not request.user.is_authenticated:
+async def book_comments_api(request, book_id: int):
+    user = await request.auser()
+    if not user.is_authenticated:
         return JsonResponse({"detail": "Auth required"}, status=401)
 
     try:
-        book = Book.objects.get(id=book_id)
+        book = await Book.objects.only("id").aget(id=book_id)
     except Book.DoesNotExist:
         return JsonResponse({"detail": "Book not found"}, status=404)
 
     if request.method == "GET":
         page = int(request.GET.get("page") or 1)
         qs = BookComment.objects.filter(book=book, page_number=page).select_related("user").order_by("-created_at")[:200]
-        out = []
-        for c in qs:
-            out.append({
-                "id": c.id,
-                "text": c.text,
-                "user_label": _user_label(c.user),
-                "created_at": c.created_at.isoformat(),
-                "created_at_display": _created_at_display(c.created_at),
-            })
+        out = [_comment_dict(c) async for c in qs]
         return JsonResponse(out, safe=False)
 
     # POST
@@ -282,49 +732,33 @@ def book_comments_api(request, book_id: int):
     if not text:
         return JsonResponse({"detail": "text is required"}, status=400)
 
-    c = BookComment.objects.create(
+    c = await BookComment.objects.acreate(
         book=book,
         page_number=page_number,
-        user=request.user,
+        user=user,
         text=text
     )
-    return JsonResponse({
-        "id": c.id,
-        "text": c.text,
-        "user_label": _user_label(c.user),
-        "created_at": c.created_at.isoformat(),
-        "created_at_display": _created_at_display(c.created_at),
-    }, status=201)
+    return JsonResponse(_comment_dict(c), status=201)
 
 
 # =========================================================
 # Anotações
 # =========================================================
 @require_http_methods(["GET", "POST"])
-def book_annotations_api(request, book_id: int):
-    if not request.user.is_authenticated:
+async def book_annotations_api(request, book_id: int):
+    user = await request.auser()
+    if not user.is_authenticated:
         return JsonResponse({"detail": "Auth required"}, status=401)
 
     try:
-        book = Book.objects.get(id=book_id)
+        book = await Book.objects.only("id").aget(id=book_id)
     except Book.DoesNotExist:
         return JsonResponse({"detail": "Book not found"}, status=404)
 
     if request.method == "GET":
         page = int(request.GET.get("page") or 1)
         qs = BookAnnotation.objects.filter(book=book, page_number=page).select_related("user").order_by("-created_at")[:500]
-        out = []
-        for a in qs:
-            out.append({
-                "id": a.id,
-                "text": a.text,
-                "x": float(a.x),
-                "y": float(a.y),
-                "user_label": _user_label(a.user),
-                "created_at": a.created_at.isoformat(),
-                "created_at_display": _created_at_display(a.created_at),
-                "mine": bool(a.user_id == request.user.id),
-            })
+        out = [_annotation_dict(a, user) async for a in qs]
         return JsonResponse(out, safe=False)
 
     # POST
@@ -354,10 +788,10 @@ def book_annotations_api(request, book_id: int):
     x = max(0.0, min(1.0, x))
     y = max(0.0, min(1.0, y))
 
-    a = BookAnnotation.objects.create(
+    a = await BookAnnotation.objects.acreate(
         book=book,
         page_number=page_number,
-        user=request.user,
+        user=user,
         text=text,
         x=x,
         y=y
@@ -410,4 +844,134 @@ def book_unlock_share_api(request, book_id: int):
         "created": bool(created),
         "unlocked_at": obj.unlocked_at.isoformat(),
         "message": "Livro desbloqueado por partilha ✅"
-    })
\ No newline at end of file
+    })
+
+
+# =========================================================
+# Download offline (ZIP com as páginas permitidas)
+# =========================================================
+def _save_page_meta(pages, members) -> None:
+    """
+    Páginas antigas (antes de size_bytes/crc32; as novas já vêm do page_build):
+    tamanho/CRC medidos durante o 1º download -> os seguintes têm Content-Length/Range.
+    """
+    missing = [p for p in pages if p.size_bytes is None or p.crc32 is None]
+    measured = {m.name: m for m in members}
+    for p in missing:
+        m = measured[f"pages/{p.page_number:04d}.webp"]
+        p.size_bytes, p.crc32 = m.size, m.crc
+    if missing:
+        BookPage.objects.bulk_update(missing, ["size_bytes", "crc32"])
+
+
+@require_http_methods(["GET", "HEAD"])
+def book_offline_bundle_api(request, book_id: int):
+    """
+    GET /api/books/<id>/offline/
+    ZIP (manifest.json + pages/NNNN.webp) com as páginas que o user pode ler,
+    gerado em streaming a partir do storage. Suporta Range/If-Range para retomar.
+    Livro com páginas antigas sem tamanho/CRC: o 1º download vai sem Content-Length/Range
+    (mede-as enquanto passam; nunca no HEAD).
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"detail": "Auth required"}, status=401)
+
+    book = Book.objects.filter(id=book_id).first()
+    if book is None:
+        return JsonResponse({"detail": "Book not found"}, status=404)
+
+    allowed = _allowed_until_page(book, request.user)
+    pages = list(
+        BookPage.objects
+        .filter(book=book, page_number__lte=allowed)
+        .order_by("page_number")
+    )
+    if not pages:
+        return JsonResponse({"detail": "No pages available"}, status=404)
+
+    # manifest determinístico (sem URLs assinadas nem datas) -> mesmos bytes a cada pedido
+    manifest = {
+        "format": 1,
+        "book_id": book.id,
+        "title": str(book.title or ""),
+        "author": str(book.author or ""),
+        "book_type": _get_book_type(book),
+        "total_pages": int(book.total_pages or 0),
+        "allowed_until_page": int(allowed),
+        "pages": [
+            {
+                "page_number": p.page_number,
+                "file": f"pages/{p.page_number:04d}.webp",
+                "width": p.width,
+                "height": p.height,
+                "size": p.size_bytes,
+            }
+            for p in pages
+        ],
+    }
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False, sort_keys=True).encode("utf-8")
+
+    members = [ZipMember.from_bytes("manifest.json", manifest_bytes)]
+    for p in pages:
+        members.append(ZipMember(
+            f"pages/{p.page_number:04d}.webp",
+            p.size_bytes,
+            p.crc32,
+            opener=partial(storage_stream, page_storage(p.is_public), p.image_key),
+        ))
+
+    if not all(m.measured for m in members):
+        return _offline_unmeasured(request, book, pages, members)
+
+    segments, total = zip_layout(members)
+
+    digest = hashlib.md5(manifest_bytes)
+    for m in members:
+        digest.update(m.crc.to_bytes(4, "little"))
+    etag = f'"{digest.hexdigest()}"'
+
+    # If-Range: só retoma se o arquivo ainda for o mesmo (ex: não houve unlock entretanto)
+    rng = None
+    if_range = request.headers.get("If-Range")
+    if request.headers.get("Range") and (not if_range or if_range == etag):
+        rng = parse_range(request.headers["Range"], total)
+
+    if rng == "invalid":
+        resp = HttpResponse(status=416)
+        resp["Content-Range"] = f"bytes */{total}"
+        return resp
+
+    start, end = rng or (0, total - 1)
+
+    if request.method == "HEAD":
+        resp = HttpResponse(status=206 if rng else 200, content_type="application/zip")
+    else:
+        resp = StreamingHttpResponse(
+            streaming_content(iter_range(segments, start, end)),
+            status=206 if rng else 200,
+            content_type="application/zip",
+        )
+
+    resp["Content-Length"] = str(end - start + 1)
+    if rng:
+        resp["Content-Range"] = f"bytes {start}-{end}/{total}"
+    resp["Accept-Ranges"] = "bytes"
+    resp["ETag"] = etag
+    resp["Cache-Control"] = "private"
+    resp["Content-Disposition"] = f'attachment; filename="owlsight-{book.id}.zip"'
+    return resp
+
+
+def _offline_unmeasured(request, book, pages, members):
+    # sem layout prévio: Range ignorado (200 com o arquivo todo), sem ETag nem Content-Length
+    if request.method == "HEAD":
+        resp = StreamingHttpResponse((), content_type="application/zip")
+    else:
+        resp = StreamingHttpResponse(
+            streaming_content(zip_stream(members, on_measured=partial(_save_page_meta, pages))),
+            content_type="application/zip",
+        )
+    resp["Accept-Ranges"] = "none"
+    resp["Cache-Control"] = "private"
+    resp["Content-Disposition"] = f'attachment; filename="owlsight-{book.id}.zip"'
+    return resp
@@ -0,0 +1,128 @@
+import logging
+import math
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .media import page_image_url, use_public_media
+from .models import BookPage
+
+logger = logging.getLogger(__name__)
+
+# poucas threads: o trabalho é I/O (assinar + pedir ao CDN) e não pode roubar o worker
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="page-warm")
+
+
+def _url_cache_seconds() -> int:
+    # metade da validade da assinatura: quem recebe o link ainda tem tempo de o usar
+    expire = int(getattr(settings, "AWS_QUERYSTRING_EXPIRE", 3600) or 3600)
+    return max(60, expire // 2)
+
+
+def signed_page_url(image_key: str, is_public: bool = False) -> str:
+    """
+    URL da página, reaproveitada enquanto válida: poupa a assinatura e dá um URL
+    estável (o browser e o service worker conseguem fazer cache).
+    """
+    if is_public:
+        return page_image_url(image_key, True)
+
+    key = f"pageurl:v1:{image_key}"
+    url = cache.get(key)
+    if url is None:
+        url = page_image_url(image_key, False)
+        cache.set(key, url, _url_cache_seconds())
+    return url
+
+
+async def asigned_page_url(image_key: str, is_public: bool = False) -> str:
+    # igual a signed_page_url, com a cache pelos métodos async (assinar é só CPU local)
+    if is_public:
+        return page_image_url(image_key, True)
+
+    key = f"pageurl:v1:{image_key}"
+    url = await cache.aget(key)
+    if url is None:
+        url = page_image_url(image_key, False)
+        await cache.aset(key, url, _url_cache_seconds())
+    return url
+
+
+def _lookahead(user_id: int, book_id: int, page: int) -> range:
+    """
+    Páginas a aquecer, pela direção e ritmo de leitura deste user neste livro.
+    Estado em cache: última página, instante e ritmo (páginas/s, média móvel).
+    """
+    now = time.time()
+    state_key = f"readpace:v1:{user_id}:{book_id}"
+    prev = cache.get(state_key) or {}
+
+    direction = 1
+    rate = float(prev.get("rate") or 0.0)
+    if prev:
+        delta = page - int(prev.get("page") or page)
+        elapsed = max(0.5, now - float(prev.get("ts") or now))
+        if delta:
+            direction = 1 if delta > 0 else -1
+            rate = 0.7 * rate + 0.3 * (abs(delta) / elapsed)
+        else:
+            direction = int(prev.get("dir") or 1)
+
+    cache.set(state_key, {"page": page, "ts": now, "rate": rate, "dir": direction}, 60 * 60)
+
+    lo = int(getattr(settings, "PAGE_WARM_MIN_PAGES", 2))
+    hi = int(getattr(settings, "PAGE_WARM_MAX_PAGES", 8))
+    horizon = float(getattr(settings, "PAGE_WARM_HORIZON_SECONDS", 30))
+    k = max(lo, min(hi, math.ceil(rate * horizon)))
+
+    if direction > 0:
+        return range(page + 1, page + k + 1)
+    return range(max(1, page - k), page)
+
+
+def warm_next_pages(user_id: int, book_id: int, page: int, allowed_until: int) -> None:
+    """
+    Chamado depois de servir a página `page`: agenda (em background) a assinatura
+    e o aquecimento no CDN das próximas páginas que o user pode ler.
+    """
+    if int(getattr(settings, "PAGE_WARM_MAX_PAGES", 8)) <= 0:
+        return
+
+    pages = [p for p in _lookahead(user_id, book_id, page) if p <= allowed_until]
+    # a mesma página não é aquecida duas vezes enquanto o URL em cache for válido
+    pages = [p for p in pages if cache.add(f"pagewarm:v1:{book_id}:{p}", 1, _url_cache_seconds())]
+    if not pages:
+        return
+
+    try:
+        _executor.submit(_warm, book_id, pages)
+    except RuntimeError:
+        # executor a fechar (shutdown do worker)
+        pass
+
+
+def _warm(book_id: int, page_numbers) -> None:
+    try:
+        rows = BookPage.objects.filter(book_id=book_id, page_number__in=page_numbers).values_list(
+            "image_key", "is_public"
+        )
+        for image_key, is_public in rows:
+            url = signed_page_url(image_key, is_public)
+            if is_public and use_public_media():
+                _warm_cdn(url)
+    except Exception:
+        logger.exception("Falha ao aquecer páginas do livro %s", book_id)
+    finally:
+        connections.close_all()
+
+
+def _warm_cdn(url: str) -> None:
+    # um GET pelo CDN deixa a página na edge antes do leitor pedir
+    req = urllib.request.Request(url, headers={"User-Agent": "owlsight-warmer"})
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        while resp.read(64 * 1024):
+            pass
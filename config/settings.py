@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from urllib.parse import urlparse
 
 import dj_database_url
 from dotenv import load_dotenv
@@ -56,8 +57,11 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
 
-    # WhiteNoise para servir static no Railway
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise para servir static no Railway (com caminho async para o ASGI)
+    "core.middleware.StaticFilesMiddleware",
+
+    # pedidos em curso no worker (load shedding)
+    "books.throttling.InFlightMiddleware",
 
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -105,6 +109,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
+# "asgi" (uvicorn worker, views do leitor async) ou "wsgi" (gthread). Ver start.sh.
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi").lower()
+ASGI = SERVER_MODE == "asgi"
 
 
 # =========================
@@ -116,10 +124,20 @@ if DATABASE_URL:
     DATABASES = {
         "default": dj_database_url.config(
             default=DATABASE_URL,
-            conn_max_age=600,
+            # em ASGI cada pedido corre na sua própria thread: ligações persistentes
+            # ficavam presas a threads que já não existem (usar o pool abaixo)
+            conn_max_age=0 if ASGI else 600,
             ssl_require=os.getenv("DB_SSL_REQUIRE", "True").lower() in ("1", "true", "yes", "on"),
         )
     }
+    # Pool do psycopg (requer CONN_MAX_AGE=0): 0 = desligado
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "16" if ASGI else "0"))
+    if DB_POOL_MAX_SIZE > 0 and DATABASES["default"]["ENGINE"].endswith("postgresql"):
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": DB_POOL_MAX_SIZE,
+        }
 else:
     DATABASES = {
         "default": {
@@ -129,6 +147,107 @@ else:
     }
 
 
+# =========================
+# Cache (Redis se REDIS_URL existir / memória local)
+# =========================
+# Com mais de 1 worker, usar Redis: a invalidação (signals) tem de chegar a todos.
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "owlsight",
+        }
+    }
+
+
+# Progresso de leitura: segundos entre gravações em lote (0 = grava em cada página)
+READING_PROGRESS_FLUSH_SECONDS = float(os.getenv("READING_PROGRESS_FLUSH_SECONDS", "5"))
+
+
+# Aquecimento das próximas páginas (pré-assinar URLs / aquecer CDN) no read path.
+# O nº de páginas adapta-se ao ritmo do leitor entre MIN e MAX (MAX=0 desliga).
+PAGE_WARM_MIN_PAGES = int(os.getenv("PAGE_WARM_MIN_PAGES", "2"))
+PAGE_WARM_MAX_PAGES = int(os.getenv("PAGE_WARM_MAX_PAGES", "8"))
+PAGE_WARM_HORIZON_SECONDS = float(os.getenv("PAGE_WARM_HORIZON_SECONDS", "30"))
+
+# Leitor offline (service worker): limite do cache no browser e páginas pré-carregadas em Wi-Fi
+OFFLINE_CACHE_MAX_MB = int(os.getenv("OFFLINE_CACHE_MAX_MB", "150"))
+OFFLINE_PREFETCH_PAGES = int(os.getenv("OFFLINE_PREFETCH_PAGES", "5"))
+
+# Cache das respostas do catálogo (/api/books/): inválida por versão (Book/Tag/Rating);
+# páginas com leitores/ativos expiram ao fim de VOLATILE_TTL. WAIT = espera por outro rebuild.
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "3600"))
+CATALOG_CACHE_VOLATILE_TTL = int(os.getenv("CATALOG_CACHE_VOLATILE_TTL", "60"))
+CATALOG_CACHE_WAIT_SECONDS = float(os.getenv("CATALOG_CACHE_WAIT_SECONDS", "2"))
+# Índice do catálogo em memória (books/catalog_index.py): filtros/ordem/paginação sem DB.
+# Reconstruído quando a versão do catálogo muda (no 1º miss da cache dessa versão).
+# PRELOAD: carrega no wsgi.py (com `gunicorn --preload` fica partilhado entre workers).
+CATALOG_INDEX_PRELOAD = os.getenv("CATALOG_INDEX_PRELOAD", "0") == "1"
+
+# Feed de alterações do catálogo (books/changes.py): /api/books/changes/?since=<token>.
+# MAX = alterações por resposta; snapshot completo publicado a cada SNAPSHOT_SECONDS
+# (job `publish_catalog_snapshot --loop`); tokens anteriores ao mais antigo dos
+# SNAPSHOT_KEEP snapshots expiram (410).
+CATALOG_CHANGES_MAX = int(os.getenv("CATALOG_CHANGES_MAX", "500"))
+CATALOG_SNAPSHOT_SECONDS = int(os.getenv("CATALOG_SNAPSHOT_SECONDS", "21600"))
+CATALOG_SNAPSHOT_KEEP = int(os.getenv("CATALOG_SNAPSHOT_KEEP", "4"))
+
+# Home: moldura HTML anónima (os dados vêm das APIs, com cache própria).
+# TTL curto: os URLs com hash dos estáticos mudam a cada deploy.
+HOME_CACHE_TTL = int(os.getenv("HOME_CACHE_TTL", "300"))
+
+# Ranking "Mais lidos" (reading/popularity.py): job `compute_popularity --loop` (start.sh).
+# Leituras/avaliações valem metade a cada HALF_LIFE_DAYS; RATING_WEIGHT = peso de 1 avaliação de 5★.
+POPULARITY_REFRESH_SECONDS = int(os.getenv("POPULARITY_REFRESH_SECONDS", "900"))
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "7"))
+POPULARITY_RATING_WEIGHT = float(os.getenv("POPULARITY_RATING_WEIGHT", "0.5"))
+# /api/books/popular/ (prateleira "Mais lidos" da home): o ranking só muda quando o job corre
+POPULAR_CACHE_TTL = int(os.getenv("POPULAR_CACHE_TTL", "300"))
+
+# "Quem leu também leu" (reading/recommendations.py): job `compute_similar_books --loop`.
+# TOP_K vizinhos por livro; MIN_COMMON_READERS evita pares de um só leitor em comum.
+RECS_REFRESH_SECONDS = int(os.getenv("RECS_REFRESH_SECONDS", "3600"))
+RECS_TOP_K = int(os.getenv("RECS_TOP_K", "12"))
+RECS_MIN_COMMON_READERS = int(os.getenv("RECS_MIN_COMMON_READERS", "2"))
+
+# Pesquisa do catálogo (books/search.py): dicionário do Postgres (stemming/stopwords).
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", "portuguese")
+# /api/books/?q=: só os N mais relevantes entram nos filtros/ordem/paginação do índice
+CATALOG_SEARCH_MAX_RESULTS = int(os.getenv("CATALOG_SEARCH_MAX_RESULTS", "1000"))
+
+# Throttling (token bucket por user/IP em cache) + load shedding por prioridade.
+# THROTTLE_RATES: tier -> (burst, pedidos/minuto) por user; por IP multiplica por THROTTLE_IP_FACTOR.
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "1") == "1"
+THROTTLE_IP_FACTOR = int(os.getenv("THROTTLE_IP_FACTOR", "3"))
+# Proxies nossos à frente do app (Railway = 1): o IP do cliente é a entrada nº HOPS
+# a contar do fim do X-Forwarded-For. 0 = sem proxy, usa REMOTE_ADDR.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+THROTTLE_RATES = {
+    "read": (int(os.getenv("THROTTLE_READ_BURST", "40")), int(os.getenv("THROTTLE_READ_PER_MIN", "120"))),
+    "catalog": (int(os.getenv("THROTTLE_CATALOG_BURST", "20")), int(os.getenv("THROTTLE_CATALOG_PER_MIN", "30"))),
+    "analytics": (int(os.getenv("THROTTLE_ANALYTICS_BURST", "10")), int(os.getenv("THROTTLE_ANALYTICS_PER_MIN", "20"))),
+    # typeahead: 1 pedido por tecla (com debounce no cliente)
+    "suggest": (int(os.getenv("THROTTLE_SUGGEST_BURST", "30")), int(os.getenv("THROTTLE_SUGGEST_PER_MIN", "120"))),
+}
+# Pedidos em curso por worker e fração a partir da qual cada tier é cortado (503).
+# WSGI: = --threads do gunicorn. ASGI: não há teto de threads, a capacidade é o pool do DB.
+# A leitura ("read") não está na tabela: nunca é cortada.
+LOAD_SHED_CAPACITY = int(os.getenv(
+    "LOAD_SHED_CAPACITY", os.getenv("DB_POOL_MAX_SIZE", "16") if ASGI else os.getenv("GUNICORN_THREADS", "4")
+))
+SHED_THRESHOLDS = {"catalog": 0.75, "suggest": 0.75, "analytics": 0.5}
+LOAD_SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", "2"))
+
+
 # =========================
 # Password validation
 # =========================
@@ -214,6 +333,12 @@ USE_B2 = all([
     AWS_S3_ENDPOINT_URL,
 ])
 
+# Prefixo público no mesmo bucket (capas + páginas de prévia).
+# O CDN em AWS_S3_CUSTOM_DOMAIN só deve expor este prefixo; o resto fica privado.
+AWS_PUBLIC_LOCATION = os.getenv("AWS_PUBLIC_LOCATION", "public").strip("/")
+PUBLIC_MEDIA_CACHE_CONTROL = os.getenv("PUBLIC_MEDIA_CACHE_CONTROL", "public, max-age=31536000, immutable")
+USE_PUBLIC_MEDIA = USE_B2 and bool(AWS_S3_CUSTOM_DOMAIN)
+
 if USE_B2:
     STORAGES["default"] = {
         "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
@@ -221,13 +346,47 @@ if USE_B2:
             "default_acl": None,
             "querystring_auth": True,
             "file_overwrite": False,
+            # privado: sempre URL assinada no endpoint, nunca pelo domínio público
+            "custom_domain": None,
+        },
+    }
+
+if USE_PUBLIC_MEDIA:
+    # URLs sem assinatura -> cacheáveis no CDN (sem Django nem assinatura)
+    STORAGES["public"] = {
+        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+        "OPTIONS": {
+            "default_acl": None,
+            "querystring_auth": False,
+            "file_overwrite": False,
+            "location": AWS_PUBLIC_LOCATION,
+            "custom_domain": AWS_S3_CUSTOM_DOMAIN,
+            "object_parameters": {"CacheControl": PUBLIC_MEDIA_CACHE_CONTROL},
         },
     }
 
+if USE_B2:
     if AWS_S3_CUSTOM_DOMAIN:
         MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/"
     else:
         MEDIA_URL = f"{AWS_S3_ENDPOINT_URL.rstrip('/')}/{AWS_STORAGE_BUCKET_NAME}/"
+else:
+    # local/dev sem B2: disco. O "default" tem de existir sempre — o storage do
+    # Book.cover (public_storage) é resolvido quando o models.py é importado.
+    MEDIA_URL = "/media/"
+    MEDIA_ROOT = Path(os.getenv("MEDIA_ROOT", str(BASE_DIR / "media")))
+    STORAGES["default"] = {"BACKEND": "django.core.files.storage.FileSystemStorage"}
+
+# Origens de onde o browser busca páginas/capas (URLs assinadas no endpoint + CDN público).
+# O service worker faz fetch() delas: entram no connect-src da resposta do /sw.js.
+MEDIA_ORIGINS = []
+if USE_B2:
+    _endpoint = urlparse(AWS_S3_ENDPOINT_URL)
+    MEDIA_ORIGINS.append(f"{_endpoint.scheme}://{_endpoint.netloc}")
+    if AWS_S3_ADDRESSING_STYLE == "virtual":
+        MEDIA_ORIGINS.append(f"{_endpoint.scheme}://{AWS_STORAGE_BUCKET_NAME}.{_endpoint.netloc}")
+    if AWS_S3_CUSTOM_DOMAIN:
+        MEDIA_ORIGINS.append(f"https://{AWS_S3_CUSTOM_DOMAIN}")
 
 
 # =========================
@@ -308,6 +467,7 @@ AXES_ENABLE_ACCESS_FAILURE_LOG = True
 # - script-src https://accounts.google.com
 # - frame-src https://accounts.google.com (iframe/botão)
 # - connect-src para endpoints Google (às vezes)
+# O /sw.js acrescenta MEDIA_ORIGINS ao connect-src (ver frontend.views.service_worker).
 CONTENT_SECURITY_POLICY = {
     "DIRECTIVES": {
         "default-src": ("'self'",),
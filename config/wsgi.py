@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.CATALOG_INDEX_PRELOAD:
+    # antes do fork (gunicorn --preload): arrays partilhados copy-on-write pelos workers
+    from books.catalog_index import preload  # noqa: E402
+
+    preload()
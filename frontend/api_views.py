@@ -11,11 +11,12 @@ def csrf(request):
     return JsonResponse({"ok": True})
 
 @require_GET
-def me(request):
-    if not request.user.is_authenticated:
+async def me(request):
+    # async (worker ASGI): sessão + user pelo auser()
+    u = await request.auser()
+    if not u.is_authenticated:
         return JsonResponse({"is_authenticated": False}, status=200)
 
-    u = request.user
     return JsonResponse({
         "is_authenticated": True,
         "id": u.id,
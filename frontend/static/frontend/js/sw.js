@@ -0,0 +1,243 @@
+/* =========================================================
+   Owlsight — service worker (leitor offline)
+   A config (versão, precache, limites) vem de /sw.js, gerado pelo servidor:
+   self.OWLSIGHT_SW = { version, precache, max_bytes, prefetch_pages }
+   ========================================================= */
+const CFG = self.OWLSIGHT_SW || {};
+const VERSION = CFG.version || "dev";
+
+const STATIC_CACHE = `owlsight-static-${VERSION}`;
+const PAGES_CACHE = "owlsight-pages";   // imagens das páginas (imutáveis por key)
+const API_CACHE = "owlsight-api";       // bundle/read/comments/annotations (JSON)
+const META_CACHE = "owlsight-meta";     // tamanhos + último acesso (para despejo)
+const META_KEY = "/__owlsight_meta__";
+
+const MAX_BYTES = Number(CFG.max_bytes || 150 * 1024 * 1024);
+const PREFETCH_PAGES = Number(CFG.prefetch_pages || 5);
+// respostas opacas (imagens cross-origin sem CORS) não dizem o tamanho
+const OPAQUE_SIZE = 400 * 1024;
+
+const RE_PAGE_IMAGE = /\/pages\/\d+\/\d+\.webp$/;
+const RE_READER_API = /^\/api\/(read\/\d+\/\d+\/(bundle\/)?|books\/\d+\/(comments|annotations)\/)$/;
+const RE_BOOK_ID = /^\/api\/(?:read|books|favorites\/toggle|ratings)\/(\d+)\//;
+// páginas ou APIs de login/logout/registo (POST /login/ sem logout também troca de conta)
+const RE_AUTH = /^\/(?:api\/auth\/)?(?:login|logout|register)\/$/;
+
+
+/* ---------- install / activate ---------- */
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(STATIC_CACHE)
+      .then((c) => c.addAll(CFG.precache || []))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil((async () => {
+    const names = await caches.keys();
+    await Promise.all(
+      names
+        .filter((n) => n.startsWith("owlsight-static-") && n !== STATIC_CACHE)
+        .map((n) => caches.delete(n))
+    );
+    await self.clients.claim();
+  })());
+});
+
+
+/* ---------- metadados (LRU por tamanho) ---------- */
+let metaQueue = Promise.resolve();
+
+function withMeta(fn){
+  // serializa leituras/escritas do mapa de metadados
+  metaQueue = metaQueue.then(async () => {
+    const cache = await caches.open(META_CACHE);
+    const res = await cache.match(META_KEY);
+    const meta = res ? await res.json().catch(() => ({})) : {};
+    const changed = await fn(meta);
+    if(changed !== false){
+      await cache.put(META_KEY, new Response(JSON.stringify(meta), {
+        headers: { "Content-Type": "application/json" },
+      }));
+    }
+  }).catch(() => {});
+  return metaQueue;
+}
+
+async function responseSize(res){
+  if(res.type === "opaque") return OPAQUE_SIZE;
+  const len = Number(res.headers.get("Content-Length") || 0);
+  if(len > 0) return len;
+  const blob = await res.clone().blob().catch(() => null);
+  return blob ? blob.size : 0;
+}
+
+async function evictIfNeeded(meta){
+  let total = Object.values(meta).reduce((acc, m) => acc + (m.size || 0), 0);
+  if(total <= MAX_BYTES) return;
+
+  const oldestFirst = Object.entries(meta).sort((a, b) => (a[1].ts || 0) - (b[1].ts || 0));
+  for(const [key, m] of oldestFirst){
+    if(total <= MAX_BYTES) break;
+    await caches.open(m.cache).then((c) => c.delete(key));
+    total -= (m.size || 0);
+    delete meta[key];
+  }
+}
+
+async function putTracked(cacheName, key, res){
+  const size = await responseSize(res);
+  const cache = await caches.open(cacheName);
+  await cache.put(key, res);
+  await withMeta(async (meta) => {
+    meta[key] = { cache: cacheName, size, ts: Date.now() };
+    await evictIfNeeded(meta);
+  });
+}
+
+function touch(key){
+  withMeta((meta) => {
+    if(!meta[key]) return false;
+    meta[key].ts = Date.now();
+  });
+}
+
+
+/* ---------- estratégias ---------- */
+function pageImageKey(url){
+  // URLs assinadas mudam a cada pedido: a key é só origem + caminho
+  const u = new URL(url);
+  return u.origin + u.pathname;
+}
+
+async function cacheFirstImage(request){
+  const key = pageImageKey(request.url);
+  const cache = await caches.open(PAGES_CACHE);
+  const hit = await cache.match(key);
+  if(hit){ touch(key); return hit; }
+
+  const res = await fetch(request);
+  if(res.ok || res.type === "opaque"){
+    await putTracked(PAGES_CACHE, key, res.clone());
+  }
+  return res;
+}
+
+async function staleWhileRevalidate(event){
+  const request = event.request;
+  const cache = await caches.open(API_CACHE);
+  const hit = await cache.match(request.url);
+
+  const network = fetch(request).then(async (res) => {
+    if(res.ok) await putTracked(API_CACHE, request.url, res.clone());
+    return res;
+  });
+
+  if(hit){
+    touch(request.url);
+    event.waitUntil(network.catch(() => null));
+    return hit;
+  }
+  return network;
+}
+
+async function cacheFirstStatic(request){
+  const hit = await caches.match(request, { cacheName: STATIC_CACHE });
+  return hit || fetch(request);
+}
+
+async function purgeApi(bookId){
+  // depois de POST/DELETE: respostas em cache deste livro (ou todas) ficaram velhas
+  const cache = await caches.open(API_CACHE);
+  const keys = await cache.keys();
+  await Promise.all(keys.map((req) => {
+    const path = new URL(req.url).pathname;
+    const m = path.match(RE_BOOK_ID);
+    if(bookId && (!m || m[1] !== String(bookId))) return null;
+    return cache.delete(req);
+  }));
+}
+
+
+/* ---------- fetch ---------- */
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+  const sameOrigin = url.origin === self.location.origin;
+
+  const isAuth = sameOrigin && RE_AUTH.test(url.pathname);
+
+  if(request.method !== "GET"){
+    if(sameOrigin && (url.pathname.startsWith("/api/") || isAuth)){
+      const m = url.pathname.match(RE_BOOK_ID);
+      event.respondWith(fetch(request).then(async (res) => {
+        // login/logout/registo = troca de conta: não servir dados do user anterior
+        await purgeApi(isAuth ? null : (m ? m[1] : null));
+        return res;
+      }));
+    }
+    return;
+  }
+
+  if(isAuth && request.mode === "navigate"){
+    // GET /logout/ (link): limpa também
+    event.waitUntil(purgeApi(null));
+    return;
+  }
+
+  if(request.destination === "image" && RE_PAGE_IMAGE.test(url.pathname)){
+    event.respondWith(cacheFirstImage(request));
+    return;
+  }
+
+  if(sameOrigin && RE_READER_API.test(url.pathname)){
+    event.respondWith(staleWhileRevalidate(event));
+    return;
+  }
+
+  if(sameOrigin && (CFG.precache || []).includes(url.pathname)){
+    event.respondWith(cacheFirstStatic(request));
+  }
+});
+
+
+/* ---------- prefetch das próximas páginas (pedido pelo read.html em Wi-Fi) ---------- */
+async function prefetchPages(bookId, fromPage){
+  const api = await caches.open(API_CACHE);
+  const pages = await caches.open(PAGES_CACHE);
+
+  for(let p = fromPage + 1; p <= fromPage + PREFETCH_PAGES; p++){
+    const bundleUrl = new URL(`/api/read/${bookId}/${p}/bundle/`, self.location.origin).href;
+
+    let data = null;
+    const hit = await api.match(bundleUrl);
+    if(hit){
+      data = await hit.json().catch(() => null);
+    }else{
+      // "Purpose: prefetch" -> o servidor não conta como página lida
+      const res = await fetch(bundleUrl, { credentials: "same-origin", headers: { "Purpose": "prefetch" } });
+      if(!res.ok) break;  // bloqueada / fim do livro
+      await putTracked(API_CACHE, bundleUrl, res.clone());
+      data = await res.json().catch(() => null);
+    }
+
+    const img = data && data.page && data.page.page_image;
+    if(!img) continue;
+
+    const key = pageImageKey(new URL(img, self.location.origin).href);
+    if(await pages.match(key)) continue;
+
+    const res = await fetch(img, { mode: "no-cors", credentials: "omit" }).catch(() => null);
+    if(res && (res.ok || res.type === "opaque")){
+      await putTracked(PAGES_CACHE, key, res);
+    }
+  }
+}
+
+self.addEventListener("message", (event) => {
+  const msg = event.data || {};
+  if(msg.type === "prefetch" && msg.book_id && msg.from_page){
+    event.waitUntil(prefetchPages(Number(msg.book_id), Number(msg.from_page)).catch(() => null));
+  }
+});
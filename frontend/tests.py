@@ -1,3 +1,59 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+# sem HTTPS nem collectstatic nos testes
+TEST_SETTINGS = override_settings(
+    SECURE_SSL_REDIRECT=False,
+    STORAGES={**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+)
+
+
+@TEST_SETTINGS
+class ServiceWorkerTests(TestCase):
+    def _connect_src(self, resp):
+        policy = resp["Content-Security-Policy"]
+        for directive in policy.split(";"):
+            parts = directive.split()
+            if parts and parts[0] == "connect-src":
+                return parts[1:]
+        self.fail(f"sem connect-src: {policy}")
+
+    @override_settings(MEDIA_ORIGINS=["https://s3.eu-central-003.backblazeb2.com", "https://cdn.example.com"])
+    def test_sw_connect_src_allows_media_origins(self):
+        resp = self.client.get("/sw.js")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Cache-Control"], "no-cache")
+        connect = self._connect_src(resp)
+        self.assertIn("'self'", connect)
+        self.assertIn("https://s3.eu-central-003.backblazeb2.com", connect)
+        self.assertIn("https://cdn.example.com", connect)
+
+    @override_settings(MEDIA_ORIGINS=["https://cdn.example.com"])
+    def test_media_origins_only_on_sw(self):
+        # as páginas normais ficam com o connect-src base
+        resp = self.client.get("/categories/")
+        self.assertNotIn("https://cdn.example.com", self._connect_src(resp))
+
+
+@TEST_SETTINGS
+class HomePageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_shell_cached_once_for_any_filters(self):
+        # filtros/pesquisa são lidos do URL no browser: o HTML é o mesmo
+        first = self.client.get("/?q=lisboa&genre=drama")
+        self.assertEqual(first.status_code, 200)
+        self.assertContains(first, 'id="rowPopular"')
+        with self.assertNumQueries(0):
+            second = self.client.get("/?type=premium")
+        self.assertEqual(second.content, first.content)
+
+    def test_logged_in_page_renders_menu(self):
+        user = get_user_model().objects.create_user("leitor", password="x")
+        self.client.force_login(user)
+        resp = self.client.get("/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "csrfmiddlewaretoken")
@@ -14,6 +14,7 @@ from .views import (
     account_view,
     terms_view,
     privacy_view,
+    service_worker,
 )
 
 from .views_auth import OwlsightLoginView, owlsight_logout
@@ -26,6 +27,9 @@ urlpatterns = [
     path("", home, name="home"),
     path("index/", home, name="index"),
 
+    # Service worker (leitor offline) — tem de estar na raiz para o scope "/"
+    path("sw.js", service_worker, name="service_worker"),
+
     # 🔐 LOGIN SEGURO (Class-Based View)
     path("login/", OwlsightLoginView.as_view(), name="login"),
 
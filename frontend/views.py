@@ -1,11 +1,19 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.cache import never_cache
-from django.db.models import Q
 from django.contrib.auth import logout
 from django.shortcuts import redirect
+from csp.decorators import csp_update
 
-from books.models import Book
+from books.catalog import cached_page
 
 
 @ensure_csrf_cookie
@@ -13,54 +21,18 @@ from books.models import Book
 def home(request):
     """
     ✅ Página pública real (sem fake).
-    ✅ Puxa livros do banco.
-    ✅ Featured + listagens reais.
-    ✅ Filtro simples por GET (q, type, tag, sort).
+    ✅ O HTML é só a moldura: catálogo, pesquisa, filtros e "Mais lidos" vêm das APIs
+       (/api/books/, /api/books/popular/, /api/books/facets/), também os filtros do URL.
+    ✅ Visitante anónimo: página inteira em cache (igual para todos);
+       o que é do user (favoritos, progresso, acesso) vem depois pelas APIs.
+    ✅ Com login: só o menu é renderizado por user.
     """
-    q = (request.GET.get("q") or "").strip()
-    book_type = (request.GET.get("type") or "").strip()      # free | premium
-    tag = (request.GET.get("tag") or "").strip()
-    sort = (request.GET.get("sort") or "recentes").strip()   # recentes | antigos | titulo
-
-    qs = Book.objects.all().prefetch_related("tags")
-
-    if q:
-        qs = qs.filter(
-            Q(title__icontains=q) |
-            Q(author__icontains=q) |
-            Q(genre__icontains=q) |
-            Q(description__icontains=q)
-        )
-
-    if book_type in ("free", "premium"):
-        qs = qs.filter(book_type=book_type)
-
-    if tag:
-        qs = qs.filter(tags__name__iexact=tag)
-
-    if sort == "antigos":
-        qs = qs.order_by("created_at")
-    elif sort == "titulo":
-        qs = qs.order_by("title")
-    else:
-        qs = qs.order_by("-created_at")
-
-    featured = qs.first()
-    most_recent = qs[:8]
-
-    # “Mais lidos”: você ainda não tem campo de views/reads no Book.
-    # Então por enquanto é uma lista separada mas real (mais recentes também).
-    most_read = Book.objects.all().order_by("-created_at")[:8]
-
-    ctx = {
-        "featured": featured,
-        "most_recent": most_recent,
-        "most_read": most_read,
-        "books": qs[:30],  # resultados principais
-        "db_books_count": qs.count(),
-        "db_mode": True,
-    }
-    return render(request, "frontend/index.html", ctx)
+    def render_page():
+        return render_to_string("frontend/index.html", {"db_mode": True}, request=request)
+
+    if not request.user.is_authenticated:
+        return cached_page(request, "home", lambda: (200, render_page()), settings.HOME_CACHE_TTL)
+    return HttpResponse(render_page())
 
 
 @ensure_csrf_cookie
@@ -126,4 +98,41 @@ def privacy_view(request):
 
 def logout_view(request):
     logout(request)
-    return redirect("/")
\ No newline at end of file
+    return redirect("/")
+
+
+# arquivos estáticos que o leitor precisa mesmo offline
+SW_PRECACHE = [
+    "frontend/images/logo.png",
+    "frontend/images/favicon.png",
+    "frontend/images/favicon.ico",
+]
+
+
+@require_GET
+def service_worker(request):
+    """
+    /sw.js na raiz (scope "/"): só a config gerada pelo servidor;
+    a lógica está em static/frontend/js/sw.js (hash do manifest -> nova versão).
+    """
+    worker_url = static("frontend/js/sw.js")
+    precache = [static(p) for p in SW_PRECACHE]
+    version = hashlib.md5(json.dumps([worker_url, precache]).encode("utf-8")).hexdigest()[:10]
+
+    config = {
+        "version": version,
+        "precache": precache,
+        "max_bytes": int(settings.OFFLINE_CACHE_MAX_MB) * 1024 * 1024,
+        "prefetch_pages": int(settings.OFFLINE_PREFETCH_PAGES),
+    }
+    body = (
+        f"self.OWLSIGHT_SW = {json.dumps(config)};\n"
+        f"importScripts({json.dumps(worker_url)});\n"
+    )
+    resp = HttpResponse(body, content_type="application/javascript; charset=utf-8")
+    # o browser tem de revalidar sempre para apanhar versões novas
+    resp["Cache-Control"] = "no-cache"
+    # o CSP desta resposta é o do worker: sem as origens do B2/CDN no connect-src,
+    # o fetch() das imagens das páginas (cacheFirstImage/prefetch) era bloqueado
+    allow_media = csp_update({"connect-src": list(settings.MEDIA_ORIGINS)})
+    return allow_media(lambda _request: resp)(request)
@@ -0,0 +1,82 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ReadingProgress
+
+# Leitores ativos por livro em baldes de 1 hora (conjuntos exatos de user ids).
+# Uma key por hora: {book_id: [user_id, ...]}; expira sozinha depois da janela.
+WINDOW_HOURS = 24
+_BUCKET_TTL = (WINDOW_HOURS + 1) * 3600
+_SEEDED_KEY = "activereaders:v1:seeded"
+
+
+def _hour(ts: float = None) -> int:
+    return int((time.time() if ts is None else ts) // 3600)
+
+
+def _bucket_key(hour: int) -> str:
+    return f"activereaders:v1:{hour}"
+
+
+def _merge(hour: int, pairs) -> None:
+    # read-modify-write: chamado no flush do progresso (lotes, poucas vezes por minuto)
+    key = _bucket_key(hour)
+    bucket = cache.get(key) or {}
+    changed = False
+    for user_id, book_id in pairs:
+        users = set(bucket.get(book_id, ()))
+        if user_id not in users:
+            users.add(user_id)
+            bucket[book_id] = sorted(users)
+            changed = True
+    if changed:
+        cache.set(key, bucket, _BUCKET_TTL)
+
+
+def mark_active(pairs) -> None:
+    """
+    Regista (user_id, book_id) como ativos na hora corrente.
+    """
+    pairs = [(int(u), int(b)) for u, b in pairs]
+    if pairs:
+        _ensure_seeded()
+        _merge(_hour(), pairs)
+
+
+def _ensure_seeded() -> None:
+    """
+    Cache fria (deploy/restart): reconstrói os baldes a partir do ReadingProgress, uma vez.
+    """
+    if not cache.add(_SEEDED_KEY, 1, _BUCKET_TTL):
+        return
+
+    since = timezone.now() - timedelta(hours=WINDOW_HOURS)
+    by_hour = {}
+    rows = (
+        ReadingProgress.objects.filter(updated_at__gte=since)
+        .values_list("user_id", "book_id", "updated_at")
+        .iterator(chunk_size=2000)
+    )
+    for user_id, book_id, updated_at in rows:
+        by_hour.setdefault(_hour(updated_at.timestamp()), []).append((user_id, book_id))
+    for hour, pairs in by_hour.items():
+        _merge(hour, pairs)
+
+
+def active_readers() -> dict:
+    """
+    {book_id: nº de leitores distintos nas últimas WINDOW_HOURS horas}.
+    Custo: 1 get_many de WINDOW_HOURS keys, independente do tamanho das tabelas.
+    """
+    _ensure_seeded()
+
+    now = _hour()
+    keys = [_bucket_key(h) for h in range(now - WINDOW_HOURS + 1, now + 1)]
+    readers = {}
+    for bucket in cache.get_many(keys).values():
+        for book_id, users in bucket.items():
+            readers.setdefault(book_id, set()).update(users)
+    return {book_id: len(users) for book_id, users in readers.items()}
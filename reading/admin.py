@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ReadingProgress, Favorite, Rating
+from .models import ReadingProgress, Favorite, Rating, BookStats, BookPopularity, BookSimilarity
 
 
 @admin.register(ReadingProgress)
@@ -23,4 +23,24 @@ class RatingAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "book", "stars", "updated_at")
     list_filter = ("stars", "updated_at")
     search_fields = ("user__username", "user__email", "book__title")
-    autocomplete_fields = ("user", "book")
\ No newline at end of file
+    autocomplete_fields = ("user", "book")
+
+@admin.register(BookStats)
+class BookStatsAdmin(admin.ModelAdmin):
+    list_display = ("book", "rating_count", "rating_sum", "readers_count", "updated_at")
+    search_fields = ("book__title",)
+    readonly_fields = ("book", "rating_sum", "rating_count", "readers_count", "updated_at")
+
+
+@admin.register(BookPopularity)
+class BookPopularityAdmin(admin.ModelAdmin):
+    list_display = ("rank", "book", "score", "computed_at")
+    search_fields = ("book__title",)
+    readonly_fields = ("book", "score", "rank", "computed_at")
+
+
+@admin.register(BookSimilarity)
+class BookSimilarityAdmin(admin.ModelAdmin):
+    list_display = ("book", "position", "similar", "score")
+    search_fields = ("book__title",)
+    readonly_fields = ("book", "similar", "position", "score")
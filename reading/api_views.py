@@ -4,39 +4,232 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_GET, require_POST
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.db.models import Avg, Count
 
 from .models import Favorite, Rating, ReadingProgress
+from .progress import pending_progress
+from .stats import book_rating
+from books.entitlements import get_entitlements
 from books.models import Book
+from books.streaming import STREAM_CHUNK_SIZE, stream_json_array
+from books.views import book_access, catalog_columns, catalog_rows
+
+
+# campos do livro nas listas do utilizador (cartão: título, capa, tipo)
+LIBRARY_BOOK_FIELDS = ("id", "title", "author", "genre", "book_type", "cover", "cover_srcset", "cover_placeholder")
+LIBRARY_PAGE_SIZE = 24
+LIBRARY_PAGE_MAX = 100
+
+
+def _library_columns(prefix: str = "") -> list:
+    # + total_pages para o acesso (prévia/desbloqueado)
+    return catalog_columns(LIBRARY_BOOK_FIELDS, prefix) + [prefix + "total_pages"]
+
+
+def _library_books(book_ids) -> dict:
+    if not book_ids:
+        return {}
+    return Book.objects.only(*_library_columns()).in_bulk(list(book_ids))
+
+
+def _book_card(book) -> dict:
+    return catalog_rows(LIBRARY_BOOK_FIELDS, [book])[0]
+
+
+def _progress_dict(last_page, percent, updated_at) -> dict:
+    return {
+        "last_page": last_page,
+        "progress_percent": percent,
+        "updated_at": updated_at.isoformat() if updated_at else None,
+    }
 
 
 @login_required
 @require_GET
-def progress_me(request):
+async def progress_me(request):
+    """
+    Async (worker ASGI): ORM async e a resposta emitida em blocos pelo aiterator.
+    """
+    user = await request.auser()
+    # ✅ o livro vem no mesmo SELECT (só as colunas do cartão)
     qs = (
         ReadingProgress.objects
-        .filter(user=request.user)
+        .filter(user=user)
         .select_related("book")
+        .only("id", "book_id", "last_page", "progress_percent", "updated_at", *_library_columns("book__"))
         .order_by("-updated_at")
     )
 
-    data = []
-    for p in qs:
-        data.append({
+    # páginas lidas há poucos segundos ainda podem estar só no buffer
+    pending = pending_progress(user.id)
+
+    # livros que só existem no buffer (ainda sem linha) vão primeiro
+    saved = {
+        book_id async for book_id in
+        ReadingProgress.objects.filter(user=user, book_id__in=pending).values_list("book_id", flat=True)
+    } if pending else set()
+    new_ids = [book_id for book_id in pending if book_id not in saved]
+    fresh_books = await Book.objects.only(*_library_columns()).ain_bulk(new_ids) if new_ids else {}
+    fresh = [
+        {
+            "book_id": book_id,
+            "last_page": last_page,
+            "progress_percent": percent,
+            "updated_at": None,
+            "book": _book_card(fresh_books[book_id]),
+        }
+        for book_id, (last_page, percent) in pending.items() if book_id in fresh_books
+    ]
+
+    def row(p):
+        last_page, percent = pending.get(p.book_id, (p.last_page, p.progress_percent))
+        return {
             "book_id": p.book_id,
-            "last_page": p.last_page,
-            "progress_percent": p.progress_percent,
+            "last_page": last_page,
+            "progress_percent": percent,
             "updated_at": p.updated_at.isoformat() if p.updated_at else None,
-        })
-    return JsonResponse(data, safe=False)
+            "book": _book_card(p.book),
+        }
+
+    async def rows():
+        for item in fresh:
+            yield item
+        async for p in qs.aiterator(chunk_size=STREAM_CHUNK_SIZE):
+            yield row(p)
+
+    return stream_json_array(rows())
+
+
+LIBRARY_SHELVES = ("favorites", "reading")
+
+
+@login_required
+@require_GET
+def library_me(request):
+    """
+    GET /api/library/me/?shelf=favorites|reading&limit=24&cursor=...
+    Favoritos ou livros em leitura já juntos com o cartão do livro, o progresso,
+    o favorito e o acesso (prévia/desbloqueado): substitui juntar
+    favorites/me + progress/me + /api/books/ no browser.
+    - favorites: mais recentes primeiro, cursor = id do favorito
+    - reading: último lido primeiro (só < 100%), cursor = posição
+    Queries por página: 1 (lista + livro) + 1 (progresso ou favoritos) + direitos (em cache).
+    -> {"results": [{"book": {...}, "favorite", "progress": {...} | null, "access": {...}}], "next_cursor"}
+    """
+    shelf = (request.GET.get("shelf") or "favorites").strip()
+    if shelf not in LIBRARY_SHELVES:
+        return JsonResponse({"detail": f"shelf must be one of: {', '.join(LIBRARY_SHELVES)}"}, status=400)
+    try:
+        limit = int(request.GET.get("limit") or LIBRARY_PAGE_SIZE)
+        cursor = int(request.GET.get("cursor")) if request.GET.get("cursor") else None
+    except ValueError:
+        return JsonResponse({"detail": "limit and cursor must be integers"}, status=400)
+    limit = max(1, min(limit, LIBRARY_PAGE_MAX))
+
+    user = request.user
+    pending = pending_progress(user.id)
+    if shelf == "favorites":
+        entries, next_cursor = _library_favorites(user, pending, limit, cursor)
+    else:
+        entries, next_cursor = _library_reading(user, pending, limit, cursor)
+
+    ent = get_entitlements(user)
+    results = [
+        {
+            "book": _book_card(book),
+            "favorite": favorite,
+            "progress": progress,
+            "access": book_access(book, user, ent),
+        }
+        for book, favorite, progress in entries
+    ]
+    return JsonResponse({"results": results, "next_cursor": next_cursor})
+
+
+def _library_favorites(user, pending, limit: int, cursor):
+    qs = (
+        Favorite.objects.filter(user=user)
+        .select_related("book")
+        .only("id", "book_id", *_library_columns("book__"))
+        .order_by("-id")
+    )
+    if cursor is not None:
+        qs = qs.filter(id__lt=cursor)
+    favorites = list(qs[:limit + 1])
+    has_more = len(favorites) > limit
+    favorites = favorites[:limit]
+
+    book_ids = [f.book_id for f in favorites]
+    saved = {
+        book_id: _progress_dict(last_page, percent, updated_at)
+        for book_id, last_page, percent, updated_at in ReadingProgress.objects
+        .filter(user=user, book_id__in=book_ids)
+        .values_list("book_id", "last_page", "progress_percent", "updated_at")
+    }
+
+    entries = []
+    for f in favorites:
+        progress = saved.get(f.book_id)
+        if f.book_id in pending:
+            # buffer (páginas lidas há segundos) ganha à linha gravada
+            last_page, percent = pending[f.book_id]
+            progress = _progress_dict(last_page, percent, None)
+        entries.append((f.book, True, progress))
+    return entries, (str(favorites[-1].id) if has_more and favorites else None)
+
+
+def _library_reading(user, pending, limit: int, cursor):
+    qs = (
+        ReadingProgress.objects.filter(user=user, progress_percent__lt=100)
+        .select_related("book")
+        .only("id", "book_id", "last_page", "progress_percent", "updated_at", *_library_columns("book__"))
+        .order_by("-updated_at", "-id")
+    )
+
+    # livros só no buffer (ainda sem linha) vão à frente, só na 1ª página (sem cursor);
+    # o cursor conta só linhas gravadas
+    offset = max(cursor or 0, 0)
+    fresh = []
+    if pending and cursor is None:
+        saved = set(
+            ReadingProgress.objects.filter(user=user, book_id__in=pending).values_list("book_id", flat=True)
+        )
+        fresh_books = _library_books([book_id for book_id in pending if book_id not in saved])
+        fresh = [
+            (fresh_books[book_id], _progress_dict(last_page, percent, None))
+            for book_id, (last_page, percent) in pending.items()
+            if book_id in fresh_books and percent < 100
+        ][:limit]
+
+    rows = list(qs[offset:offset + limit - len(fresh) + 1])
+    has_more = len(rows) > limit - len(fresh)
+    rows = rows[:limit - len(fresh)]
+
+    items = fresh + [
+        (p.book, _progress_dict(*pending.get(p.book_id, (p.last_page, p.progress_percent)), p.updated_at))
+        for p in rows
+    ]
+    book_ids = [book.id for book, _ in items]
+    favorites = set(Favorite.objects.filter(user=user, book_id__in=book_ids).values_list("book_id", flat=True))
+
+    entries = [(book, book.id in favorites, progress) for book, progress in items]
+    return entries, (str(offset + len(rows)) if has_more else None)
 
 
 @login_required
 @require_GET
-def favorites_me(request):
-    qs = Favorite.objects.filter(user=request.user).values_list("book_id", flat=True)
-    data = [{"book_id": int(bid)} for bid in qs]
-    return JsonResponse(data, safe=False)
+async def favorites_me(request):
+    """
+    Async como progress_me: ids lidos pelo aiterator e emitidos em blocos
+    (um gerador síncrono aqui seria juntado em memória pelo ASGI).
+    """
+    user = await request.auser()
+    qs = Favorite.objects.filter(user=user).values_list("book_id", flat=True)
+
+    async def rows():
+        async for book_id in qs.aiterator(chunk_size=STREAM_CHUNK_SIZE):
+            yield {"book_id": int(book_id)}
+
+    return stream_json_array(rows())
 
 
 @login_required
@@ -78,13 +271,10 @@ def rate_book(request, book_id: int):
         defaults={"stars": stars},
     )
 
-    # devolve médias atualizadas (opcional, mas útil)
-    agg = Rating.objects.filter(book=book).aggregate(
-        avg=Avg("stars"),
-        cnt=Count("id"),
-    )
+    # devolve médias atualizadas (já somadas no BookStats pelo signal do Rating)
+    avg, cnt = book_rating(book.id)
     return JsonResponse({
         "ok": True,
-        "avg_rating": float(agg["avg"] or 0),
-        "ratings_count": int(agg["cnt"] or 0),
+        "avg_rating": avg,
+        "ratings_count": cnt,
     })
\ No newline at end of file
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ReadingConfig(AppConfig):
     name = 'reading'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reading.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula o ranking de popularidade (leituras + avaliações com decaimento no tempo) "
+        "usado na prateleira \"Mais lidos\"."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Repete a cada POPULARITY_REFRESH_SECONDS (processo em background).",
+        )
+
+    def handle(self, *args, **options):
+        every = settings.POPULARITY_REFRESH_SECONDS if options["loop"] else 0
+        while True:
+            started = time.monotonic()
+            try:
+                n = refresh_popularity()
+                self.stdout.write(self.style.SUCCESS(
+                    f"{n} livros no ranking ({time.monotonic() - started:.2f}s)."
+                ))
+            except Exception as exc:
+                if not every:
+                    raise
+                # em loop: uma falha (ex: DB em restart) não mata o job
+                self.stderr.write(f"Falha a recalcular a popularidade: {exc}")
+            if not every:
+                return
+            time.sleep(max(every - (time.monotonic() - started), 1))
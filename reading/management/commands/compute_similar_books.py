@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reading.recommendations import refresh_similar_books
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os livros semelhantes (co-ocorrência de leituras/favoritos/avaliações) "
+        "servidos em /api/books/<id>/similar/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Repete a cada RECS_REFRESH_SECONDS (processo em background).",
+        )
+
+    def handle(self, *args, **options):
+        every = settings.RECS_REFRESH_SECONDS if options["loop"] else 0
+        while True:
+            started = time.monotonic()
+            try:
+                n = refresh_similar_books()
+                self.stdout.write(self.style.SUCCESS(
+                    f"{n} vizinhos guardados ({time.monotonic() - started:.2f}s)."
+                ))
+            except Exception as exc:
+                if not every:
+                    raise
+                # em loop: uma falha (ex: DB em restart) não mata o job
+                self.stderr.write(f"Falha a recalcular os livros semelhantes: {exc}")
+            if not every:
+                return
+            time.sleep(max(every - (time.monotonic() - started), 1))
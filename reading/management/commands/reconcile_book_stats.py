@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from books.catalog import bump_catalog_version
+from books.models import Book
+from reading.models import BookStats
+from reading.stats import compute_stats
+
+FIELDS = ("rating_sum", "rating_count", "readers_count")
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula BookStats a partir de Rating/ReadingProgress e corrige desvios "
+        "(ex: flush de progresso concorrente, alterações feitas fora do ORM)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--book", type=int, help="Só este livro (id).")
+        parser.add_argument("--dry-run", action="store_true", help="Só mostra o que mudaria.")
+
+    def handle(self, *args, **options):
+        book_ids = list(Book.objects.order_by("id").values_list("id", flat=True))
+        if options.get("book"):
+            book_ids = [b for b in book_ids if b == options["book"]]
+
+        real = compute_stats(book_ids)
+        current = {s.book_id: s for s in BookStats.objects.filter(book_id__in=book_ids)}
+        zero = dict.fromkeys(FIELDS, 0)
+
+        to_create, to_update = [], []
+        for book_id in book_ids:
+            values = real.get(book_id, zero)
+            st = current.get(book_id)
+
+            if st is None:
+                if values != zero:
+                    to_create.append(BookStats(book_id=book_id, **values))
+                    self.stdout.write(f"livro {book_id}: sem linha -> {values}")
+                continue
+
+            drift = {f: (getattr(st, f), values[f]) for f in FIELDS if getattr(st, f) != values[f]}
+            if drift:
+                self.stdout.write(f"livro {book_id}: " + ", ".join(f"{f} {a}->{b}" for f, (a, b) in drift.items()))
+                for f in FIELDS:
+                    setattr(st, f, values[f])
+                to_update.append(st)
+
+        if not options["dry_run"]:
+            BookStats.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+            BookStats.objects.bulk_update(to_update, FIELDS, batch_size=500)
+            if to_create or to_update:
+                bump_catalog_version()
+
+        prefix = "[dry-run] " if options["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{len(to_create)} criadas, {len(to_update)} corrigidas, {len(book_ids)} livros verificados."
+        ))
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.2 on 2026-10-19 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    BookStats = apps.get_model("reading", "BookStats")
+    Rating = apps.get_model("reading", "Rating")
+    ReadingProgress = apps.get_model("reading", "ReadingProgress")
+
+    stats = {}
+    for r in Rating.objects.values("book_id").annotate(s=Sum("stars"), c=Count("id")):
+        st = stats.setdefault(r["book_id"], BookStats(book_id=r["book_id"]))
+        st.rating_sum = int(r["s"] or 0)
+        st.rating_count = int(r["c"] or 0)
+    for r in ReadingProgress.objects.values("book_id").annotate(c=Count("id")):
+        st = stats.setdefault(r["book_id"], BookStats(book_id=r["book_id"]))
+        st.readers_count = int(r["c"] or 0)
+
+    BookStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_bookpage_size_bytes_crc32'),
+        ('reading', '0004_remove_bookpageimage_image_url_bookpageimage_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='books.book')),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('readers_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
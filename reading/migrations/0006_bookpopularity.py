@@ -0,0 +1,27 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_book_search_vector'),
+        ('reading', '0005_bookstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookPopularity',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='books.book')),
+                ('score', models.FloatField(default=0)),
+                ('rank', models.PositiveIntegerField(db_index=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ('rank',),
+            },
+        ),
+    ]
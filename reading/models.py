@@ -34,6 +34,55 @@ class Rating(models.Model):
         unique_together = ("user", "book")
 
 
+# Contadores por livro mantidos incrementalmente (ver stats.py): o catálogo lê
+# isto em vez de agregar Rating/ReadingProgress inteiros em cada pedido.
+class BookStats(models.Model):
+    book = models.OneToOneField("books.Book", on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    readers_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def avg_rating(self) -> float:
+        if not self.rating_count:
+            return 0.0
+        return self.rating_sum / self.rating_count
+
+    def __str__(self):
+        return f"stats {self.book_id}"
+
+
+# Ranking de popularidade pré-calculado (ver popularity.py, job periódico):
+# a prateleira "Mais lidos" lê o top-N daqui em vez de agregar em cada pedido.
+class BookPopularity(models.Model):
+    book = models.OneToOneField("books.Book", on_delete=models.CASCADE, primary_key=True, related_name="popularity")
+    score = models.FloatField(default=0)
+    rank = models.PositiveIntegerField(db_index=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ("rank",)
+
+    def __str__(self):
+        return f"#{self.rank} {self.book_id}"
+
+
+# "Quem leu também leu": top-k vizinhos por livro (ver recommendations.py, job offline).
+# Leitura = 1 lookup pelo índice (book, position).
+class BookSimilarity(models.Model):
+    book = models.ForeignKey("books.Book", on_delete=models.CASCADE, related_name="similar_books")
+    similar = models.ForeignKey("books.Book", on_delete=models.CASCADE, related_name="+")
+    position = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ("book", "position")
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.similar_id} ({self.position})"
+
+
 # ✅ NOVO: cada página como imagem (vai para o mesmo storage do Django: Backblaze)
 class BookPageImage(models.Model):
     book = models.ForeignKey("books.Book", on_delete=models.CASCADE, related_name="page_images")
@@ -0,0 +1,85 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from books.models import Book
+from .models import BookPopularity, Rating, ReadingProgress
+
+# =========================================================
+# Popularidade = leituras + avaliações, com decaimento exponencial no tempo:
+#   peso = 0.5 ** (idade / meia-vida)
+#   score = Σ leitores (peso da última atividade) + RATING_WEIGHT * Σ (estrelas/5 * peso)
+# Calculado de uma vez (NumPy) sobre todas as linhas e gravado em BookPopularity.
+# =========================================================
+_ROW = [("book", "i8"), ("ts", "f8")]
+_RATING_ROW = [("book", "i8"), ("stars", "f8"), ("ts", "f8")]
+
+
+def _decay(ts: np.ndarray, now: float) -> np.ndarray:
+    half_life = settings.POPULARITY_HALF_LIFE_DAYS * 86400.0
+    age = np.maximum(now - ts, 0.0)
+    return np.exp2(-age / half_life)
+
+
+def _load_progress() -> np.ndarray:
+    rows = ReadingProgress.objects.values_list("book_id", "updated_at").iterator(chunk_size=5000)
+    return np.fromiter(((b, u.timestamp()) for b, u in rows), dtype=_ROW)
+
+
+def _load_ratings() -> np.ndarray:
+    rows = Rating.objects.values_list("book_id", "stars", "updated_at").iterator(chunk_size=5000)
+    return np.fromiter(((b, s, u.timestamp()) for b, s, u in rows), dtype=_RATING_ROW)
+
+
+def compute_scores(progress: np.ndarray, ratings: np.ndarray, now: float):
+    """
+    -> (book_ids, scores) ordenados do mais popular para o menos (empate: id maior primeiro).
+    Só livros com alguma atividade.
+    """
+    book_ids, inverse = np.unique(np.concatenate([progress["book"], ratings["book"]]), return_inverse=True)
+    n_progress = len(progress)
+
+    reads = np.bincount(inverse[:n_progress], weights=_decay(progress["ts"], now), minlength=len(book_ids))
+    rating_weights = ratings["stars"] / 5.0 * _decay(ratings["ts"], now)
+    rated = np.bincount(inverse[n_progress:], weights=rating_weights, minlength=len(book_ids))
+    scores = reads + settings.POPULARITY_RATING_WEIGHT * rated
+
+    order = np.lexsort((-book_ids, -scores))
+    return book_ids[order], scores[order]
+
+
+def refresh_popularity() -> int:
+    """
+    Recalcula o ranking inteiro e substitui a tabela (numa transação). Devolve o nº de livros.
+    """
+    now = timezone.now()
+    book_ids, scores = compute_scores(_load_progress(), _load_ratings(), now.timestamp())
+
+    with transaction.atomic():
+        # livros apagados entretanto ficam de fora (FK)
+        existing = set(Book.objects.values_list("id", flat=True))
+        rows = [
+            BookPopularity(book_id=book_id, score=score, rank=rank, computed_at=now)
+            for rank, (book_id, score) in enumerate(
+                ((b, s) for b, s in zip(book_ids.tolist(), scores.tolist()) if b in existing), start=1
+            )
+        ]
+        BookPopularity.objects.all().delete()
+        BookPopularity.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def most_read(limit: int, qs=None):
+    """
+    Top-N do ranking pré-calculado (1 query). Poucos livros com atividade (ou job
+    ainda não correu): completa com os mais recentes.
+    `qs`: queryset base (ex: só as colunas do catálogo).
+    """
+    qs = Book.objects.all() if qs is None else qs
+    books = list(qs.filter(popularity__rank__lte=limit).order_by("popularity__rank"))
+    if len(books) < limit:
+        books += list(
+            qs.exclude(id__in=[b.id for b in books]).order_by("-created_at", "-id")[:limit - len(books)]
+        )
+    return books
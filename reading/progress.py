@@ -0,0 +1,148 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+
+from .active import mark_active
+from .models import ReadingProgress
+from .stats import bump_stats
+
+logger = logging.getLogger(__name__)
+
+
+# Buffer em memória (por worker): (user_id, book_id) -> (last_page, progress_percent).
+# Folhear depressa só guarda a última página; o flush grava tudo num único upsert.
+_lock = threading.Lock()
+_buffer = {}
+_timer = None
+
+# falha a gravar: nova tentativa no máximo daqui a isto (também com FLUSH_SECONDS=0)
+RETRY_MIN_SECONDS = 1.0
+
+
+def _flush_interval() -> float:
+    return float(getattr(settings, "READING_PROGRESS_FLUSH_SECONDS", 5))
+
+
+def _schedule(delay: float) -> None:
+    # chamar com _lock: um só timer por worker
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(delay, _flush_from_timer)
+        _timer.daemon = True
+        _timer.start()
+
+
+def progress_percent(page: int, total_pages: int) -> int:
+    total = int(total_pages or 0)
+    if total <= 0:
+        return 0
+    return max(0, min(100, int(round((page / total) * 100))))
+
+
+def record_progress(user_id: int, book_id: int, page: int, total_pages: int) -> None:
+    """
+    Regista a página lida. Não toca no DB: o flush acontece no máximo
+    READING_PROGRESS_FLUSH_SECONDS depois (0 = grava já, útil em testes).
+    """
+    entry = (int(page), progress_percent(page, total_pages))
+    interval = _flush_interval()
+
+    with _lock:
+        _buffer[(int(user_id), int(book_id))] = entry
+        if interval > 0:
+            _schedule(interval)
+
+    if interval <= 0:
+        flush_progress()
+
+
+def pending_progress(user_id: int) -> dict:
+    """
+    Entradas ainda não gravadas deste user: {book_id: (last_page, progress_percent)}.
+    """
+    with _lock:
+        return {bid: v for (uid, bid), v in _buffer.items() if uid == int(user_id)}
+
+
+def flush_progress() -> int:
+    """
+    Grava o buffer com um único bulk upsert. Devolve o nº de linhas.
+    """
+    global _buffer, _timer
+
+    with _lock:
+        items, _buffer = _buffer, {}
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+
+    if not items:
+        return 0
+
+    rows = [
+        ReadingProgress(user_id=uid, book_id=bid, last_page=page, progress_percent=percent)
+        for (uid, bid), (page, percent) in items.items()
+    ]
+    try:
+        new_pairs = _new_pairs(items.keys())
+        ReadingProgress.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["user", "book"],
+            update_fields=["last_page", "progress_percent", "updated_at"],
+        )
+    except IntegrityError:
+        # ex: livro/user apagado entretanto — não reenviar para não envenenar o buffer
+        logger.exception("Progresso de leitura descartado (%s linhas).", len(rows))
+        return 0
+    except Exception:
+        logger.exception("Falha ao gravar progresso de leitura (%s linhas); volta ao buffer.", len(rows))
+        with _lock:
+            # não pisa entradas mais recentes que chegaram entretanto
+            for key, value in items.items():
+                _buffer.setdefault(key, value)
+            # o timer foi cancelado antes da escrita: sem isto ficavam à espera do próximo record_progress
+            _schedule(max(_flush_interval(), RETRY_MIN_SECONDS))
+        return 0
+
+    try:
+        mark_active(items.keys())
+    except Exception:
+        logger.exception("Falha ao registar leitores ativos.")
+
+    # bulk_create não dispara signals: leitores novos contam-se aqui
+    new_readers = Counter(bid for _, bid in new_pairs)
+    for book_id, n in new_readers.items():
+        try:
+            bump_stats(book_id, readers_count=n)
+        except Exception:
+            logger.exception("Falha ao atualizar BookStats do livro %s.", book_id)
+
+    return len(rows)
+
+
+def _new_pairs(keys) -> set:
+    """
+    (user_id, book_id) do lote que ainda não têm linha de progresso (= leitores novos).
+    """
+    keys = set(keys)
+    existing = ReadingProgress.objects.filter(
+        user_id__in={uid for uid, _ in keys},
+        book_id__in={bid for _, bid in keys},
+    ).values_list("user_id", "book_id")
+    return keys - set(existing)
+
+
+def _flush_from_timer():
+    try:
+        flush_progress()
+    finally:
+        # thread própria -> conexão própria; não deixar aberta
+        connections.close_all()
+
+
+atexit.register(flush_progress)
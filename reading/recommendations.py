@@ -0,0 +1,145 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from books.models import Book
+from .models import BookSimilarity, Favorite, Rating, ReadingProgress
+
+# =========================================================
+# "Quem leu também leu": similaridade item-item por co-ocorrência.
+# Matriz users x livros (esparsa, em arrays COO) com peso por interação:
+#   leitura 1.0 | favorito 2.0 | avaliação >= 4★ 1.5 (fica o maior por user/livro)
+# co[a, b] = Σ_users w[u,a] * w[u,b]   (= X^T X, só pares que existem)
+# score    = co[a, b] / sqrt(Σ w[:,a]² * Σ w[:,b]²)   (cosseno)
+# Guarda os top-k vizinhos de cada livro em BookSimilarity.
+# =========================================================
+READ_WEIGHT = 1.0
+FAVORITE_WEIGHT = 2.0
+GOOD_RATING_WEIGHT = 1.5
+GOOD_RATING_MIN_STARS = 4
+
+# users com muitos livros: só os de maior peso (pares crescem com n²)
+MAX_ITEMS_PER_USER = 200
+# pares acumulados antes de reduzir (np.unique + bincount)
+_PAIR_CHUNK = 2_000_000
+
+_ROW = [("user", "i8"), ("book", "i8"), ("w", "f8")]
+
+
+def _load_interactions() -> np.ndarray:
+    progress = ReadingProgress.objects.values_list("user_id", "book_id").iterator(chunk_size=5000)
+    favorites = Favorite.objects.values_list("user_id", "book_id").iterator(chunk_size=5000)
+    ratings = (
+        Rating.objects.filter(stars__gte=GOOD_RATING_MIN_STARS)
+        .values_list("user_id", "book_id")
+        .iterator(chunk_size=5000)
+    )
+    parts = [
+        np.fromiter(((u, b, READ_WEIGHT) for u, b in progress), dtype=_ROW),
+        np.fromiter(((u, b, FAVORITE_WEIGHT) for u, b in favorites), dtype=_ROW),
+        np.fromiter(((u, b, GOOD_RATING_WEIGHT) for u, b in ratings), dtype=_ROW),
+    ]
+    rows = np.concatenate(parts)
+
+    # um peso por (user, livro): o maior
+    order = np.lexsort((-rows["w"], rows["book"], rows["user"]))
+    rows = rows[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows["user"][1:] != rows["user"][:-1]) | (rows["book"][1:] != rows["book"][:-1])
+    return rows[first]
+
+
+def _reduce(codes, weights, counts):
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    return (
+        uniq,
+        np.bincount(inverse, weights=weights, minlength=len(uniq)),
+        np.bincount(inverse, weights=counts, minlength=len(uniq)),
+    )
+
+
+def cooccurrence(users: np.ndarray, items: np.ndarray, weights: np.ndarray, n_items: int):
+    """
+    Pares (a < b) com co-ocorrência > 0.
+    -> (a, b, soma dos produtos de pesos, nº de users em comum)
+    `users` ordenado; `items` são índices densos 0..n_items-1.
+    """
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if len(users) else np.zeros(0, dtype=int)
+    ends = np.r_[starts[1:], len(users)]
+
+    acc = (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+    buf_codes, buf_w, pending = [], [], 0
+    triu = {}
+
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        n = end - start
+        if n < 2:
+            continue
+        its, ws = items[start:end], weights[start:end]
+        if n > MAX_ITEMS_PER_USER:
+            keep = np.argsort(-ws, kind="stable")[:MAX_ITEMS_PER_USER]
+            its, ws, n = its[keep], ws[keep], MAX_ITEMS_PER_USER
+        if n not in triu:
+            triu[n] = np.triu_indices(n, 1)
+        i, j = triu[n]
+        a, b = np.minimum(its[i], its[j]), np.maximum(its[i], its[j])
+        buf_codes.append(a * n_items + b)
+        buf_w.append(ws[i] * ws[j])
+        pending += len(i)
+
+        if pending >= _PAIR_CHUNK:
+            codes, w = np.concatenate(buf_codes), np.concatenate(buf_w)
+            acc = _reduce(np.r_[acc[0], codes], np.r_[acc[1], w], np.r_[acc[2], np.ones(len(codes))])
+            buf_codes, buf_w, pending = [], [], 0
+
+    if buf_codes:
+        codes, w = np.concatenate(buf_codes), np.concatenate(buf_w)
+        acc = _reduce(np.r_[acc[0], codes], np.r_[acc[1], w], np.r_[acc[2], np.ones(len(codes))])
+
+    codes, co, common = acc
+    return codes // n_items, codes % n_items, co, common
+
+
+def top_k_neighbours(a, b, scores, k: int):
+    """
+    Pares simétricos -> top-k por livro de origem.
+    -> (src, dst, position, score), ordenado por src e position.
+    """
+    src, dst, sc = np.r_[a, b], np.r_[b, a], np.r_[scores, scores]
+    order = np.lexsort((dst, -sc, src))
+    src, dst, sc = src[order], dst[order], sc[order]
+
+    group_start = np.r_[True, src[1:] != src[:-1]] if len(src) else np.zeros(0, dtype=bool)
+    idx = np.arange(len(src))
+    position = idx - np.maximum.accumulate(np.where(group_start, idx, 0))
+    keep = position < k
+    return src[keep], dst[keep], position[keep], sc[keep]
+
+
+def refresh_similar_books() -> int:
+    """
+    Recalcula os vizinhos de todos os livros e substitui a tabela. Devolve o nº de linhas.
+    """
+    rows = _load_interactions()
+    book_ids, items = np.unique(rows["book"], return_inverse=True)
+    weights = rows["w"]
+    norms = np.sqrt(np.bincount(items, weights=weights * weights, minlength=len(book_ids)))
+
+    a, b, co, common = cooccurrence(rows["user"], items, weights, len(book_ids))
+    strong = common >= settings.RECS_MIN_COMMON_READERS
+    a, b, co = a[strong], b[strong], co[strong]
+    scores = co / (norms[a] * norms[b])
+
+    src, dst, position, sc = top_k_neighbours(a, b, scores, settings.RECS_TOP_K)
+
+    with transaction.atomic():
+        # livros apagados entretanto ficam de fora (FK)
+        existing = set(Book.objects.values_list("id", flat=True))
+        objs = [
+            BookSimilarity(book_id=s, similar_id=d, position=p, score=round(v, 6))
+            for s, d, p, v in zip(book_ids[src].tolist(), book_ids[dst].tolist(), position.tolist(), sc.tolist())
+            if s in existing and d in existing
+        ]
+        BookSimilarity.objects.all().delete()
+        BookSimilarity.objects.bulk_create(objs, batch_size=2000)
+    return len(objs)
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from books.catalog import bump_catalog_version
+
+from .models import Rating, ReadingProgress
+from .stats import bump_stats
+
+
+# estrelas com que o rating foi carregado: o delta no save sai sem query extra
+@receiver(post_init, sender=Rating)
+def _rating_loaded(sender, instance, **kwargs):
+    # __dict__: com .only()/defer() não dispara query
+    instance._stats_stars = instance.__dict__.get("stars") if instance.pk else None
+
+
+@receiver(post_save, sender=Rating)
+def _rating_saved(sender, instance, created, **kwargs):
+    new = int(instance.stars or 0)
+    if created:
+        bump_stats(instance.book_id, rating_sum=new, rating_count=1)
+    else:
+        old = getattr(instance, "_stats_stars", None)
+        if old is None:
+            # instância montada à mão (sem valor anterior conhecido): o reconcile corrige
+            old = new
+        bump_stats(instance.book_id, rating_sum=new - int(old))
+    instance._stats_stars = new
+    # média/nº de avaliações mudaram: o catálogo em cache fica velho
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Rating)
+def _rating_deleted(sender, instance, **kwargs):
+    old = getattr(instance, "_stats_stars", None)
+    bump_stats(instance.book_id, rating_sum=-int(old if old is not None else instance.stars or 0), rating_count=-1)
+    bump_catalog_version()
+
+
+# progresso: só criar/apagar muda o nº de leitores.
+# O flush em lote (progress.py) usa bulk_create, que não dispara signals: conta lá.
+@receiver(post_save, sender=ReadingProgress)
+def _progress_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_stats(instance.book_id, readers_count=1)
+
+
+@receiver(post_delete, sender=ReadingProgress)
+def _progress_deleted(sender, instance, **kwargs):
+    bump_stats(instance.book_id, readers_count=-1)
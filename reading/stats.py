@@ -0,0 +1,70 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+
+from .models import BookStats, Rating, ReadingProgress
+
+
+def compute_stats(book_ids=None) -> dict:
+    """
+    Valores reais a partir das tabelas (usado ao criar a linha e no reconcile).
+    {book_id: {"rating_sum", "rating_count", "readers_count"}}
+    """
+    ratings = Rating.objects.all()
+    progress = ReadingProgress.objects.all()
+    if book_ids is not None:
+        ratings = ratings.filter(book_id__in=book_ids)
+        progress = progress.filter(book_id__in=book_ids)
+
+    out = {}
+    for r in ratings.values("book_id").annotate(s=Sum("stars"), c=Count("id")):
+        out.setdefault(r["book_id"], {"rating_sum": 0, "rating_count": 0, "readers_count": 0})
+        out[r["book_id"]].update(rating_sum=int(r["s"] or 0), rating_count=int(r["c"] or 0))
+    # (user, book) é único: nº de linhas = nº de leitores
+    for r in progress.values("book_id").annotate(c=Count("id")):
+        out.setdefault(r["book_id"], {"rating_sum": 0, "rating_count": 0, "readers_count": 0})
+        out[r["book_id"]]["readers_count"] = int(r["c"] or 0)
+    return out
+
+
+def _apply(book_id: int, rating_sum: int, rating_count: int, readers_count: int) -> int:
+    # nunca abaixo de 0 (colunas positivas): se houver desvio, o reconcile acerta
+    return BookStats.objects.filter(book_id=book_id).update(
+        rating_sum=Greatest(F("rating_sum") + rating_sum, 0),
+        rating_count=Greatest(F("rating_count") + rating_count, 0),
+        readers_count=Greatest(F("readers_count") + readers_count, 0),
+    )
+
+
+def bump_stats(book_id: int, rating_sum: int = 0, rating_count: int = 0, readers_count: int = 0) -> None:
+    """
+    Soma os deltas à linha do livro (UPDATE com F(), sem ler antes).
+    Sem linha ainda: cria-a com os valores reais, que já incluem esta alteração.
+    """
+    if not (rating_sum or rating_count or readers_count):
+        return
+
+    if _apply(book_id, rating_sum, rating_count, readers_count):
+        return
+
+    # só remoções (ex: livro/user a ser apagado em cascata): não há nada a criar
+    if rating_count <= 0 and readers_count <= 0 and rating_sum <= 0:
+        return
+
+    values = compute_stats([book_id]).get(book_id, {})
+    try:
+        with transaction.atomic():
+            BookStats.objects.create(book_id=book_id, **values)
+    except IntegrityError:
+        # outro pedido criou a linha entretanto
+        _apply(book_id, rating_sum, rating_count, readers_count)
+
+
+def book_rating(book_id: int):
+    """
+    (média, nº de votos) lidos da linha de stats.
+    """
+    st = BookStats.objects.filter(book_id=book_id).only("rating_sum", "rating_count").first()
+    if st is None:
+        return 0.0, 0
+    return float(st.avg_rating), int(st.rating_count)
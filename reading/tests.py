@@ -1,3 +1,228 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import OperationalError
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+
+from books.models import Book, BookShareUnlock
+
+from . import progress
+from .models import BookStats, Favorite, Rating, ReadingProgress
+from .stats import compute_stats
+
+# sem HTTPS nem collectstatic nos testes
+TEST_SETTINGS = override_settings(
+    SECURE_SSL_REDIRECT=False,
+    STORAGES={**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    THROTTLE_ENABLED=False,
+    READING_PROGRESS_FLUSH_SECONDS=0,
+)
+
+
+# timer longo: nos testes o flush é sempre chamado à mão
+@override_settings(READING_PROGRESS_FLUSH_SECONDS=60)
+class ProgressBufferTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("leitor", password="x")
+        self.book = Book.objects.create(title="Livro", total_pages=10)
+
+    def tearDown(self):
+        with progress._lock:
+            if progress._timer is not None:
+                progress._timer.cancel()
+            progress._timer = None
+            progress._buffer.clear()
+
+    def test_pages_coalesce_into_one_upsert(self):
+        for page in (1, 2, 3):
+            progress.record_progress(self.user.id, self.book.id, page, 10)
+        self.assertEqual(progress.pending_progress(self.user.id), {self.book.id: (3, 30)})
+        self.assertIsNotNone(progress._timer)
+
+        self.assertEqual(progress.flush_progress(), 1)
+        row = ReadingProgress.objects.get(user=self.user, book=self.book)
+        self.assertEqual((row.last_page, row.progress_percent), (3, 30))
+        self.assertEqual(progress.pending_progress(self.user.id), {})
+        self.assertIsNone(progress._timer)
+
+    def test_failed_flush_keeps_rows_and_rearms_timer(self):
+        progress.record_progress(self.user.id, self.book.id, 4, 10)
+        with mock.patch.object(ReadingProgress.objects, "bulk_create", side_effect=OperationalError("down")), \
+                self.assertLogs("reading.progress", "ERROR"):
+            self.assertEqual(progress.flush_progress(), 0)
+
+        # de volta ao buffer, com nova tentativa agendada
+        self.assertEqual(progress.pending_progress(self.user.id), {self.book.id: (4, 40)})
+        self.assertIsNotNone(progress._timer)
+        self.assertTrue(progress._timer.is_alive())
+
+        # página mais recente que chegue entretanto não é pisada pela antiga
+        progress.record_progress(self.user.id, self.book.id, 5, 10)
+        self.assertEqual(progress.flush_progress(), 1)
+        self.assertEqual(ReadingProgress.objects.get(user=self.user, book=self.book).last_page, 5)
+        self.assertIsNone(progress._timer)
+
+    @override_settings(READING_PROGRESS_FLUSH_SECONDS=0)
+    def test_failed_immediate_flush_still_retries(self):
+        with mock.patch.object(ReadingProgress.objects, "bulk_create", side_effect=OperationalError("down")), \
+                self.assertLogs("reading.progress", "ERROR"):
+            progress.record_progress(self.user.id, self.book.id, 2, 10)
+        self.assertEqual(progress._timer.interval, progress.RETRY_MIN_SECONDS)
+        self.assertEqual(progress.flush_progress(), 1)
+
+
+@TEST_SETTINGS
+class FavoritesMeTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("leitor", password="x")
+        self.books = [Book.objects.create(title=f"L{i}", total_pages=3) for i in range(3)]
+        for book in self.books[:2]:
+            Favorite.objects.create(user=self.user, book=book)
+        other = get_user_model().objects.create_user("outro", password="x")
+        Favorite.objects.create(user=other, book=self.books[2])
+
+    @override_settings(ASGI=True)
+    def test_streams_async_under_asgi(self):
+        async def fetch():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            resp = await client.get("/api/favorites/me/")
+            return resp, b"".join([c async for c in resp.streaming_content])
+
+        resp, content = async_to_sync(fetch)()
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_async)
+        self.assertEqual(
+            sorted(r["book_id"] for r in json.loads(content)), sorted(b.id for b in self.books[:2]),
+        )
+
+    def test_requires_login(self):
+        self.assertEqual(self.client.get("/api/favorites/me/").status_code, 302)
+
+
+class BookStatsTests(TestCase):
+    """Contadores incrementais (signals + flush do progresso) = agregados reais."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [User.objects.create_user(f"u{i}", password="x") for i in range(3)]
+        self.book = Book.objects.create(title="Livro", total_pages=10)
+
+    def _stats(self):
+        st = BookStats.objects.get(book=self.book)
+        return st.rating_sum, st.rating_count, st.readers_count
+
+    def _assert_matches_aggregate(self):
+        real = compute_stats([self.book.id]).get(self.book.id, {"rating_sum": 0, "rating_count": 0, "readers_count": 0})
+        self.assertEqual(self._stats(), (real["rating_sum"], real["rating_count"], real["readers_count"]))
+
+    def test_ratings_update_incrementally(self):
+        r1 = Rating.objects.create(user=self.users[0], book=self.book, stars=3)
+        Rating.objects.create(user=self.users[1], book=self.book, stars=5)
+        self.assertEqual(self._stats(), (8, 2, 0))
+
+        r1.stars = 4
+        r1.save()
+        self.assertEqual(self._stats(), (9, 2, 0))
+        # mudar de ideias não é voto novo
+        Rating.objects.filter(pk=r1.pk).first().delete()
+        self.assertEqual(self._stats(), (5, 1, 0))
+        self.assertEqual(BookStats.objects.get(book=self.book).avg_rating, 5)
+        self._assert_matches_aggregate()
+
+    @override_settings(READING_PROGRESS_FLUSH_SECONDS=60)
+    def test_readers_counted_once_per_user(self):
+        # bulk upsert não dispara signals: o flush conta os leitores novos
+        for user in self.users[:2]:
+            progress.record_progress(user.id, self.book.id, 1, 10)
+        progress.flush_progress()
+        progress.record_progress(self.users[0].id, self.book.id, 2, 10)
+        progress.flush_progress()
+        self.assertEqual(self._stats()[2], 2)
+
+        ReadingProgress.objects.create(user=self.users[2], book=self.book, last_page=1, progress_percent=10)
+        ReadingProgress.objects.filter(user=self.users[0]).first().delete()
+        self.assertEqual(self._stats()[2], 2)
+        self._assert_matches_aggregate()
+
+
+@TEST_SETTINGS
+class LibraryMeTests(TestCase):
+    """/api/library/me/: estante já junta no servidor (livro + progresso + favorito + acesso)."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("leitor", password="x")
+        self.client.force_login(self.user)
+        self.books = [Book.objects.create(title=f"L{i}", total_pages=20) for i in range(4)]
+
+    def tearDown(self):
+        with progress._lock:
+            if progress._timer is not None:
+                progress._timer.cancel()
+            progress._timer = None
+            progress._buffer.clear()
+
+    def _shelf(self, params):
+        resp = self.client.get(f"/api/library/me/?{params}")
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_favorites_joined_and_paged(self):
+        for book in self.books[:3]:
+            Favorite.objects.create(user=self.user, book=book)
+        ReadingProgress.objects.create(user=self.user, book=self.books[0], last_page=5, progress_percent=25)
+        BookShareUnlock.objects.create(user=self.user, book=self.books[2])
+
+        first = self._shelf("shelf=favorites&limit=2")
+        # favoritos mais recentes primeiro
+        self.assertEqual([r["book"]["id"] for r in first["results"]], [self.books[2].id, self.books[1].id])
+        self.assertTrue(all(r["favorite"] for r in first["results"]))
+        self.assertEqual(first["results"][0]["access"]["status"], "unlocked")
+        self.assertEqual(first["results"][1]["access"]["status"], "preview")
+        self.assertIsNone(first["results"][1]["progress"])
+
+        rest = self._shelf(f"shelf=favorites&limit=2&cursor={first['next_cursor']}")
+        self.assertIsNone(rest["next_cursor"])
+        self.assertEqual(rest["results"][0]["book"]["id"], self.books[0].id)
+        self.assertEqual(rest["results"][0]["progress"]["last_page"], 5)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        for book in self.books:
+            Favorite.objects.create(user=self.user, book=book)
+        self._shelf("shelf=favorites&limit=1")   # snapshot de direitos em cache
+        with self.assertNumQueries(4):   # sessão + user + favoritos/livros + progresso
+            self._shelf("shelf=favorites&limit=1")
+        with self.assertNumQueries(4):
+            self._shelf("shelf=favorites&limit=4")
+
+    @override_settings(READING_PROGRESS_FLUSH_SECONDS=60)
+    def test_reading_shelf_includes_buffered_pages(self):
+        now = timezone.now()
+        for i, book in enumerate(self.books[:3]):
+            ReadingProgress.objects.create(user=self.user, book=book, last_page=2, progress_percent=10)
+            ReadingProgress.objects.filter(user=self.user, book=book).update(updated_at=now - timedelta(hours=i))
+        ReadingProgress.objects.filter(user=self.user, book=self.books[1]).update(progress_percent=100)
+        Favorite.objects.create(user=self.user, book=self.books[2])
+        # lido há segundos: ainda só no buffer
+        progress.record_progress(self.user.id, self.books[3].id, 4, 20)
+        progress.record_progress(self.user.id, self.books[0].id, 6, 20)
+
+        data = self._shelf("shelf=reading&limit=2")
+        rows = data["results"]
+        self.assertEqual([r["book"]["id"] for r in rows], [self.books[3].id, self.books[0].id])
+        self.assertEqual(rows[0]["progress"]["last_page"], 4)
+        self.assertEqual(rows[1]["progress"]["last_page"], 6)   # buffer ganha à linha gravada
+
+        rest = self._shelf(f"shelf=reading&limit=2&cursor={data['next_cursor']}")
+        # terminado (100%) fica de fora
+        self.assertEqual([r["book"]["id"] for r in rest["results"]], [self.books[2].id])
+        self.assertTrue(rest["results"][0]["favorite"])
+        self.assertIsNone(rest["next_cursor"])
+
+    def test_rejects_unknown_shelf(self):
+        self.assertEqual(self.client.get("/api/library/me/?shelf=nope").status_code, 400)
@@ -8,6 +8,9 @@ urlpatterns = [
     path("favorites/me/", api_views.favorites_me, name="favorites-me"),
     path("favorites/toggle/<int:book_id>/", api_views.favorites_toggle, name="favorites-toggle"),
 
+    # ✅ favoritos / em leitura já juntos com livro + progresso + acesso
+    path("library/me/", api_views.library_me, name="library-me"),
+
     path("ratings/<int:book_id>/", api_views.rate_book, name="rate-book"),
 
     # ✅ LEITURA (o read.html chama isto)
@@ -4,7 +4,8 @@ from django.views.decorators.http import require_GET, require_POST
 from django.contrib.auth.decorators import login_required
 
 from books.models import Book
-from .models import BookPageImage, ReadingProgress
+from .models import BookPageImage
+from .progress import record_progress
 
 
 def _cover_url(book: Book) -> str:
@@ -92,16 +93,8 @@ def read_page(request, book_id: int, page: int):
             "cover": cover_url,
         }, status=500)
 
-    # ✅ atualizar progresso (opcional)
-    percent = int(round((page / total_pages) * 100))
-    ReadingProgress.objects.update_or_create(
-        user=request.user,
-        book=book,
-        defaults={
-            "last_page": page,
-            "progress_percent": max(0, min(100, percent)),
-        }
-    )
+    # ✅ atualizar progresso (buffer; gravado em lote)
+    record_progress(request.user.id, book.id, page, total_pages)
 
     return JsonResponse({
         "book": title,
@@ -10,11 +10,44 @@ python manage.py check --deploy || python manage.py check
 echo "== Running migrate =="
 python manage.py migrate --noinput
 
+echo "== Search index =="
+python manage.py rebuild_search_index --missing
+
 echo "== Ensuring admin =="
 python manage.py ensure_admin
 
 echo "== Collecting static =="
 python manage.py collectstatic --noinput
 
-echo "== Starting gunicorn =="
-gunicorn config.wsgi:application --bind 0.0.0.0:${PORT:-8080} --workers 1 --threads 4 --timeout 300
\ No newline at end of file
+# Prévias no prefixo público (CDN): livros alterados já são tratados por signal;
+# isto apanha mudanças de config (ex: AWS_S3_CUSTOM_DOMAIN ativado) e falhas anteriores
+if [ -n "$AWS_STORAGE_BUCKET_NAME" ]; then
+  echo "== Public media =="
+  python manage.py sync_public_media || echo "sync_public_media falhou; continua o arranque"
+fi
+
+# Ranking "Mais lidos" e "Quem leu também leu": recalculados em background enquanto o container estiver vivo
+echo "== Popularity / recommendations jobs =="
+python manage.py compute_popularity --loop &
+python manage.py compute_similar_books --loop &
+
+# Snapshot do catálogo para o feed de alterações (arranque a frio dos clientes)
+python manage.py publish_catalog_snapshot --loop &
+
+# SERVER_MODE=asgi (default): uvicorn worker; as views do leitor (página, comentários,
+# anotações, progresso, /me) são async e não ocupam uma thread enquanto esperam pelo DB/cache.
+# Respostas em streaming de views síncronas passam por books.streaming.streaming_content
+# (senão o ASGI juntava-as em memória antes de enviar).
+# SERVER_MODE=wsgi: gthread, GUNICORN_THREADS pedidos em simultâneo por worker.
+# Comparar os dois com `manage.py bench_read` antes de mudar: com o DB local (latência
+# ~0) o wsgi rende mais por CPU; o asgi ganha quando os pedidos esperam pelo DB.
+# LOAD_SHED_CAPACITY acompanha DB_POOL_MAX_SIZE (asgi) ou GUNICORN_THREADS (wsgi) — ver settings.
+# --preload + CATALOG_INDEX_PRELOAD: índice do catálogo carregado uma vez antes do fork.
+export SERVER_MODE=${SERVER_MODE:-asgi}
+export CATALOG_INDEX_PRELOAD=${CATALOG_INDEX_PRELOAD:-1}
+echo "== Starting gunicorn ($SERVER_MODE) =="
+if [ "$SERVER_MODE" = "asgi" ]; then
+  gunicorn config.asgi:application -k uvicorn_worker.UvicornWorker --preload --bind 0.0.0.0:${PORT:-8080} --workers 1 --timeout 300
+else
+  gunicorn config.wsgi:application --preload --bind 0.0.0.0:${PORT:-8080} --workers 1 --threads ${GUNICORN_THREADS:-4} --timeout 300
+fi